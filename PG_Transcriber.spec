@@ -6,7 +6,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[('config.yaml', '.')],
-    hiddenimports=[],
+    hiddenimports=['cryptography.hazmat.primitives.kdf.pbkdf2', 'cryptography.x509'],  # loaded dynamically by oracledb thin mode
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -0,0 +1,122 @@
+"""
+Compares the dashboard's read paths: djongo ORM versus the direct pymongo layer
+(study_dashboard/repository.py), for the list page, the detail page and the stats query.
+
+Usage (from the project root, MongoDB reachable as configured in config.yaml):
+    python benchmarks/dashboard_read_paths.py --seed 20000 --iterations 200
+
+--seed inserts that many BENCH- studies (with one transcription each) before measuring
+and removes them afterwards; without it the existing data is used.
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'dashboard'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dashboard.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from study_dashboard import repository  # noqa: E402
+from study_dashboard.models import Study, Transcription  # noqa: E402
+from study_dashboard.mongo import get_database  # noqa: E402
+
+SEED_PREFIX = 'BENCH-'
+STATUSES = ('processing_complete_sr', 'processing_complete', 'error', 'transcribing', 'received')
+
+
+def seed(count):
+    db = get_database()
+    now = datetime.utcnow()
+    studies, transcriptions = [], []
+    for i in range(count):
+        key = f"{SEED_PREFIX}{i:07d}"
+        updated = now - timedelta(seconds=i * 7)
+        studies.append({
+            'study_key': key, 'status': STATUSES[i % len(STATUSES)], 'dicom_path': f"\\\\share\\{key}.dcm",
+            'received_timestamp': updated - timedelta(minutes=2), 'last_updated_timestamp': updated, 'attempts': 1,
+        })
+        transcriptions.append({
+            'study_key': key, 'attempt': 1, 'reading': 'Reading text. ' * 40, 'conclusion': 'Conclusion text.',
+            'model': 'bench', 'prompt_version': '1', 'transcription_timestamp': updated,
+        })
+    for start in range(0, count, 5000):
+        db.studies.insert_many(studies[start:start + 5000], ordered=False)
+        db.transcriptions.insert_many(transcriptions[start:start + 5000], ordered=False)
+    return f"{SEED_PREFIX}{count // 2:07d}"
+
+
+def unseed():
+    db = get_database()
+    pattern = {'study_key': {'$regex': f"^{SEED_PREFIX}"}}
+    db.studies.delete_many(pattern)
+    db.transcriptions.delete_many(pattern)
+
+
+def measure(label, fn, iterations):
+    fn() # Warm-up: connection setup and first-query plan selection
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<10} {iterations / elapsed:9.1f} req/s   {elapsed / iterations * 1000:8.2f} ms/req")
+    return iterations / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dashboard read paths: djongo ORM vs direct pymongo.")
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0, help="Insert this many BENCH- studies first (removed afterwards).")
+    parser.add_argument('--study-key', help="Study used for the detail page (default: a seeded or the newest study).")
+    args = parser.parse_args()
+
+    page_size = settings.DASHBOARD_PAGE_SIZE
+    study_key = args.study_key
+    if args.seed:
+        seeded_key = seed(args.seed)
+        study_key = study_key or seeded_key
+    try:
+        if not study_key:
+            newest = repository.list_studies(limit=1)
+            if not newest:
+                print("No studies found; use --seed N.")
+                return 1
+            study_key = newest[0]['study_key']
+
+        fields = ('_id', 'study_key', 'status', 'received_timestamp', 'last_updated_timestamp')
+        paths = {
+            'list': (
+                lambda: list(Study.objects.order_by('-last_updated_timestamp', '-_id').values(*fields)[:page_size + 1]),
+                lambda: repository.list_studies(limit=page_size + 1),
+            ),
+            'list+status': (
+                lambda: list(Study.objects.filter(status='error').order_by('-last_updated_timestamp', '-_id').values(*fields)[:page_size + 1]),
+                lambda: repository.list_studies(status='error', limit=page_size + 1),
+            ),
+            'detail': (
+                lambda: (Study.objects.get(study_key=study_key), list(Transcription.objects.filter(study_key=study_key))),
+                lambda: (repository.get_study(study_key), repository.get_transcriptions(study_key)),
+            ),
+            # djongo cannot express the $facet aggregation, so stats has no ORM baseline
+            'stats': (None, lambda: repository.study_stats()),
+        }
+        for name, (orm_path, direct_path) in paths.items():
+            print(f"{name}:")
+            direct_rate = measure('pymongo', direct_path, args.iterations)
+            if orm_path is not None:
+                orm_rate = measure('djongo', orm_path, args.iterations)
+                print(f"  speed-up   {direct_rate / orm_rate:9.2f}x")
+    finally:
+        if args.seed:
+            unseed()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
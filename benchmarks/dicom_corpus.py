@@ -0,0 +1,138 @@
+"""
+Generates synthetic dictation DICOMs (Basic Voice Audio Waveform) for repeatable benchmarks.
+
+The matrix covers durations, sample rates, channel counts and waveform sample
+interpretations (which fix the bit depth): SS/US are 16-bit signed/unsigned, SB/UB
+8-bit signed/unsigned, MB/AB 8-bit mu-law/A-law. The audio is noise under a
+syllable-rate envelope, so file sizes and compressibility are close to speech.
+
+Usage (from the project root):
+    python benchmarks/dicom_corpus.py --out corpus --durations 5 60 300 1200 --channels 1 2 --interpretations SS UB MB
+
+A manifest.json describing every file is written next to them.
+"""
+
+import argparse
+import itertools
+import json
+import math
+import os
+
+import numpy as np
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+WAVEFORM_SOP_CLASS = "1.2.840.10008.5.1.4.1.1.9.4.1" # Basic Voice Audio Waveform Storage
+
+# Waveform Sample Interpretation (003A,0220) -> bits allocated
+INTERPRETATION_BITS = {"SS": 16, "US": 16, "SB": 8, "UB": 8, "MB": 8, "AB": 8}
+
+DEFAULT_DURATIONS = (5, 30, 120, 600, 1200)
+_CHUNK_SECONDS = 60 # Audio is synthesised a minute at a time to bound the float working set
+
+
+def _speech_like(samples, sample_rate, channels, rng, offset):
+    """Float samples in [-1, 1], shape (samples, channels)."""
+    t = (np.arange(samples) + offset) / sample_rate
+    # ~4 syllables per second, with pauses roughly every few seconds
+    envelope = np.abs(np.sin(2 * math.pi * 2 * t)) * (0.6 + 0.4 * np.sin(2 * math.pi * 0.23 * t)).clip(0.15)
+    signal = rng.normal(0, 0.25, (samples, channels)) * envelope[:, None]
+    return signal.clip(-1, 1)
+
+
+def _mu_law(signal, mu=255):
+    return np.sign(signal) * np.log1p(mu * np.abs(signal)) / math.log1p(mu)
+
+
+def _a_law(signal, a=87.6):
+    magnitude = np.abs(signal)
+    small = magnitude < 1 / a
+    compressed = np.where(small, a * magnitude, 1 + np.log(np.maximum(a * magnitude, 1))) / (1 + math.log(a))
+    return np.sign(signal) * compressed
+
+
+def encode(signal, interpretation):
+    """Encodes float samples in [-1, 1] as the raw WaveformData bytes of the given interpretation."""
+    if interpretation == "SS":
+        return (signal * 32767).astype("<i2").tobytes()
+    if interpretation == "US":
+        return ((signal + 1) * 32767.5).astype("<u2").tobytes()
+    if interpretation == "SB":
+        return (signal * 127).astype(np.int8).tobytes()
+    if interpretation == "UB":
+        return ((signal + 1) * 127.5).astype(np.uint8).tobytes()
+    # Companded 8-bit: continuous mu-law / A-law curves, stored offset-binary (not bit-exact G.711)
+    companded = _mu_law(signal) if interpretation == "MB" else _a_law(signal)
+    return ((companded + 1) * 127.5).astype(np.uint8).tobytes()
+
+
+def write_dictation(path, seconds, sample_rate=8000, channels=1, interpretation="SS", seed=0):
+    """
+    Writes one dictation DICOM; channels are interleaved sample by sample, as in the standard.
+
+    Returns the size of the waveform data in bytes.
+    """
+    if interpretation not in INTERPRETATION_BITS:
+        raise ValueError(f"Unsupported waveform sample interpretation {interpretation!r}")
+    rng = np.random.default_rng(seed)
+    samples = int(seconds * sample_rate)
+    chunk = _CHUNK_SECONDS * sample_rate
+    data = bytearray()
+    for offset in range(0, samples, chunk):
+        data += encode(_speech_like(min(chunk, samples - offset), sample_rate, channels, rng, offset), interpretation)
+
+    ds = Dataset()
+    ds.PatientID = "BENCH"
+    ds.PatientName = "Bench^Dictation"
+    ds.StudyInstanceUID = generate_uid()
+    ds.SeriesInstanceUID = generate_uid()
+    ds.SOPClassUID = WAVEFORM_SOP_CLASS
+    ds.SOPInstanceUID = generate_uid()
+    ds.Modality = "AU"
+    waveform = Dataset()
+    waveform.WaveformOriginality = "ORIGINAL"
+    waveform.NumberOfWaveformChannels = channels
+    waveform.NumberOfWaveformSamples = samples
+    waveform.SamplingFrequency = sample_rate
+    waveform.WaveformBitsAllocated = INTERPRETATION_BITS[interpretation]
+    waveform.WaveformSampleInterpretation = interpretation
+    waveform.WaveformData = bytes(data)
+    ds.WaveformSequence = [waveform]
+    ds.file_meta = FileMetaDataset()
+    ds.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds.file_meta.MediaStorageSOPClassUID = ds.SOPClassUID
+    ds.file_meta.MediaStorageSOPInstanceUID = ds.SOPInstanceUID
+    ds.save_as(path, enforce_file_format=True) # Encoded as the file meta's TransferSyntaxUID
+    return len(data)
+
+
+def generate(out_dir, durations=DEFAULT_DURATIONS, sample_rates=(8000,), channels=(1, 2), interpretations=("SS", "UB", "MB"), seed=0):
+    """Writes every combination of the given parameters to out_dir and returns the manifest entries."""
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = []
+    combinations = itertools.product(durations, sample_rates, channels, interpretations)
+    for index, (seconds, sample_rate, channel_count, interpretation) in enumerate(combinations):
+        filename = f"dictation_{seconds:g}s_{sample_rate}hz_{channel_count}ch_{interpretation}.dcm"
+        audio_bytes = write_dictation(os.path.join(out_dir, filename), seconds, sample_rate, channel_count, interpretation, seed + index)
+        manifest.append({
+            "file": filename, "seconds": seconds, "sample_rate": sample_rate, "channels": channel_count,
+            "interpretation": interpretation, "bits": INTERPRETATION_BITS[interpretation], "audio_bytes": audio_bytes,
+        })
+    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2)
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic dictation DICOMs.")
+    parser.add_argument("--out", required=True, help="Output directory")
+    parser.add_argument("--durations", type=float, nargs="+", default=DEFAULT_DURATIONS, help="Seconds of audio")
+    parser.add_argument("--sample-rates", type=int, nargs="+", default=(8000,))
+    parser.add_argument("--channels", type=int, nargs="+", default=(1, 2))
+    parser.add_argument("--interpretations", nargs="+", default=("SS", "UB", "MB"), choices=sorted(INTERPRETATION_BITS))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    entries = generate(args.out, args.durations, args.sample_rates, args.channels, args.interpretations, args.seed)
+    total = sum(entry["audio_bytes"] for entry in entries)
+    print(f"Wrote {len(entries)} dictations ({total / 1e6:.1f} MB of audio) and manifest.json to {args.out}")
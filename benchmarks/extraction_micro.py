@@ -0,0 +1,200 @@
+"""
+Micro-benchmarks of the audio hot path on a synthetic corpus (benchmarks/dicom_corpus.py).
+
+Operations, each measured per file:
+    read         pydicom.dcmread of the dictation
+    decode       WaveformData -> numpy samples, as ExtractAudio does (plus de-interleaving channels)
+    wav_encode   scipy WAV writer into memory
+    mulaw_encode 16-bit -> 8-bit mu-law companding (the cheapest compressed upload format)
+    flac_encode  FLAC via soundfile, if it is installed
+    extract      ExtractAudio.extract_audio end to end (read, decode, WAV written to disk)
+    sr_build     EncapsulateTextAsEnhancedSR.build_sr_dataset
+
+Time is the median of --repeat runs; allocation is the tracemalloc peak of one further run.
+Both are also given per MB (10^6 bytes) of waveform data, so files of different lengths compare.
+
+Usage (from the project root):
+    python benchmarks/dicom_corpus.py --out corpus
+    python benchmarks/extraction_micro.py --corpus corpus --repeat 5 --json micro.json
+
+Without --corpus a small corpus (5 s to 20 min, 16-bit mono) is generated in a temporary directory.
+"""
+
+import argparse
+import io
+import json
+import logging
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pydicom
+from scipy.io import wavfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import dicom_corpus  # noqa: E402
+from modules.encapsulate_text_as_enhanced_sr import EncapsulateTextAsEnhancedSR  # noqa: E402
+from modules.extract_audio import ExtractAudio  # noqa: E402
+
+try:
+    import soundfile
+except ImportError:
+    soundfile = None
+
+TRANSCRIPTION = {
+    "Reading": "Normal study. The lungs are clear. No pleural effusion or pneumothorax. " * 12,
+    "Conclusion": "No acute findings.",
+}
+
+
+def decode(ds):
+    """The decode step of ExtractAudio.extract_audio, plus a (samples, channels) view for multi-channel data."""
+    waveform = ds.WaveformSequence[0]
+    dtype = np.uint8 if waveform.get("WaveformBitsAllocated", 16) == 8 else np.int16
+    audio = np.frombuffer(waveform.WaveformData, dtype=dtype)
+    channels = int(waveform.get("NumberOfWaveformChannels", 1))
+    return audio.reshape(-1, channels) if channels > 1 else audio
+
+
+def to_int16(audio):
+    if audio.dtype == np.int16:
+        return audio
+    return ((audio.astype(np.int16) - 128) << 8).astype(np.int16)
+
+
+def wav_encode(audio, sample_rate):
+    buffer = io.BytesIO()
+    wavfile.write(buffer, sample_rate, audio)
+    return buffer.getbuffer().nbytes
+
+
+def mulaw_encode(audio):
+    signal = to_int16(audio).astype(np.float32) / 32768
+    return ((dicom_corpus._mu_law(signal) + 1) * 127.5).astype(np.uint8)
+
+
+def flac_encode(audio, sample_rate):
+    buffer = io.BytesIO()
+    soundfile.write(buffer, to_int16(audio), sample_rate, format="FLAC")
+    return buffer.getbuffer().nbytes
+
+
+def extract(extractor, path):
+    wav_path = extractor.extract_audio(path)
+    os.remove(wav_path)
+
+
+def measure(function, repeat):
+    """Median seconds over `repeat` runs, then the peak traced allocation (bytes) of one more run."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return statistics.median(timings), peak
+
+
+def operations(path, entry, extractor, encapsulator):
+    """(name, callable) pairs for one corpus file; inputs are prepared outside the measured calls."""
+    ds = pydicom.dcmread(path)
+    audio = decode(ds)
+    sample_rate = int(entry["sample_rate"])
+    ops = [
+        ("read", lambda: pydicom.dcmread(path)),
+        ("decode", lambda: decode(ds)),
+        ("wav_encode", lambda: wav_encode(audio, sample_rate)),
+        ("mulaw_encode", lambda: mulaw_encode(audio)),
+    ]
+    if soundfile is not None:
+        ops.append(("flac_encode", lambda: flac_encode(audio, sample_rate)))
+    ops.append(("extract", lambda: extract(extractor, path)))
+    ops.append(("sr_build", lambda: encapsulator.build_sr_dataset(TRANSCRIPTION, path)))
+    return ops
+
+
+def load_manifest(corpus):
+    with open(os.path.join(corpus, "manifest.json"), encoding="utf-8") as file:
+        return json.load(file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of DICOM read, decode, encode and SR build.")
+    parser.add_argument("--corpus", default=None, help="Directory written by dicom_corpus.py (default: generate a small one)")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per operation and file")
+    parser.add_argument("--only", nargs="+", default=None, help="Run only these operations")
+    parser.add_argument("--json", default=None, help="Also write the results to this file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("detailed").setLevel(logging.WARNING)
+
+    corpus, generated = args.corpus, None
+    if corpus is None:
+        corpus = generated = tempfile.mkdtemp(prefix="dicom_corpus_")
+        print(f"Generating a corpus in {corpus} ...")
+        dicom_corpus.generate(corpus, durations=(5, 60, 300, 1200), channels=(1,), interpretations=("SS",))
+    manifest = load_manifest(corpus)
+    if soundfile is None:
+        print("soundfile is not installed; flac_encode is skipped.")
+
+    work = tempfile.mkdtemp(prefix="extraction_micro_")
+    extractor = ExtractAudio({})
+    encapsulator = EncapsulateTextAsEnhancedSR({"SR_OUTPUT_FOLDER": work})
+    rows = []
+    try:
+        for entry in manifest:
+            # extract_audio writes the WAV next to the DICOM; work on a copy so the corpus stays untouched
+            path = shutil.copy(os.path.join(corpus, entry["file"]), work)
+            audio_mb = entry["audio_bytes"] / 1e6
+            for name, function in operations(path, entry, extractor, encapsulator):
+                if args.only and name not in args.only:
+                    continue
+                seconds, peak = measure(function, args.repeat)
+                rows.append({
+                    "file": entry["file"], "operation": name, "audio_mb": audio_mb,
+                    "ms": seconds * 1000, "ms_per_mb": seconds * 1000 / audio_mb,
+                    "alloc_mb": peak / 1e6, "alloc_mb_per_mb": peak / 1e6 / audio_mb,
+                })
+            os.remove(path)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+        if generated:
+            shutil.rmtree(generated, ignore_errors=True)
+
+    print(f"\n{'operation':<13} {'file':<42} {'audio MB':>9} {'ms':>9} {'ms/MB':>8} {'alloc MB':>9} {'alloc/MB':>9}")
+    for row in rows:
+        print(f"{row['operation']:<13} {row['file']:<42} {row['audio_mb']:>9.2f} {row['ms']:>9.2f} {row['ms_per_mb']:>8.2f} "
+              f"{row['alloc_mb']:>9.2f} {row['alloc_mb_per_mb']:>9.2f}")
+
+    summary = {}
+    for name in dict.fromkeys(row["operation"] for row in rows):
+        selected = [row for row in rows if row["operation"] == name]
+        summary[name] = {
+            "median_ms_per_mb": statistics.median(row["ms_per_mb"] for row in selected),
+            "median_alloc_mb_per_mb": statistics.median(row["alloc_mb_per_mb"] for row in selected),
+        }
+    print(f"\n{'operation':<13} {'median ms/MB':>13} {'median alloc/MB':>16}")
+    for name, values in summary.items():
+        print(f"{name:<13} {values['median_ms_per_mb']:>13.2f} {values['median_alloc_mb_per_mb']:>16.2f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump({"repeat": args.repeat, "summary": summary, "rows": rows}, file, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
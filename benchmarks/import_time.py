@@ -0,0 +1,124 @@
+"""
+Import-time benchmark of the service and dashboard entry points, based on `python -X importtime`.
+
+Each target runs in a fresh interpreter (so nothing is cached in sys.modules) --repeat
+times. The report gives the median wall time of the process, the median total import
+time, and the top-level packages that cost the most (cumulative microseconds, from the
+-X importtime trace of the fastest run).
+
+Targets:
+    help        python main.py --help (must not import the pipeline or touch MongoDB)
+    config      import modules.config and load config.yaml
+    worker      import modules.processing_worker (the whole pipeline)
+    dashboard   django.setup() with the dashboard settings, then import the views
+
+Usage (from the project root):
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --targets help --budget-ms 300
+
+With --budget-ms the exit status is 1 when the median wall time of `help` exceeds the budget,
+so CI can keep startup fast. A target whose dependencies are missing is reported as failed.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DASHBOARD = os.path.join(ROOT, "dashboard")
+
+TARGETS = {
+    "help": ["main.py", "--help"],
+    "config": ["-c", "from modules.config import get_config; get_config()"],
+    "worker": ["-c", "import modules.processing_worker"],
+    "dashboard": ["-c", (
+        "import os, sys; sys.path.insert(0, %r); "
+        "os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dashboard.settings'); "
+        "import django; django.setup(); import study_dashboard.views" % DASHBOARD
+    )],
+}
+
+
+def parse_importtime(stderr):
+    """
+    Parses `-X importtime` lines ("import time: self | cumulative | name") into
+    (total_us, {top-level package: cumulative_us}).
+    """
+    total, packages = 0, {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            self_us, cumulative_us = int(self_us), int(cumulative_us)
+        except ValueError:
+            continue
+        total += self_us
+        # Nesting is shown by indentation; only top-level imports carry the full cost of their subtree
+        name = name[1:]
+        if not name.startswith(" "):
+            root = name.split(".")[0]
+            packages[root] = packages.get(root, 0) + cumulative_us
+    return total, packages
+
+
+def run_target(arguments, repeat):
+    """Runs one target `repeat` times; returns wall/import medians and the packages of the fastest run."""
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        completed = subprocess.run([sys.executable, "-X", "importtime", *arguments],
+                                   cwd=ROOT, capture_output=True, text=True)
+        wall = time.perf_counter() - start
+        if completed.returncode != 0:
+            # The exception line of the traceback, e.g. a missing optional dependency
+            error_lines = [line for line in completed.stderr.splitlines()
+                           if not line.startswith("import time:") and ("Error" in line or "Exception" in line)]
+            return {"error": error_lines[-1].strip() if error_lines else f"exit status {completed.returncode}"}
+        total_us, packages = parse_importtime(completed.stderr)
+        runs.append((wall, total_us, packages))
+    fastest = min(runs, key=lambda run: run[0])
+    return {
+        "wall_ms": statistics.median(run[0] for run in runs) * 1000,
+        "import_ms": statistics.median(run[1] for run in runs) / 1000,
+        "packages": {name: us / 1000 for name, us in sorted(fastest[2].items(), key=lambda item: -item[1])},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the import time of the service and dashboard entry points.")
+    parser.add_argument("--targets", nargs="+", default=list(TARGETS), choices=list(TARGETS))
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per target")
+    parser.add_argument("--top", type=int, default=10, help="Top-level packages to list per target")
+    parser.add_argument("--budget-ms", type=float, default=None, help="Fail if `help` takes longer than this (median wall time)")
+    parser.add_argument("--json", default=None, help="Also write the results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.targets:
+        results[name] = result = run_target(TARGETS[name], args.repeat)
+        if "error" in result:
+            print(f"\n{name}: FAILED ({result['error']})")
+            continue
+        print(f"\n{name}: {result['wall_ms']:.0f} ms wall, {result['import_ms']:.0f} ms importing")
+        for package, ms in list(result["packages"].items())[:args.top]:
+            print(f"    {package:<30} {ms:>9.1f} ms")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump({"repeat": args.repeat, "results": results}, file, indent=2)
+        print(f"\nResults written to {args.json}")
+
+    if args.budget_ms is not None and "help" in results:
+        help_result = results["help"]
+        if "error" in help_result or help_result["wall_ms"] > args.budget_ms:
+            print(f"\n`main.py --help` is over the {args.budget_ms:.0f} ms budget.")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
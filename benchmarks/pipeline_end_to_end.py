@@ -0,0 +1,279 @@
+"""
+End-to-end throughput benchmark of the transcription pipeline against local stand-ins
+(benchmarks/standins.py): a SQLite RIS in place of Oracle, mongomock (or a local mongod)
+in place of the production MongoDB, a local directory in place of the SMB share and a
+simulated Gemini with configurable latency and errors.
+
+The real service code runs unchanged: DatabaseMonitor polls the RIS and calls
+processing_worker.process_study, which queries the RIS, reads and decodes the DICOM,
+"transcribes", saves to MongoDB and writes the SR.
+
+Usage (from the project root):
+    python benchmarks/pipeline_end_to_end.py --studies 200 --gemini-latency-ms 3000 --error-rate 0.05
+    python benchmarks/pipeline_end_to_end.py --mode worker --studies 50 --gemini-latency-ms 0   # pipeline overhead only
+    python benchmarks/pipeline_end_to_end.py --pipeline staged --studies 200 --distinct-files 200
+
+In staged mode several studies are in flight at once; give each its own file (--distinct-files
+at least --studies), since studies sharing a DICOM would share its WAV as well.
+
+Reports studies per minute, per-stage percentiles (per study, from StageTimer) and peak RSS.
+--json writes the same figures to a file, for comparing runs.
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import dicom_corpus  # noqa: E402
+import standins  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="End-to-end pipeline benchmark against local stand-ins.")
+    parser.add_argument("--studies", type=int, default=100, help="Backlog size (studies at STUDYSTAT 3010)")
+    parser.add_argument("--mode", choices=("monitor", "worker"), default="monitor",
+                        help="monitor: run DatabaseMonitor against the RIS; worker: call process_study for each study directly")
+    parser.add_argument("--pipeline", choices=("sequential", "staged"), default="sequential",
+                        help="PIPELINE_MODE of the monitor (staged: per-stage worker pools, see modules/pipeline.py)")
+    parser.add_argument("--prefetch", choices=("ON", "OFF"), default="OFF",
+                        help="PREFETCH of the service: copy the DICOMs to a local cache ahead of processing (modules/prefetch.py)")
+    parser.add_argument("--distinct-files", type=int, default=20, help="Dictation files generated; studies share them round-robin")
+    parser.add_argument("--audio-seconds", type=float, nargs=2, default=(20, 120), metavar=("MIN", "MAX"),
+                        help="Range of dictation lengths")
+    parser.add_argument("--sample-rate", type=int, default=8000)
+    parser.add_argument("--gemini-latency-ms", type=float, default=4000, help="Median generation latency")
+    parser.add_argument("--gemini-latency-sigma", type=float, default=0.4, help="Log-normal spread of the generation latency")
+    parser.add_argument("--upload-mb-per-s", type=float, default=20.0, help="Simulated upload throughput (0 = instant)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of generations that fail")
+    parser.add_argument("--error-mix", default="unavailable=2,timeout=1,bad_json=1,missing_fields=1",
+                        help=f"Relative weights of the failure kinds ({', '.join(standins.ERROR_KINDS)})")
+    parser.add_argument("--oracle-latency-ms", type=float, default=0, help="Added to every RIS connect and query")
+    parser.add_argument("--mongo-uri", default=None, help="Use this MongoDB (a scratch database is created and dropped) instead of mongomock")
+    parser.add_argument("--sr", choices=("ON", "OFF"), default="ON", help="Build and spool the Enhanced SR")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workdir", default=None, help="Keep the RIS, share and SR output here instead of a temporary directory")
+    parser.add_argument("--json", default=None, help="Also write the results to this file")
+    parser.add_argument("--log-level", default="WARNING")
+    return parser.parse_args()
+
+
+def parse_mix(text):
+    mix = {}
+    for part in filter(None, text.split(",")):
+        kind, _, weight = part.partition("=")
+        if kind not in standins.ERROR_KINDS:
+            raise SystemExit(f"Unknown error kind '{kind}' (expected one of {', '.join(standins.ERROR_KINDS)})")
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None if the platform offers no way to read it."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                        ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize / (1024 * 1024)
+    except (AttributeError, OSError):
+        pass
+    return None
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+class StageCollector:
+    """StageTimer observer: wall time per (study, stage), summed over repeated calls."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.per_study = {}
+
+    def __call__(self, study_key, stage, seconds, nbytes):
+        if seconds is None:
+            return
+        with self._lock:
+            stages = self.per_study.setdefault(study_key, {})
+            stages[stage] = stages.get(stage, 0.0) + seconds
+
+    def summary(self):
+        by_stage = {}
+        for stages in self.per_study.values():
+            for stage, seconds in stages.items():
+                by_stage.setdefault(stage, []).append(seconds)
+        result = {}
+        for stage, values in by_stage.items():
+            values.sort()
+            result[stage] = {
+                "studies": len(values),
+                "p50_ms": percentile(values, 0.50) * 1000,
+                "p90_ms": percentile(values, 0.90) * 1000,
+                "p99_ms": percentile(values, 0.99) * 1000,
+                "max_ms": values[-1] * 1000,
+            }
+        return result
+
+
+def build_corpus(workdir, args):
+    share_dir = os.path.join(workdir, "share")
+    rng = random.Random(args.seed)
+    files = []
+    for index in range(max(1, args.distinct_files)):
+        pathname = f"{2024 + index % 2}\\{index % 12 + 1:02d}"
+        filename = f"dictation_{index:04d}.dcm"
+        directory = os.path.join(share_dir, *pathname.split("\\"))
+        os.makedirs(directory, exist_ok=True)
+        seconds = rng.uniform(*args.audio_seconds)
+        dicom_corpus.write_dictation(os.path.join(directory, filename), seconds, args.sample_rate, seed=index)
+        files.append((pathname, filename))
+    dictations = [(100000 + i, *files[i % len(files)]) for i in range(args.studies)]
+    ris_path = os.path.join(workdir, "ris.sqlite")
+    standins.create_ris(ris_path, dictations)
+    return share_dir, ris_path, [study_key for study_key, _, _ in dictations]
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=getattr(logging, args.log_level.upper(), logging.WARNING),
+                        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    workdir = args.workdir or tempfile.mkdtemp(prefix="pipeline_bench_")
+    os.makedirs(workdir, exist_ok=True)
+
+    print(f"Generating {args.distinct_files} dictations and a RIS with {args.studies} studies in {workdir} ...")
+    share_dir, ris_path, study_keys = build_corpus(workdir, args)
+
+    gemini = standins.FakeGemini(
+        latency_ms=args.gemini_latency_ms, sigma=args.gemini_latency_sigma, upload_mb_per_s=args.upload_mb_per_s,
+        error_rate=args.error_rate, error_mix=parse_mix(args.error_mix), seed=args.seed,
+    )
+    standins.install(ris_path, gemini, oracle_latency_ms=args.oracle_latency_ms)
+
+    # Only now may the service modules be imported
+    from modules import database_operations as db_ops
+    from modules import prefetch, processing_worker, stage_timer
+    from modules.database_monitor import DatabaseMonitor
+    logging.getLogger("detailed").setLevel(getattr(logging, args.log_level.upper(), logging.WARNING))
+
+    config = {
+        "ORACLE_HOST": standins.BENCH_HOST, "ORACLE_PORT": 1521, "ORACLE_SERVICE_NAME": "bench",
+        "ORACLE_USERNAME": "bench", "ORACLE_PASSWORD": "bench",
+        "GEMINI_API_KEY": "bench", "MODEL_NAME": "bench-model",
+        "SR_OUTPUT_FOLDER": os.path.join(workdir, "sr"), "ENCAPSULATE_TEXT_AS_ENHANCED_SR": args.sr,
+        "STORE_TRANSCRIBED_REPORT": "OFF", "PRINT_GEMINI_OUTPUT": "OFF",
+        "MONGODB_URI": args.mongo_uri or "mongodb://localhost:27017/",
+        "MONGODB_DATABASE": f"pipeline_bench_{os.getpid()}",
+        "POLL_INTERVAL_SECONDS": 1,
+        "PIPELINE_MODE": args.pipeline,
+        "PREFETCH": args.prefetch, "PREFETCH_CACHE_DIR": os.path.join(workdir, "dicom_cache"),
+    }
+    os.makedirs(config["SR_OUTPUT_FOLDER"], exist_ok=True)
+
+    if args.mongo_uri:
+        if db_ops.connect_db(config) is None:
+            raise SystemExit(f"Cannot connect to MongoDB at {args.mongo_uri}")
+    else:
+        import mongomock
+        db_ops.client = mongomock.MongoClient()
+        db_ops.db = db_ops.client[config["MONGODB_DATABASE"]]
+    db_ops.ensure_indexes(config)
+
+    # query.py builds \\benchhost\bench_share\... paths; point them at the local share
+    # (the pipeline's resolve stage and the prefetcher both look studies up through prefetch.process_study_key)
+    resolve = prefetch.process_study_key
+    prefetch.process_study_key = lambda cfg, key, **kwargs: standins.resolve_to_local(resolve(cfg, key, **kwargs), share_dir)
+
+    collector = StageCollector()
+    stage_timer.add_observer(collector)
+
+    print(f"Processing {len(study_keys)} studies ({args.mode} mode, {args.pipeline} pipeline) ...")
+    started = time.perf_counter()
+    if args.mode == "worker":
+        for study_key in study_keys:
+            processing_worker.process_study(config, study_key)
+    else:
+        monitor = DatabaseMonitor(config)
+        thread = threading.Thread(target=monitor.start_monitoring, name="monitor", daemon=True)
+        thread.start()
+        terminal = lambda: sum(1 for doc in db_ops.db.studies.find({"study_key": {"$in": study_keys}}, {"status": 1})
+                               if db_ops.is_terminal_status(doc.get("status") or ""))
+        while thread.is_alive() and terminal() < len(study_keys):
+            time.sleep(0.2)
+    elapsed = time.perf_counter() - started
+    if args.mode == "monitor":
+        monitor.stop_monitoring()
+        thread.join()
+    db_ops.close_status_writer()
+
+    statuses = {}
+    for doc in db_ops.db.studies.find({"study_key": {"$in": study_keys}}, {"status": 1}):
+        statuses[doc.get("status")] = statuses.get(doc.get("status"), 0) + 1
+    results = {
+        "studies": len(study_keys),
+        "mode": args.mode,
+        "pipeline": args.pipeline,
+        "prefetch": args.prefetch,
+        "elapsed_s": elapsed,
+        "studies_per_min": len(study_keys) / elapsed * 60 if elapsed else None,
+        "statuses": statuses,
+        "gemini_calls": gemini.calls,
+        "gemini_injected_errors": gemini.errors,
+        "stages": collector.summary(),
+        "peak_rss_mb": peak_rss_mb(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("json", "workdir", "log_level")},
+    }
+
+    print()
+    print(f"{results['studies']} studies in {elapsed:.1f} s: {results['studies_per_min']:.1f} studies/min")
+    print("Outcomes:    " + ", ".join(f"{status}={count}" for status, count in sorted(statuses.items(), key=lambda item: str(item[0]))))
+    print(f"Peak RSS:    {results['peak_rss_mb']:.1f} MB" if results["peak_rss_mb"] is not None else "Peak RSS:    n/a")
+    print()
+    print(f"{'stage':<14} {'studies':>8} {'p50 ms':>10} {'p90 ms':>10} {'p99 ms':>10} {'max ms':>10}")
+    for stage, row in sorted(results["stages"].items(), key=lambda item: -item[1]["p50_ms"]):
+        print(f"{stage:<14} {row['studies']:>8} {row['p50_ms']:>10.1f} {row['p90_ms']:>10.1f} {row['p99_ms']:>10.1f} {row['max_ms']:>10.1f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2, default=str)
+        print(f"\nResults written to {args.json}")
+
+    if args.mongo_uri:
+        db_ops.client.drop_database(config["MONGODB_DATABASE"])
+    if not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+Local stand-ins for the service's external systems, for benchmarks that run the real pipeline code.
+
+*   Oracle: a module that replaces `oracledb`, backed by a SQLite file with the
+    TSTUDY / TREPORT / TDICTATION / TSTORAGE columns the service queries.
+*   Gemini: a module that replaces `google.generativeai`, with configurable latency
+    and error distributions.
+*   SMB share: a local directory, filled by dicom_corpus.write_dictation. `resolve_to_local`
+    rewrites the UNC paths built by query.py into it. The paths are local, so the default
+    storage backend reads them on any OS.
+
+install() must run before anything under `modules` is imported.
+"""
+
+import json
+import math
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+import types
+
+BENCH_HOST = "benchhost"
+BENCH_SHARE = "bench_share"
+
+
+# --- Oracle ---
+
+ORACLE_SCHEMA = """
+CREATE TABLE TSTUDY (STUDY_KEY INTEGER PRIMARY KEY, STUDYSTAT INTEGER);
+CREATE INDEX TSTUDY_STAT ON TSTUDY (STUDYSTAT);
+CREATE TABLE TREPORT (REPORT_KEY INTEGER PRIMARY KEY, STUDY_KEY INTEGER, REPORT_STAT INTEGER);
+CREATE INDEX TREPORT_STUDY ON TREPORT (STUDY_KEY);
+CREATE TABLE TDICTATION (REPORT_KEY INTEGER, PATHNAME TEXT, FILENAME TEXT, LSTORAGE_KEY INTEGER);
+CREATE INDEX TDICTATION_REPORT ON TDICTATION (REPORT_KEY);
+CREATE TABLE TSTORAGE (STORAGE_KEY INTEGER PRIMARY KEY, SHARE_FOLDER TEXT);
+"""
+
+
+def create_ris(db_path, dictations):
+    """
+    Creates the SQLite RIS with one study per (study_key, pathname, filename) in `dictations`,
+    all waiting for transcription (STUDYSTAT / REPORT_STAT 3010).
+    """
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    connection = sqlite3.connect(db_path)
+    connection.executescript(ORACLE_SCHEMA)
+    connection.execute("INSERT INTO TSTORAGE VALUES (1, ?)", (BENCH_SHARE,))
+    for study_key, pathname, filename in dictations:
+        report_key = study_key + 1_000_000
+        connection.execute("INSERT INTO TSTUDY VALUES (?, 3010)", (study_key,))
+        connection.execute("INSERT INTO TREPORT VALUES (?, ?, 3010)", (report_key, study_key))
+        connection.execute("INSERT INTO TDICTATION VALUES (?, ?, ?, 1)", (report_key, pathname, filename))
+    connection.commit()
+    connection.close()
+
+
+class _OracleCursor:
+    def __init__(self, connection, latency):
+        self._cursor = connection.cursor()
+        self._latency = latency
+
+    def execute(self, statement, parameters=None, **keyword_parameters):
+        # oracledb binds :name placeholders from keywords; sqlite3 accepts the same syntax from a dict
+        if self._latency:
+            time.sleep(self._latency)
+        self._cursor.execute(statement, parameters if parameters is not None else keyword_parameters)
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def close(self):
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _OracleConnection:
+    def __init__(self, db_path, latency):
+        if latency:
+            time.sleep(latency)
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        self._latency = latency
+
+    def cursor(self):
+        return _OracleCursor(self._connection, self._latency)
+
+    def commit(self):
+        self._connection.commit()
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def oracle_module(db_path, latency_ms=0):
+    """An `oracledb` replacement whose connect() opens the SQLite RIS; each round trip costs latency_ms."""
+    module = types.ModuleType("oracledb")
+    latency = latency_ms / 1000
+    module.connect = lambda user=None, password=None, dsn=None, **kwargs: _OracleConnection(db_path, latency)
+    module.makedsn = lambda host, port, service_name=None, **kwargs: f"{host}:{port}/{service_name}"
+    module.init_oracle_client = lambda **kwargs: None
+    module.Error = sqlite3.Error
+    module.DatabaseError = sqlite3.DatabaseError
+    return module
+
+
+def resolve_to_local(final_path, share_dir):
+    """Maps a \\\\benchhost\\bench_share\\... path built by query.py onto the local share directory."""
+    if not final_path:
+        return final_path
+    root = f"\\\\{BENCH_HOST}\\{BENCH_SHARE}"
+    position = final_path.find(root)
+    if position < 0:
+        return final_path
+    relative = final_path[position + len(root):].replace("\\", "/").strip("/")
+    return os.path.join(share_dir, *relative.split("/"))
+
+
+# --- Gemini ---
+
+ERROR_KINDS = ("unavailable", "timeout", "bad_json", "missing_fields")
+
+
+def _api_exceptions():
+    try:
+        import google.api_core.exceptions as google_exceptions
+        return google_exceptions
+    except ImportError:
+        pass
+    # Same class names and hierarchy as google.api_core.exceptions
+    module = types.ModuleType("google.api_core.exceptions")
+    module.GoogleAPIError = type("GoogleAPIError", (Exception,), {})
+    for name in ("ServiceUnavailable", "DeadlineExceeded", "Unauthenticated", "ResourceExhausted", "InternalServerError"):
+        setattr(module, name, type(name, (module.GoogleAPIError,), {}))
+    api_core = sys.modules.setdefault("google.api_core", types.ModuleType("google.api_core"))
+    api_core.exceptions = module
+    sys.modules["google.api_core.exceptions"] = module
+    return module
+
+
+class FakeGemini:
+    """
+    Stands in for the Gemini file and generation APIs.
+
+    Generation latency is log-normal around `latency_ms` (median) with spread `sigma`;
+    uploads take size / `upload_mb_per_s`. A fraction `error_rate` of generations fails,
+    with the kind drawn from `error_mix` ({kind: weight}, kinds in ERROR_KINDS).
+    """
+
+    def __init__(self, latency_ms=4000, sigma=0.4, upload_mb_per_s=20.0, error_rate=0.0, error_mix=None, seed=0):
+        self.latency_ms = latency_ms
+        self.sigma = sigma
+        self.upload_mb_per_s = upload_mb_per_s
+        self.error_rate = error_rate
+        self.error_mix = error_mix or {kind: 1 for kind in ERROR_KINDS}
+        self.exceptions = _api_exceptions()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = {"upload": 0, "generate": 0}
+        self.errors = {kind: 0 for kind in ERROR_KINDS}
+
+    def _draw(self):
+        with self._lock:
+            latency = self.latency_ms / 1000 * math.exp(self._rng.gauss(0, self.sigma)) if self.latency_ms else 0
+            failure = None
+            if self._rng.random() < self.error_rate:
+                kinds, weights = zip(*self.error_mix.items())
+                failure = self._rng.choices(kinds, weights)[0]
+                self.errors[failure] += 1
+            self.calls["generate"] += 1
+        return latency, failure
+
+    def upload_file(self, path):
+        with self._lock:
+            self.calls["upload"] += 1
+        if self.upload_mb_per_s:
+            time.sleep(os.path.getsize(path) / (self.upload_mb_per_s * 1024 * 1024))
+        return types.SimpleNamespace(name=f"files/{os.path.basename(path)}", uri=path)
+
+    def generate_content(self, contents, generation_config=None):
+        latency, failure = self._draw()
+        time.sleep(latency)
+        if failure == "unavailable":
+            raise self.exceptions.ServiceUnavailable("503 The model is overloaded (benchmark)")
+        if failure == "timeout":
+            raise self.exceptions.DeadlineExceeded("504 Deadline exceeded (benchmark)")
+        if failure == "bad_json":
+            return types.SimpleNamespace(text="Here is the report: {\"Reading\": ")
+        if failure == "missing_fields":
+            return types.SimpleNamespace(text=json.dumps({"Reading": "Truncated."}))
+        reading = "Normal study. The lungs are clear. No pleural effusion or pneumothorax. " * 12
+        return types.SimpleNamespace(text=json.dumps({"Reading": reading.strip(), "Conclusion": "No acute findings."}))
+
+    def module(self):
+        """A `google.generativeai` replacement routed to this instance."""
+        gemini = self
+        module = types.ModuleType("google.generativeai")
+        module.configure = lambda **kwargs: None
+        module.upload_file = self.upload_file
+        module.GenerationConfig = lambda **kwargs: dict(kwargs)
+
+        class GenerativeModel:
+            def __init__(self, model_name, **kwargs):
+                self.model_name = model_name
+
+            def generate_content(self, contents, generation_config=None, **kwargs):
+                return gemini.generate_content(contents, generation_config)
+
+        module.GenerativeModel = GenerativeModel
+        return module
+
+
+# --- Installation ---
+
+def install(ris_path, gemini, oracle_latency_ms=0):
+    """Registers the stand-in modules. Must run before `modules.*` is imported."""
+    if any(name == "modules" or name.startswith("modules.") for name in sys.modules):
+        raise RuntimeError("standins.install() must run before the service modules are imported")
+    sys.modules["oracledb"] = oracle_module(ris_path, oracle_latency_ms)
+    google = sys.modules.get("google")
+    if google is None:
+        try:
+            import google
+        except ImportError:
+            google = sys.modules["google"] = types.ModuleType("google")
+            google.__path__ = []
+    genai = gemini.module()
+    sys.modules["google.generativeai"] = genai
+    google.generativeai = genai
@@ -3,6 +3,11 @@ ASGI config for dashboard project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Requests for the live study feed (DASHBOARD_LIVE_EVENTS_PATH) are answered by a
+server-sent events stream outside Django's request cycle; everything else goes to
+Django as usual. Live mode therefore needs an ASGI server, e.g.
+``uvicorn dashboard.asgi:application``.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/X.Y/howto/deployment/asgi/
 """
@@ -13,4 +18,15 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dashboard.settings')
 
-application = get_asgi_application() 
\ No newline at end of file
+django_application = get_asgi_application()
+
+# Imported after Django is set up: the live module reads settings
+from django.conf import settings  # noqa: E402
+from study_dashboard.live import stream_events  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] == settings.DASHBOARD_LIVE_EVENTS_PATH:
+        await stream_events(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
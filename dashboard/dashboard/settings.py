@@ -98,12 +98,15 @@ WSGI_APPLICATION = 'dashboard.wsgi.application'
 # https://docs.djangoproject.com/en/X.Y/ref/settings/#databases
 # Using Djongo to connect to MongoDB
 
+MONGODB_URI = config.get("MONGODB_URI", "mongodb://localhost:27017/")
+MONGODB_DATABASE = config.get("MONGODB_DATABASE", "audio_transcriber_db")
+
 DATABASES = {
     'default': {
         'ENGINE': 'djongo',
-        'NAME': config.get("MONGODB_DATABASE", "audio_transcriber_db"),
+        'NAME': MONGODB_DATABASE,
         'CLIENT': {
-            'host': config.get("MONGODB_URI", "mongodb://localhost:27017/"),
+            'host': MONGODB_URI,
             # Add other MongoClient options here if needed (e.g., auth)
             # 'username': config.get("MONGODB_USER"),
             # 'password': config.get("MONGODB_PASSWORD"),
@@ -161,6 +164,42 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Add any custom settings from config.yaml that the Django app might need
 # Example: GEMINI_API_KEY = config.get('GEMINI_API_KEY')
 
+# Cache for rendered dashboard pages and statistics. Local memory by default; set
+# DASHBOARD_CACHE_DIR to share one file-based cache between worker processes.
+# Nothing external is required either way.
+DASHBOARD_CACHE_DIR = config.get('DASHBOARD_CACHE_DIR')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': DASHBOARD_CACHE_DIR,
+    } if DASHBOARD_CACHE_DIR else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'study_dashboard',
+    }
+}
+# Upper bound on how long a rendered list/detail page is reused; any pipeline write invalidates it sooner
+DASHBOARD_PAGE_CACHE_SECONDS = int(config.get('DASHBOARD_PAGE_CACHE_SECONDS', 300))
+
+# Rows per page on the study list (keyset-paginated)
+DASHBOARD_PAGE_SIZE = int(config.get('DASHBOARD_PAGE_SIZE', 50))
+
+# Statistics page: how long aggregated results are reused, and the throughput window
+DASHBOARD_STATS_CACHE_SECONDS = int(config.get('DASHBOARD_STATS_CACHE_SECONDS', 15))
+DASHBOARD_STATS_WINDOW_HOURS = int(config.get('DASHBOARD_STATS_WINDOW_HOURS', 24))
+
+# Report search: results per page, and how deep into the ranking paging may go
+DASHBOARD_SEARCH_PAGE_SIZE = int(config.get('DASHBOARD_SEARCH_PAGE_SIZE', 20))
+DASHBOARD_SEARCH_MAX_RESULTS = int(config.get('DASHBOARD_SEARCH_MAX_RESULTS', 1000))
+
+# Exports: documents per MongoDB round trip and per chunk written to the response
+DASHBOARD_EXPORT_BATCH_SIZE = int(config.get('DASHBOARD_EXPORT_BATCH_SIZE', 500))
+
+# Live study list (server-sent events, served by dashboard/asgi.py): stream path, poll
+# interval when MongoDB has no change streams, and keep-alive interval for idle connections
+DASHBOARD_LIVE_EVENTS_PATH = config.get('DASHBOARD_LIVE_EVENTS_PATH', '/live/events/')
+DASHBOARD_LIVE_POLL_SECONDS = float(config.get('DASHBOARD_LIVE_POLL_SECONDS', 2))
+DASHBOARD_LIVE_KEEPALIVE_SECONDS = float(config.get('DASHBOARD_LIVE_KEEPALIVE_SECONDS', 15))
+
 # Logging configuration (optional, can customize further)
 LOGGING = {
     'version': 1,
@@ -1,4 +1,6 @@
+from django.conf import settings
 from django.contrib import admin
+from . import repository
 from .models import Study, Transcription
 
 @admin.register(Study)
@@ -11,9 +13,19 @@ class StudyAdmin(admin.ModelAdmin):
 
 @admin.register(Transcription)
 class TranscriptionAdmin(admin.ModelAdmin):
-    list_display = ('study_key', 'transcription_timestamp', 'sr_path')
-    search_fields = ('study_key', 'report_text', 'sr_path')
+    list_display = ('study_key', 'attempt', 'transcription_timestamp', 'model', 'sr_path')
+    # Study key matches exactly; report words go through the text index (get_search_results), never a regex scan
+    search_fields = ('study_key',)
     readonly_fields = ('_id', 'transcription_timestamp')
     list_per_page = 50
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        matching_ids = repository.search_transcription_ids(search_term, limit=settings.DASHBOARD_SEARCH_MAX_RESULTS)
+        by_study_key = queryset.filter(study_key=search_term).values_list('_id', flat=True)
+        return queryset.filter(_id__in=matching_ids + list(by_study_key)), False
+
     # If you had a ForeignKey link:
     # raw_id_fields = ('study',) 
\ No newline at end of file
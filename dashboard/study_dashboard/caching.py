@@ -0,0 +1,47 @@
+"""
+Page caching keyed on the service's data version counter.
+
+The pipeline bumps the counter (meta.data_version) whenever it writes something the
+dashboard shows, so a cached page is served only until the next write: invalidation
+is a single primary-key read per request, with no cache deletes to coordinate.
+"""
+
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from . import repository
+
+
+def versioned_key(prefix, version, *parts):
+    digest = hashlib.md5('|'.join(parts).encode()).hexdigest()
+    return f"study_dashboard:{prefix}:{version}:{digest}"
+
+
+def cache_by_data_version(view):
+    """
+    Caches a view's successful responses per URL and data version, for at most
+    DASHBOARD_PAGE_CACHE_SECONDS. Served uncached if the version cannot be read.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return view(request, *args, **kwargs)
+        version = repository.data_version()
+        if version is None:
+            return view(request, *args, **kwargs)
+
+        key = versioned_key('page', version, request.get_full_path())
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200 and not response.streaming:
+            cache.set(key, (response.content, response['Content-Type']), settings.DASHBOARD_PAGE_CACHE_SECONDS)
+        return response
+    return wrapper
@@ -0,0 +1,61 @@
+"""
+Streaming CSV/NDJSON serialisation of export cursors.
+
+Rows are written as they come off the MongoDB cursor and handed to the response
+one batch at a time, so memory use depends on the batch size, not on the export size.
+"""
+
+import csv
+import json
+from datetime import datetime
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class _Line:
+    """File-like target for csv.writer that hands back the formatted line instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def _plain(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def _csv_lines(cursor, fields):
+    writer = csv.writer(_Line())
+    yield writer.writerow(fields)
+    for document in cursor:
+        yield writer.writerow(['' if document.get(field) is None else _plain(document.get(field)) for field in fields])
+
+
+def _ndjson_lines(cursor, fields):
+    for document in cursor:
+        yield json.dumps({field: _plain(document.get(field)) for field in fields}, ensure_ascii=False) + '\n'
+
+
+def stream_rows(cursor, fields, fmt, batch_size=500):
+    """
+    Yields the export as text chunks of batch_size rows, closing the cursor when done
+    or when the client goes away (the response closes this generator).
+    """
+    lines = _csv_lines(cursor, fields) if fmt == 'csv' else _ndjson_lines(cursor, fields)
+    try:
+        chunk = []
+        for line in lines:
+            chunk.append(line)
+            if len(chunk) >= batch_size:
+                yield ''.join(chunk)
+                chunk = []
+        if chunk:
+            yield ''.join(chunk)
+    finally:
+        cursor.close()
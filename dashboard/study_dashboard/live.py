@@ -0,0 +1,228 @@
+"""
+Live study list updates pushed to browsers over server-sent events (SSE).
+
+One StudyWatcher per process follows the 'studies' collection, using a change stream
+when the server supports it (replica set / sharded cluster) and otherwise polling on
+last_updated_timestamp, and fans each change out to every connected browser. The
+number of open pages therefore does not change the load on MongoDB.
+
+The SSE endpoint is a plain ASGI coroutine (stream_events), routed in dashboard/asgi.py,
+so a long-lived connection holds no worker thread.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure, PyMongoError
+
+from .mongo import get_database
+from .repository import HINT_LIST, NEWEST_FIRST, STUDY_LIST_PROJECTION
+
+logger = logging.getLogger(__name__)
+
+# Events buffered per browser; a client that falls this far behind loses the oldest ones
+SUBSCRIBER_QUEUE_SIZE = 256
+_WATCHED_OPERATIONS = ['insert', 'update', 'replace']
+
+_watcher = None
+_watcher_lock = threading.Lock()
+
+
+def _timestamp(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S') if value else ''
+
+
+def study_event(document):
+    """The row data sent to browsers, formatted like the study list template."""
+    return {
+        'study_key': document.get('study_key'),
+        'status': document.get('status') or 'unknown',
+        'received_timestamp': _timestamp(document.get('received_timestamp')),
+        'last_updated_timestamp': _timestamp(document.get('last_updated_timestamp')),
+    }
+
+
+class StudyWatcher:
+    """
+    Follows study changes in a background thread and delivers them to asyncio subscriber queues.
+
+    The thread starts with the first subscriber and keeps running for the life of the process;
+    while nobody is subscribed it skips polling, and change stream events are simply dropped.
+    MongoDB errors are retried every poll_seconds. If the thread stops on anything else, the
+    next subscriber starts a new one.
+    """
+
+    def __init__(self, database, poll_seconds=2):
+        self.database = database
+        self.poll_seconds = poll_seconds
+        self._subscribers = {} # queue -> event loop that owns it
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self):
+        """Registers the calling event loop and returns the asyncio.Queue it will receive events on."""
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers[queue] = asyncio.get_running_loop()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="StudyWatcher", daemon=True)
+                self._thread.start()
+        return queue
+
+    def unsubscribe(self, queue):
+        with self._lock:
+            self._subscribers.pop(queue, None)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, event):
+        with self._lock:
+            targets = list(self._subscribers.items())
+        for queue, loop in targets:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, event)
+            except RuntimeError:
+                # The subscriber's loop has closed; it will unsubscribe on its way out
+                pass
+
+    @staticmethod
+    def _offer(queue, event):
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+    def _run(self):
+        try:
+            while True:
+                try:
+                    self._follow_change_stream()
+                except OperationFailure as e:
+                    # Standalone servers reject $changeStream; polling needs no server support
+                    logger.info(f"Change streams unavailable ({e}); polling studies every {self.poll_seconds} s instead.")
+                    self._poll()
+                    return
+                except PyMongoError as e:
+                    logger.warning(f"Study change stream interrupted: {e}. Reopening in {self.poll_seconds} s.")
+                    time.sleep(self.poll_seconds)
+        except Exception as e:
+            logger.error(f"Study watcher stopped: {e}. The next subscriber restarts it.", exc_info=True)
+        finally:
+            # Lets subscribe() start a new thread instead of leaving every browser without updates
+            with self._lock:
+                self._thread = None
+
+    def _follow_change_stream(self):
+        pipeline = [{'$match': {'operationType': {'$in': _WATCHED_OPERATIONS}}}]
+        with self.database.studies.watch(pipeline, full_document='updateLookup', max_await_time_ms=1000) as stream:
+            logger.info("Following study changes through a change stream.")
+            while stream.alive:
+                change = stream.try_next()
+                if change is None:
+                    continue
+                document = change.get('fullDocument')
+                if document and self.subscriber_count():
+                    self.publish(study_event(document))
+
+    def _newest(self, studies):
+        """The newest last_updated_timestamp and the ids at it; retried until MongoDB answers."""
+        while True:
+            try:
+                newest = next(iter(studies.find({}, {'last_updated_timestamp': 1}).sort(NEWEST_FIRST).limit(1)), None)
+                if not newest:
+                    return None, set()
+                high_water = newest['last_updated_timestamp']
+                return high_water, {doc['_id'] for doc in studies.find({'last_updated_timestamp': high_water}, {'_id': 1})}
+            except PyMongoError as e:
+                logger.warning(f"Study poll failed: {e}. Retrying in {self.poll_seconds} s.")
+                time.sleep(self.poll_seconds)
+
+    def _poll(self):
+        studies = self.database.studies
+        # High-water mark plus the ids already sent at exactly that timestamp, so equal timestamps are neither lost nor repeated
+        high_water, sent_at_high_water = self._newest(studies)
+        while True:
+            time.sleep(self.poll_seconds)
+            if not self.subscriber_count():
+                continue
+            query = {'last_updated_timestamp': {'$gte': high_water}} if high_water else {}
+            try:
+                changed = list(studies.find(query, STUDY_LIST_PROJECTION).sort('last_updated_timestamp', ASCENDING).hint(HINT_LIST))
+            except PyMongoError as e:
+                logger.warning(f"Study poll failed: {e}")
+                continue
+            for document in changed:
+                timestamp = document.get('last_updated_timestamp')
+                if timestamp == high_water and document['_id'] in sent_at_high_water:
+                    continue
+                if timestamp != high_water:
+                    high_water = timestamp
+                    sent_at_high_water = set()
+                sent_at_high_water.add(document['_id'])
+                self.publish(study_event(document))
+
+
+def get_watcher():
+    """Returns the process-wide StudyWatcher, creating it on first use."""
+    global _watcher
+    with _watcher_lock:
+        if _watcher is None:
+            _watcher = StudyWatcher(get_database(), poll_seconds=settings.DASHBOARD_LIVE_POLL_SECONDS)
+        return _watcher
+
+
+async def _wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def stream_events(scope, receive, send):
+    """ASGI handler: streams study events to one browser until it disconnects."""
+    if scope['method'] != 'GET':
+        await send({'type': 'http.response.start', 'status': 405, 'headers': [(b'allow', b'GET')]})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+
+    watcher = get_watcher()
+    queue = watcher.subscribe()
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'), # Tell nginx not to buffer the stream
+            ],
+        })
+        # Browsers reconnect after 'retry' ms if the connection drops
+        await send({'type': 'http.response.body', 'body': b'retry: 5000\n\n', 'more_body': True})
+        while True:
+            next_event = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait(
+                {next_event, disconnected},
+                timeout=settings.DASHBOARD_LIVE_KEEPALIVE_SECONDS,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if disconnected in done:
+                next_event.cancel()
+                break
+            if next_event in done:
+                chunk = f"event: study\ndata: {json.dumps(next_event.result())}\n\n".encode()
+            else:
+                # Comment line keeps proxies from closing an idle connection
+                next_event.cancel()
+                chunk = b': keepalive\n\n'
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    finally:
+        watcher.unsubscribe(queue)
+        disconnected.cancel()
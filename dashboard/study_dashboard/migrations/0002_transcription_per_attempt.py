@@ -0,0 +1,106 @@
+# Collapses the duplicate transcription documents written before transcriptions were
+# updated in place, and moves report_text into the structured reading/conclusion fields.
+
+import json
+from itertools import groupby
+
+from django.db import migrations, models
+from pymongo import DeleteOne, UpdateOne
+
+
+def _sections(report_text):
+    """Returns (reading, conclusion) from a legacy report_text value (dict, list of dicts or JSON string)."""
+    if isinstance(report_text, str):
+        try:
+            report_text = json.loads(report_text)
+        except ValueError:
+            return report_text, ''
+    if isinstance(report_text, list):
+        report_text = report_text[0] if report_text else {}
+    if isinstance(report_text, dict):
+        return report_text.get('Reading', ''), report_text.get('Conclusion', '')
+    return str(report_text or ''), ''
+
+
+def collapse_duplicate_transcriptions(apps, schema_editor):
+    # djongo's connection is the pymongo Database; work on the raw collections.
+    database = schema_editor.connection.connection
+    transcriptions = database['transcriptions']
+    legacy = transcriptions.find(
+        {'attempt': {'$exists': False}},
+        sort=[('study_key', 1), ('transcription_timestamp', 1)],
+    )
+    operations = []
+    for study_key, documents in groupby(legacy, key=lambda document: document.get('study_key')):
+        latest = transcriptions.find_one({'study_key': study_key, 'attempt': {'$exists': True}}, sort=[('attempt', -1)])
+        attempt = latest['attempt'] if latest else 0
+        kept = None # (document _id, report_text) of the attempt being collapsed into
+        for document in documents:
+            report_text = document.get('report_text')
+            if kept is not None and report_text == kept[1]:
+                # The pipeline's second insert repeated the report to add sr_path; fold it into the first.
+                if document.get('sr_path'):
+                    operations.append(UpdateOne({'_id': kept[0]}, {'$set': {'sr_path': document['sr_path']}}))
+                operations.append(DeleteOne({'_id': document['_id']}))
+                continue
+            attempt += 1
+            reading, conclusion = _sections(report_text)
+            operations.append(UpdateOne(
+                {'_id': document['_id']},
+                {'$set': {'attempt': attempt, 'reading': reading, 'conclusion': conclusion},
+                 '$unset': {'report_text': ''}},
+            ))
+            kept = (document['_id'], report_text)
+        # The service numbers new attempts from studies.attempts; start after the migrated ones.
+        database['studies'].update_one({'study_key': study_key}, {'$max': {'attempts': attempt}})
+        if len(operations) >= 500:
+            transcriptions.bulk_write(operations, ordered=True)
+            operations = []
+    if operations:
+        transcriptions.bulk_write(operations, ordered=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('study_dashboard', '0001_initial'),
+    ]
+
+    operations = [
+        # Runs before the field changes: dropping report_text unsets it on every document.
+        migrations.RunPython(collapse_duplicate_transcriptions, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='transcription',
+            name='report_text',
+        ),
+        migrations.AddField(
+            model_name='transcription',
+            name='attempt',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='transcription',
+            name='reading',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='transcription',
+            name='conclusion',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='transcription',
+            name='model',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='transcription',
+            name='prompt_version',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+        migrations.AddField(
+            model_name='transcription',
+            name='audio_hash',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
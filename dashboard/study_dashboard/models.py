@@ -27,9 +27,12 @@ class Transcription(models.Model):
     # Let's stick to referencing by study_key for simplicity here.
     # study = models.ForeignKey(Study, on_delete=models.CASCADE, related_name='transcriptions')
     study_key = models.CharField(max_length=255) # Reference study by its key
-    report_text = models.TextField() # Storing report as potentially large text
-    # For list storage, consider models.JSONField() if using newer Django/Djongo supporting it,
-    # or store as a single text block with delimiters.
+    attempt = models.IntegerField(blank=True, null=True) # Processing attempt; one document per study and attempt
+    reading = models.TextField(blank=True, default='') # 'Reading' section of the report
+    conclusion = models.TextField(blank=True, default='') # 'Conclusion' section of the report
+    model = models.CharField(max_length=100, blank=True, null=True) # Transcription model name
+    prompt_version = models.CharField(max_length=50, blank=True, null=True)
+    audio_hash = models.CharField(max_length=64, blank=True, null=True) # SHA-256 of the extracted audio
     sr_path = models.CharField(max_length=1024, blank=True, null=True)
     transcription_timestamp = models.DateTimeField()
 
@@ -42,4 +45,4 @@ class Transcription(models.Model):
         ordering = ['transcription_timestamp']
 
     def __str__(self):
-        return f"Transcription for {self.study_key} at {self.transcription_timestamp}" 
\ No newline at end of file
+        return f"Transcription for {self.study_key} (attempt {self.attempt}) at {self.transcription_timestamp}" 
\ No newline at end of file
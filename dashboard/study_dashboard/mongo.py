@@ -0,0 +1,18 @@
+"""Direct pymongo access for queries the djongo ORM cannot express (aggregations)."""
+
+import threading
+
+from django.conf import settings
+from pymongo import MongoClient
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_database():
+    """Returns the pymongo Database the service writes to; the client is created once per process."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = MongoClient(settings.MONGODB_URI)
+    return _client[settings.MONGODB_DATABASE]
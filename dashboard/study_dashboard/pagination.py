@@ -0,0 +1,25 @@
+"""Keyset (seek) pagination helpers for the study list."""
+
+import base64
+from datetime import datetime
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+
+def encode_cursor(last_updated_timestamp, object_id):
+    """Opaque token for the position after the given row."""
+    raw = f"{last_updated_timestamp.isoformat()}|{object_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Returns (last_updated_timestamp, ObjectId) from a token, or None if it is missing or malformed."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        timestamp, object_id = raw.split('|', 1)
+        return datetime.fromisoformat(timestamp), ObjectId(object_id)
+    except (ValueError, InvalidId, UnicodeDecodeError):
+        return None
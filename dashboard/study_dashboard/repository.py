@@ -0,0 +1,203 @@
+"""
+Read layer for the dashboard's hot paths (list, detail, stats).
+
+Queries the 'studies' and 'transcriptions' collections directly with pymongo,
+bypassing djongo's SQL translation. Every query carries an explicit projection
+and an index hint so its shape is fixed; the admin site stays on the ORM.
+"""
+
+import logging
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure, PyMongoError
+
+from .mongo import get_database
+from .stats import compute_study_stats
+
+logger = logging.getLogger(__name__)
+
+STUDY_LIST_PROJECTION = {'study_key': 1, 'status': 1, 'received_timestamp': 1, 'last_updated_timestamp': 1}
+STUDY_DETAIL_PROJECTION = {'attempts': 0} # Everything the detail page may show
+TRANSCRIPTION_PROJECTION = {
+    'attempt': 1, 'reading': 1, 'conclusion': 1, 'model': 1, 'prompt_version': 1,
+    'sr_path': 1, 'transcription_timestamp': 1,
+}
+# Columns written by the dashboard export, in output order
+STUDY_EXPORT_FIELDS = ('study_key', 'status', 'attempts', 'dicom_path', 'received_timestamp', 'last_updated_timestamp', 'error_message')
+TRANSCRIPTION_EXPORT_FIELDS = (
+    'study_key', 'attempt', 'transcription_timestamp', 'model', 'prompt_version', 'audio_hash', 'sr_path', 'reading', 'conclusion',
+)
+SEARCH_PROJECTION = dict(TRANSCRIPTION_PROJECTION, study_key=1, score={'$meta': 'textScore'})
+BEST_MATCH_FIRST = [('score', {'$meta': 'textScore'})]
+NEWEST_FIRST = [('last_updated_timestamp', DESCENDING), ('_id', DESCENDING)]
+
+# Counter document maintained by modules/database_operations.bump_data_version
+DATA_VERSION_ID = 'data_version'
+
+# Index names created by modules/database_operations.ensure_indexes
+HINT_LIST = 'last_updated_id'
+HINT_LIST_BY_STATUS = 'status_last_updated_id'
+HINT_STUDY_KEY = 'study_key_unique'
+HINT_TRANSCRIPTIONS = 'study_key_transcription_timestamp'
+HINT_TRANSCRIPTIONS_BY_TIME = 'transcription_timestamp_id'
+
+
+def _run(cursor_factory, hint):
+    """Materialises a hinted query; if the index is missing (service never started), retries without the hint."""
+    try:
+        return list(cursor_factory().hint(hint))
+    except OperationFailure as e:
+        logger.warning(f"Index hint {hint} unusable ({e}); running the query unhinted.")
+        return list(cursor_factory())
+
+
+def list_studies(status=None, updated_from=None, updated_before=None, after=None, limit=50):
+    """
+    One page of studies, newest first.
+
+    Args:
+        status (str, optional): Only studies with this status.
+        updated_from / updated_before (datetime, optional): last_updated_timestamp range [from, before).
+        after (tuple, optional): (last_updated_timestamp, ObjectId) of the previous page's last row.
+        limit (int): Maximum rows to return.
+    """
+    query = {}
+    if status:
+        query['status'] = status
+    timestamp_range = {}
+    if updated_from:
+        timestamp_range['$gte'] = updated_from
+    if updated_before:
+        timestamp_range['$lt'] = updated_before
+    if after:
+        last_updated, object_id = after
+        # The $lte bound keeps the index scan tight; the $or breaks ties on _id within it
+        timestamp_range['$lte'] = last_updated
+        query['$or'] = [{'last_updated_timestamp': {'$lt': last_updated}}, {'_id': {'$lt': object_id}}]
+    if timestamp_range:
+        query['last_updated_timestamp'] = timestamp_range
+
+    studies = get_database().studies
+    return _run(
+        lambda: studies.find(query, STUDY_LIST_PROJECTION).sort(NEWEST_FIRST).limit(limit),
+        HINT_LIST_BY_STATUS if status else HINT_LIST,
+    )
+
+
+def get_study(study_key):
+    """The study document, or None."""
+    studies = get_database().studies
+    rows = _run(lambda: studies.find({'study_key': study_key}, STUDY_DETAIL_PROJECTION).limit(1), HINT_STUDY_KEY)
+    return rows[0] if rows else None
+
+
+def get_transcriptions(study_key):
+    """The study's transcriptions (one per attempt), newest first."""
+    transcriptions = get_database().transcriptions
+    return _run(
+        lambda: transcriptions.find({'study_key': study_key}, TRANSCRIPTION_PROJECTION).sort('transcription_timestamp', DESCENDING),
+        HINT_TRANSCRIPTIONS,
+    )
+
+
+def search_transcriptions(text, skip=0, limit=20):
+    """
+    Transcriptions matching a text search over reading/conclusion, best match first.
+
+    Uses the 'reading_conclusion_text' index ($text needs no hint). Returns None if the
+    search cannot run, e.g. because the text index has not been created yet.
+    """
+    transcriptions = get_database().transcriptions
+    try:
+        cursor = transcriptions.find({'$text': {'$search': text}}, SEARCH_PROJECTION).sort(BEST_MATCH_FIRST)
+        return list(cursor.skip(skip).limit(limit))
+    except OperationFailure as e:
+        logger.error(f"Transcription search for {text!r} failed: {e}")
+        return None
+
+
+def search_transcription_ids(text, limit=1000):
+    """_ids of the best-matching transcriptions, for narrowing an ORM queryset (admin search)."""
+    transcriptions = get_database().transcriptions
+    try:
+        cursor = transcriptions.find({'$text': {'$search': text}}, {'score': {'$meta': 'textScore'}}).sort(BEST_MATCH_FIRST)
+        return [row['_id'] for row in cursor.limit(limit)]
+    except OperationFailure as e:
+        logger.error(f"Transcription search for {text!r} failed: {e}")
+        return []
+
+
+def _time_range(start, before):
+    bounds = {}
+    if start:
+        bounds['$gte'] = start
+    if before:
+        bounds['$lt'] = before
+    return bounds
+
+
+def export_studies(status=None, updated_from=None, updated_before=None, batch_size=500):
+    """
+    Cursor over studies for export, oldest update first, fetched batch_size documents per round trip.
+
+    The cursor does not time out while a slow client drains it; the caller must close it.
+    """
+    query = {}
+    if status:
+        query['status'] = status
+    timestamp_range = _time_range(updated_from, updated_before)
+    if timestamp_range:
+        query['last_updated_timestamp'] = timestamp_range
+    projection = dict.fromkeys(STUDY_EXPORT_FIELDS, 1)
+    return (
+        get_database().studies.find(query, projection, no_cursor_timeout=True)
+        .sort([('last_updated_timestamp', ASCENDING), ('_id', ASCENDING)])
+        .hint(HINT_LIST_BY_STATUS if status else HINT_LIST)
+        .batch_size(batch_size)
+    )
+
+
+def export_transcriptions(status=None, transcribed_from=None, transcribed_before=None, batch_size=500):
+    """
+    Cursor over transcriptions for export, oldest first; the caller must close it.
+
+    status filters on the study's current status, looked up per transcription
+    through the studies.study_key index.
+    """
+    query = {}
+    timestamp_range = _time_range(transcribed_from, transcribed_before)
+    if timestamp_range:
+        query['transcription_timestamp'] = timestamp_range
+    projection = dict.fromkeys(TRANSCRIPTION_EXPORT_FIELDS, 1)
+    order = [('transcription_timestamp', ASCENDING), ('_id', ASCENDING)]
+    transcriptions = get_database().transcriptions
+    if not status:
+        return (
+            transcriptions.find(query, projection, no_cursor_timeout=True)
+            .sort(order).hint(HINT_TRANSCRIPTIONS_BY_TIME).batch_size(batch_size)
+        )
+    pipeline = [
+        {'$match': query},
+        {'$sort': dict(order)},
+        {'$lookup': {'from': 'studies', 'localField': 'study_key', 'foreignField': 'study_key', 'as': 'study'}},
+        {'$match': {'study.status': status}},
+        {'$project': projection},
+    ]
+    return transcriptions.aggregate(pipeline, batchSize=batch_size, allowDiskUse=True, hint=HINT_TRANSCRIPTIONS_BY_TIME)
+
+
+def data_version():
+    """
+    The service's data version counter (bumped by modules/database_operations on every
+    status or transcription write), or None if it cannot be read.
+    """
+    try:
+        document = get_database().meta.find_one({'_id': DATA_VERSION_ID}, {'version': 1})
+    except PyMongoError as e:
+        logger.warning(f"Cannot read data version ({e}); serving pages uncached.")
+        return None
+    return document['version'] if document else 0
+
+
+def study_stats(window_hours=24):
+    return compute_study_stats(get_database(), window_hours=window_hours)
@@ -0,0 +1,59 @@
+"""Query parsing and snippet highlighting for report search (the ranking itself is MongoDB's text index)."""
+
+import re
+
+from django.utils.html import escape
+
+_TOKEN = re.compile(r'"([^"]+)"|(\S+)')
+
+
+def search_terms(query):
+    """
+    Words and "quoted phrases" to highlight, in the order given.
+
+    Negated terms (-word) are left out: documents containing them were excluded by the search.
+    """
+    terms = []
+    for phrase, word in _TOKEN.findall(query or ''):
+        term = (phrase or word).strip()
+        if not term or term.startswith('-'):
+            continue
+        terms.append(term)
+    return terms
+
+
+def _pattern(terms):
+    # The text index stems words ("fractures" matches "fracture"), so highlight any word starting with a term
+    alternatives = sorted((re.escape(term) for term in terms), key=len, reverse=True)
+    return re.compile(r'\b(?:' + '|'.join(alternatives) + r')\w*', re.IGNORECASE)
+
+
+def highlight(text, terms, width=200):
+    """
+    HTML snippet of text around the first match, matches wrapped in <mark>.
+
+    Returns an empty string if no term occurs in text. Everything except the
+    <mark> tags is escaped, so the result is safe to render as-is.
+    """
+    if not text or not terms:
+        return ''
+    pattern = _pattern(terms)
+    first = pattern.search(text)
+    if first is None:
+        return ''
+
+    start = max(0, first.start() - width // 3)
+    end = min(len(text), start + width)
+    if start > 0:
+        # Do not cut a word in half at the left edge
+        space = text.find(' ', start)
+        start = space + 1 if 0 <= space < first.start() else start
+    window = text[start:end]
+
+    parts, position = [], 0
+    for match in pattern.finditer(window):
+        parts.append(escape(window[position:match.start()]))
+        parts.append(f'<mark>{escape(match.group(0))}</mark>')
+        position = match.end()
+    parts.append(escape(window[position:]))
+    return ('…' if start > 0 else '') + ''.join(parts) + ('…' if end < len(text) else '')
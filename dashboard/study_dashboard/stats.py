@@ -0,0 +1,68 @@
+"""Throughput, error-rate and backlog statistics computed in one aggregation over 'studies'."""
+
+from datetime import datetime, timedelta
+
+COMPLETE_STATUSES = ['completed', 'processing_complete', 'processing_complete_sr', 'processing_complete_stored']
+TERMINAL_STATUSES = COMPLETE_STATUSES + ['error']
+
+
+def compute_study_stats(database, window_hours=24, now=None):
+    """
+    Runs a single $facet aggregation and shapes the result for the stats page and JSON API.
+
+    Timestamps are stored as naive UTC by the service, so the window is computed in naive UTC too.
+    """
+    now = now or datetime.utcnow()
+    window_start = (now - timedelta(hours=window_hours)).replace(minute=0, second=0, microsecond=0)
+
+    pipeline = [
+        {'$facet': {
+            'by_status': [
+                {'$group': {'_id': '$status', 'count': {'$sum': 1}}},
+            ],
+            'hourly': [
+                {'$match': {'status': {'$in': TERMINAL_STATUSES}, 'last_updated_timestamp': {'$gte': window_start}}},
+                {'$group': {
+                    '_id': {'$dateToString': {'format': '%Y-%m-%dT%H:00', 'date': '$last_updated_timestamp'}},
+                    'completed': {'$sum': {'$cond': [{'$in': ['$status', COMPLETE_STATUSES]}, 1, 0]}},
+                    'errors': {'$sum': {'$cond': [{'$eq': ['$status', 'error']}, 1, 0]}},
+                }},
+            ],
+            'backlog': [
+                {'$match': {'status': {'$nin': TERMINAL_STATUSES}}},
+                {'$group': {'_id': None, 'count': {'$sum': 1}, 'oldest_received': {'$min': '$received_timestamp'}}},
+            ],
+        }},
+    ]
+    result = next(database.studies.aggregate(pipeline), {})
+
+    by_status = {row['_id'] or 'unknown': row['count'] for row in result.get('by_status', [])}
+    hourly_rows = {row['_id']: row for row in result.get('hourly', [])}
+    hourly = []
+    hour = window_start
+    while hour <= now:
+        label = hour.strftime('%Y-%m-%dT%H:00')
+        row = hourly_rows.get(label, {})
+        hourly.append({'hour': label, 'completed': row.get('completed', 0), 'errors': row.get('errors', 0)})
+        hour += timedelta(hours=1)
+
+    completed = sum(row['completed'] for row in hourly)
+    errors = sum(row['errors'] for row in hourly)
+    backlog = (result.get('backlog') or [{}])[0]
+    oldest_received = backlog.get('oldest_received')
+
+    return {
+        'generated_at': now.isoformat(),
+        'window_hours': window_hours,
+        'total': sum(by_status.values()),
+        'by_status': dict(sorted(by_status.items())),
+        'completed_in_window': completed,
+        'errors_in_window': errors,
+        'error_rate': round(errors / (completed + errors), 4) if completed + errors else 0.0,
+        'hourly': hourly,
+        'backlog': {
+            'count': backlog.get('count', 0),
+            'oldest_received': oldest_received.isoformat() if oldest_received else None,
+            'oldest_age_seconds': round((now - oldest_received).total_seconds()) if oldest_received else None,
+        },
+    }
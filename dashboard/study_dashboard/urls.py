@@ -8,4 +8,10 @@ urlpatterns = [
     path('', views.study_list, name='study_list'),
     # Example: /study/some-study-key/
     path('study/<str:study_key>/', views.study_detail, name='study_detail'),
+    path('stats/', views.study_stats, name='study_stats'),
+    path('api/stats/', views.study_stats_json, name='study_stats_json'),
+    path('search/', views.study_search, name='study_search'),
+    path('api/search/', views.study_search_json, name='study_search_json'),
+    # Example: /export/studies.csv?status=error&from=2025-01-01
+    path('export/<str:dataset>.<str:fmt>', views.export_rows, name='export_rows'),
 ] 
\ No newline at end of file
@@ -1,32 +1,212 @@
-from django.shortcuts import render, get_object_or_404
-from django.http import Http404
-from .models import Study, Transcription
+from datetime import datetime, time, timedelta, timezone
 
+from django.conf import settings
+from django.core.cache import cache
+from django.shortcuts import render
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_date
+from . import export, repository
+from .caching import cache_by_data_version, versioned_key
+from .pagination import decode_cursor, encode_cursor
+from .search import highlight, search_terms
+
+# Offered in the status filter; the pipeline may write others, which still filter fine via the URL
+KNOWN_STATUSES = (
+    'received', 'processing_query', 'processing_audio', 'transcribing',
+    'processing_complete', 'processing_complete_sr', 'error',
+)
+
+def _parse_day(value):
+    try:
+        return parse_date(value or '')
+    except ValueError:
+        return None
+
+def _list_filters(request):
+    """Reads the status and date-range (on last_updated_timestamp) filters from the query string."""
+    return {
+        'status': request.GET.get('status') or '',
+        'date_from': _parse_day(request.GET.get('from')),
+        'date_to': _parse_day(request.GET.get('to')),
+    }
+
+def _day_start(day):
+    # Timestamps are stored in UTC by the service
+    return datetime.combine(day, time.min, tzinfo=timezone.utc)
+
+@cache_by_data_version
 def study_list(request):
-    """Displays a list of all studies."""
-    studies = Study.objects.all() # Retrieve all studies, ordered by Meta.ordering
+    """
+    Displays one page of studies, newest first.
+
+    Pages are keyset-paginated on (last_updated_timestamp, _id): the 'after' token
+    marks the last row of the previous page, so every page is an index range scan
+    regardless of how many studies exist.
+    """
+    page_size = settings.DASHBOARD_PAGE_SIZE
+    filters = _list_filters(request)
+    after = decode_cursor(request.GET.get('after'))
+
+    # Fetch one extra row to know whether there is a next page
+    rows = repository.list_studies(
+        status=filters['status'],
+        updated_from=_day_start(filters['date_from']) if filters['date_from'] else None,
+        updated_before=_day_start(filters['date_to'] + timedelta(days=1)) if filters['date_to'] else None,
+        after=after,
+        limit=page_size + 1,
+    )
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(rows[-1]['last_updated_timestamp'], rows[-1]['_id'])
+
+    query = request.GET.copy()
+    query.pop('after', None)
     context = {
-        'studies': studies,
+        'studies': rows,
+        'filters': filters,
+        'statuses': KNOWN_STATUSES,
+        'filter_query': query.urlencode(),
+        'next_cursor': next_cursor,
+        'is_first_page': after is None,
+        'page_size': page_size,
+        'live_events_path': settings.DASHBOARD_LIVE_EVENTS_PATH,
         'page_title': 'Transcription Status' # Add a title for the page
     }
     return render(request, 'study_dashboard/study_list.html', context)
 
+@cache_by_data_version
 def study_detail(request, study_key):
     """Displays details for a specific study and its transcriptions."""
-    # Use get_object_or_404 for the main study object
-    study = get_object_or_404(Study, study_key=study_key)
-    
-    # Find related transcriptions using the study_key reference
-    # Since we didn't use a ForeignKey in the model for simplicity with Djongo,
-    # we filter the Transcription collection directly.
-    try:
-        transcriptions = Transcription.objects.filter(study_key=study.study_key).order_by('-transcription_timestamp')
-    except Transcription.DoesNotExist:
-        transcriptions = [] # Handle case where no transcriptions exist yet
-        
+    study = repository.get_study(study_key)
+    if study is None:
+        raise Http404(f"No study with key {study_key}")
+
+    # Transcriptions reference the study by study_key (no ForeignKey with djongo)
+    transcriptions = repository.get_transcriptions(study_key)
+
     context = {
         'study': study,
         'transcriptions': transcriptions,
-        'page_title': f'Details for {study.study_key}' # Dynamic title
+        'page_title': f'Details for {study_key}' # Dynamic title
+    }
+    return render(request, 'study_dashboard/study_detail.html', context)
+
+def _page_number(value):
+    try:
+        return max(1, int(value))
+    except (TypeError, ValueError):
+        return 1
+
+def _run_search(request):
+    """
+    Runs the report search for the 'q' and 'page' parameters.
+
+    Returns a dict with the query, page, results (each with reading/conclusion snippets),
+    has_next and error; pages stop at DASHBOARD_SEARCH_MAX_RESULTS.
+    """
+    query = (request.GET.get('q') or '').strip()
+    page = _page_number(request.GET.get('page'))
+    page_size = settings.DASHBOARD_SEARCH_PAGE_SIZE
+    outcome = {'query': query, 'page': page, 'results': [], 'has_next': False, 'error': None}
+    if not query:
+        return outcome
+
+    skip = (page - 1) * page_size
+    limit = min(page_size + 1, settings.DASHBOARD_SEARCH_MAX_RESULTS - skip)
+    if limit <= 0:
+        outcome['error'] = f"Only the first {settings.DASHBOARD_SEARCH_MAX_RESULTS} matches can be browsed; refine the search."
+        return outcome
+
+    rows = repository.search_transcriptions(query, skip=skip, limit=limit)
+    if rows is None:
+        outcome['error'] = "Search is unavailable (is the service's text index created?)."
+        return outcome
+
+    outcome['has_next'] = len(rows) > page_size and skip + page_size < settings.DASHBOARD_SEARCH_MAX_RESULTS
+    terms = search_terms(query)
+    for row in rows[:page_size]:
+        outcome['results'].append({
+            'study_key': row.get('study_key'),
+            'attempt': row.get('attempt'),
+            'score': round(row.get('score', 0), 3),
+            'model': row.get('model'),
+            'transcription_timestamp': row.get('transcription_timestamp'),
+            'reading_snippet': highlight(row.get('reading'), terms),
+            'conclusion_snippet': highlight(row.get('conclusion'), terms),
+        })
+    return outcome
+
+def study_search(request):
+    """Full-text search over transcription reports, best match first."""
+    search = _run_search(request)
+    query = request.GET.copy()
+    query.pop('page', None)
+    context = {
+        'search': search,
+        'base_query': query.urlencode(),
+        'page_title': 'Search Reports',
     }
-    return render(request, 'study_dashboard/study_detail.html', context) 
\ No newline at end of file
+    return render(request, 'study_dashboard/study_search.html', context)
+
+def study_search_json(request):
+    """Same search as study_search, as JSON. Snippets are HTML-escaped with matches in <mark>."""
+    search = _run_search(request)
+    for result in search['results']:
+        timestamp = result['transcription_timestamp']
+        result['transcription_timestamp'] = timestamp.isoformat() if timestamp else None
+    return JsonResponse(search)
+
+def export_rows(request, dataset, fmt):
+    """
+    Streams studies or transcriptions as CSV or NDJSON.
+
+    Accepts the study list filters: status and from/to (on last_updated_timestamp for
+    studies, transcription_timestamp for transcriptions). Rows are read and sent in
+    batches of DASHBOARD_EXPORT_BATCH_SIZE, so memory use is the same for any export size.
+    """
+    if fmt not in export.FORMATS or dataset not in ('studies', 'transcriptions'):
+        raise Http404(f"No export {dataset}.{fmt}")
+
+    filters = _list_filters(request)
+    start = _day_start(filters['date_from']) if filters['date_from'] else None
+    before = _day_start(filters['date_to'] + timedelta(days=1)) if filters['date_to'] else None
+    batch_size = settings.DASHBOARD_EXPORT_BATCH_SIZE
+    if dataset == 'studies':
+        cursor = repository.export_studies(filters['status'], start, before, batch_size=batch_size)
+        fields = repository.STUDY_EXPORT_FIELDS
+    else:
+        cursor = repository.export_transcriptions(filters['status'], start, before, batch_size=batch_size)
+        fields = repository.TRANSCRIPTION_EXPORT_FIELDS
+
+    response = StreamingHttpResponse(
+        export.stream_rows(cursor, fields, fmt, batch_size=batch_size),
+        content_type=export.FORMATS[fmt],
+    )
+    filename = f"{dataset}-{datetime.now(timezone.utc):%Y%m%d-%H%M%S}.{fmt}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+def _cached_stats():
+    """
+    Aggregated statistics, recomputed at most every DASHBOARD_STATS_CACHE_SECONDS, and
+    sooner if the pipeline has written since (the cache key carries the data version).
+    """
+    return cache.get_or_set(
+        versioned_key('stats', repository.data_version()),
+        lambda: repository.study_stats(window_hours=settings.DASHBOARD_STATS_WINDOW_HOURS),
+        settings.DASHBOARD_STATS_CACHE_SECONDS,
+    )
+
+def study_stats(request):
+    """Displays throughput, error rate and backlog statistics."""
+    context = {
+        'stats': _cached_stats(),
+        'page_title': 'Processing Statistics',
+    }
+    return render(request, 'study_dashboard/study_stats.html', context)
+
+def study_stats_json(request):
+    """Same statistics as study_stats, as JSON for wall monitors and scripts."""
+    return JsonResponse(_cached_stats())
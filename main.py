@@ -1,50 +1,18 @@
 import sys
 import argparse
-import yaml
 import logging
 import os
+from datetime import date
 
-# Remove direct pipeline imports, they are used by processing_worker now
-from modules.database_monitor import DatabaseMonitor
-# from modules.query import process_study_key # Moved to processing_worker
-# from modules.extract_audio import ExtractAudio # Moved to processing_worker
-# from modules.transcribe import Transcribe # Moved to processing_worker
-# from modules.store_transcribed_report import StoreTranscribedReport # Moved to processing_worker
-# from modules.encapsulate_text_as_enhanced_sr import EncapsulateTextAsEnhancedSR # Moved to processing_worker
+# Only the config loader is imported up front. The pipeline modules pull in pymongo,
+# oracledb, pydicom, numpy/scipy and google.generativeai, which take seconds to import
+# (longer from the PyInstaller bundle); main() imports them once the arguments are parsed,
+# so `--help` and argument errors return at once and need no database.
+from modules.config import CONFIG_PATH, get_config
 
-from modules.logger_config import setup_logging
-from modules import database_operations as db_ops # Still needed for initial connection
-# from modules import smb_connect # Moved to processing_worker
+# oracledb (thin mode) loads cryptography dynamically; PG_Transcriber.spec lists it in hiddenimports.
 
-# Keep oracledb imports if init_oracle_client is used
-import oracledb 
-import cryptography.hazmat.primitives.kdf.pbkdf2
-import cryptography.x509
-
-def load_config(config_path):
-    try:
-        with open(config_path, 'r') as file:
-            return yaml.safe_load(file)
-    except FileNotFoundError:
-        print(f"Error: Configuration file not found at {config_path}", file=sys.stderr)
-        sys.exit(1)
-    except yaml.YAMLError as e:
-        print(f"Error parsing configuration file {config_path}: {e}", file=sys.stderr)
-        sys.exit(1)
-
-# Load config early to use for logging and DB setup
-config_path = "config.yaml"
-config = load_config(config_path)
-
-# Setup logging using the loaded config path
-setup_logging(config_path)
-logger = logging.getLogger('detailed') # Get the configured logger
-
-# Initialize DB connection (optional, can be lazy)
-# Consider moving this into DatabaseMonitor or ensuring it's called before monitor needs it.
-db_ops.connect_db(config)
-
-# Uncomment and adjust Oracle client initialization if needed.
+# Uncomment and adjust Oracle client initialization if needed (inside start_service, after logging).
 # oracle_client_path = config.get("ORACLE_CLIENT_PATH")
 # if oracle_client_path:
 #     try:
@@ -61,20 +29,205 @@ db_ops.connect_db(config)
 # def run_pipeline(study_key):
     # ... This function is now moved to modules/processing_worker.py ...
 
+def start_service(config, connect_mongo=True):
+    """Configures logging and observability, then connects to MongoDB. Runs once, after argument parsing."""
+    from modules.logger_config import setup_logging
+    from modules import database_operations as db_ops
+    from modules import metrics, tracing
+
+    # The only place logging is configured
+    setup_logging(CONFIG_PATH, config=config)
+
+    # Metrics must be installed before connecting so the MongoClient gets the command listener
+    if config.get("METRICS", "OFF") == "ON":
+        metrics.install(config)
+    # Likewise for tracing, whose listener turns Mongo writes into spans
+    if config.get("TRACING", "OFF") == "ON":
+        tracing.install(config)
+
+    if not connect_mongo:
+        return
+    db_ops.connect_db(config)
+    if config.get("MONGODB_ENSURE_INDEXES", "ON") == "ON":
+        db_ops.ensure_indexes(config)
+
+def run_backfill_command(config, args):
+    """Collects the study keys of `main.py backfill` and runs them; returns the exit status."""
+    from modules import backfill, tracing
+    from modules.query import REPORT_READY
+    logger = logging.getLogger('detailed')
+
+    if args.to_date and not args.from_date:
+        logger.error("--to needs --from.")
+        return 2
+    if args.keys:
+        study_keys = [backfill.parse_study_key(key) for key in args.keys]
+    elif args.keys_file:
+        study_keys = backfill.read_study_keys(args.keys_file)
+    else:
+        study_keys = backfill.query_study_keys(config, args.from_date, args.to_date or date.today())
+        if study_keys is None:
+            return 1
+    logger.info(f"Backfill selected {len(study_keys)} studies.")
+
+    if args.no_writeback:
+        config = dict(config, STORE_TRANSCRIBED_REPORT="OFF")
+    try:
+        succeeded, failed = backfill.run_backfill(
+            config, study_keys,
+            workers=args.workers or int(config.get("BACKFILL_WORKERS", 4)),
+            checkpoint_path=args.checkpoint or config.get("BACKFILL_CHECKPOINT_FILE", "backfill.checkpoint"),
+            dry_run=args.dry_run,
+            report_stat=None if args.any_report_status else REPORT_READY,
+        )
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        tracing.shutdown() # Write out spans still queued
+    return 1 if failed else 0
+
+def run_directory_command(config, args):
+    """Runs `main.py directory`; returns the exit status."""
+    from modules import directory_mode, tracing
+    logger = logging.getLogger('detailed')
+
+    if not os.path.isdir(args.root):
+        logger.error(f"Not a folder: {args.root}")
+        return 2
+    try:
+        counts = directory_mode.run_directory(
+            config, args.root, output=args.output,
+            workers=args.workers or int(config.get("DIRECTORY_WORKERS", 4)),
+            index_path=args.index or config.get("DIRECTORY_INDEX_FILE", "directory_index.sqlite"),
+            pattern=args.pattern,
+            sr_root=args.sr_folder,
+            work_dir=config.get("DIRECTORY_WORK_DIR"),
+            dry_run=args.dry_run,
+        )
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        tracing.shutdown() # Write out spans still queued
+    return 1 if counts["failed"] else 0
+
+def run_redo_command(config, args):
+    """Runs `main.py redo`: clears the chosen stage checkpoint (and later ones) and reruns the studies; returns the exit status."""
+    from modules import backfill, processing_worker, tracing
+    from modules import database_operations as db_ops
+    from modules.query import REPORT_READY
+    logger = logging.getLogger('detailed')
+
+    if config.get("STAGE_CHECKPOINTS", "ON") != "ON":
+        logger.warning("STAGE_CHECKPOINTS is 'OFF': every run starts from the beginning, so the studies are simply reprocessed.")
+    study_keys = list(dict.fromkeys(backfill.parse_study_key(key) for key in args.keys))
+    cleared = 0
+    for study_key in study_keys:
+        if db_ops.get_study_status(config, study_key) is None:
+            logger.warning(f"Study {study_key} has not been processed yet; it has no checkpoints to clear.")
+            continue
+        processing_worker.redo_from(config, study_key, args.stage)
+        cleared += 1
+    logger.info(f"Cleared the '{args.stage}' checkpoint and the ones after it for {cleared} studies.")
+    if args.clear_only:
+        db_ops.close_status_writer() # Write the buffered checkpoint changes
+        return 0
+
+    if args.no_writeback:
+        config = dict(config, STORE_TRANSCRIBED_REPORT="OFF")
+    try:
+        succeeded, failed = backfill.run_backfill(
+            config, study_keys,
+            workers=args.workers or int(config.get("BACKFILL_WORKERS", 4)),
+            report_stat=None if args.any_report_status else REPORT_READY,
+        )
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        tracing.shutdown() # Write out spans still queued
+    return 1 if failed else 0
+
 # ----------------- Main Entry Point -----------------
 def main():
-    # Logging is already set up
-    # Config is already loaded
-    # DB connection might be initialized
-
     parser = argparse.ArgumentParser(description="Run enhanced SR transcription pipeline in monitor mode.")
     # Remove STUDY_KEY argument
     # parser.add_argument("STUDY_KEY", nargs="?", help="Study key for processing")
     parser.add_argument("--monitor", action="store_true", help="Run database monitoring mode (required)")
+    parser.add_argument("--profile", action="store_true", help="Profile the first PROFILE_STUDIES studies (cProfile) and take tracemalloc snapshots, written to PROFILE_DIR")
+    parser.add_argument("--check-indexes", action="store_true", help="Create MongoDB indexes, verify the hot queries use them, and exit")
+    subparsers = parser.add_subparsers(dest="command")
+    backfill_parser = subparsers.add_parser("backfill", help="Process a list or date range of studies with parallel workers, then exit")
+    source = backfill_parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--keys", nargs="+", metavar="STUDY_KEY", help="Study keys to process")
+    source.add_argument("--keys-file", help="File with one study key per line")
+    source.add_argument("--from", dest="from_date", type=date.fromisoformat, metavar="YYYY-MM-DD",
+                        help="Studies whose BACKFILL_DATE_COLUMN is on or after this day")
+    backfill_parser.add_argument("--to", dest="to_date", type=date.fromisoformat, metavar="YYYY-MM-DD",
+                                 help="Last day of the --from range (default: today)")
+    backfill_parser.add_argument("--workers", type=int, default=None, help="Studies processed in parallel (default: BACKFILL_WORKERS)")
+    backfill_parser.add_argument("--checkpoint", default=None, help="Resume/progress file (default: BACKFILL_CHECKPOINT_FILE)")
+    backfill_parser.add_argument("--dry-run", action="store_true", help="Only resolve and print the dictation paths")
+    backfill_parser.add_argument("--any-report-status", action="store_true",
+                                 help="Use the newest report of each study, not only reports waiting for transcription (REPORT_STAT 3010)")
+    backfill_parser.add_argument("--no-writeback", action="store_true", help="Do not write reports back to the RIS (STORE_TRANSCRIBED_REPORT)")
+    directory_parser = subparsers.add_parser("directory", help="Transcribe every DICOM dictation under a folder without the RIS, then exit")
+    directory_parser.add_argument("root", help="Folder to walk")
+    directory_parser.add_argument("--output", choices=("mongo", "sr", "both"), default=None,
+                                  help="Where results go (default: DIRECTORY_OUTPUT)")
+    directory_parser.add_argument("--workers", type=int, default=None, help="Files processed in parallel (default: DIRECTORY_WORKERS)")
+    directory_parser.add_argument("--index", default=None, help="Processed-file index (default: DIRECTORY_INDEX_FILE)")
+    directory_parser.add_argument("--pattern", default="*", help="Only file names matching this glob (default: all DICOM files)")
+    directory_parser.add_argument("--sr-folder", default=None, help="Root of the mirrored SR output tree (default: SR_OUTPUT_FOLDER)")
+    directory_parser.add_argument("--dry-run", action="store_true", help="Only list the files that would be processed")
+    redo_parser = subparsers.add_parser("redo", help="Rerun studies from a chosen stage, keeping the checkpointed results of the stages before it")
+    redo_parser.add_argument("keys", nargs="+", metavar="STUDY_KEY", help="Study keys to rerun")
+    redo_parser.add_argument("--stage", required=True, choices=("resolve", "extract", "transcribe", "sr", "writeback"),
+                             help="First stage to redo; the checkpoints of this stage and the ones depending on it are cleared")
+    redo_parser.add_argument("--workers", type=int, default=None, help="Studies processed in parallel (default: BACKFILL_WORKERS)")
+    redo_parser.add_argument("--any-report-status", action="store_true",
+                             help="Use the newest report of each study, not only reports waiting for transcription (when resolve is redone)")
+    redo_parser.add_argument("--no-writeback", action="store_true", help="Do not write reports back to the RIS (STORE_TRANSCRIBED_REPORT)")
+    redo_parser.add_argument("--clear-only", action="store_true", help="Only clear the checkpoints; the next run of each study redoes the stage")
     args = parser.parse_args()
+    if not args.monitor and not args.check_indexes and args.command is None:
+        parser.error("The --monitor flag is required to run the service.")
+
+    config = get_config(CONFIG_PATH)
+    if args.command == "directory":
+        args.output = args.output or config.get("DIRECTORY_OUTPUT", "mongo")
+    # A dry run only reads the RIS or the folder; SR-only directory runs do not use MongoDB either
+    connect_mongo = not (args.command in ("backfill", "directory") and args.dry_run) \
+        and not (args.command == "directory" and args.output == "sr")
+    start_service(config, connect_mongo=connect_mongo)
+    logger = logging.getLogger('detailed') # Get the configured logger
+    from modules import database_operations as db_ops
+    from modules import metrics, tracing, profiling
+
+    if args.check_indexes:
+        indexes_ok = db_ops.ensure_indexes(config)
+        plans = db_ops.check_query_plans(config)
+        if not plans:
+            sys.exit(1)
+        for name, passed, stages in plans:
+            print(f"{'OK  ' if passed else 'FAIL'} {name}: {' <- '.join(str(stage) for stage in stages)}")
+        sys.exit(0 if indexes_ok and all(passed for _, passed, _ in plans) else 1)
+
+    if args.command == "backfill":
+        sys.exit(run_backfill_command(config, args))
+
+    if args.command == "directory":
+        sys.exit(run_directory_command(config, args))
+
+    if args.command == "redo":
+        sys.exit(run_redo_command(config, args))
 
     if args.monitor:
         logger.info("Starting database monitor mode...")
+        if config.get("METRICS", "OFF") == "ON":
+            metrics.start_metrics_server(config)
+        # Imported after the metrics server is up: this loads the whole pipeline
+        from modules.database_monitor import DatabaseMonitor
+        # Profiling can also be started later through PROFILE_TRIGGER_FILE or SIGUSR1
+        profiling.install(config, start=args.profile)
         # Pass config to monitor
         monitor = DatabaseMonitor(config)
         try:
@@ -91,13 +244,14 @@ def main():
         finally:
              # Ensure DB connections are closed if monitor manages them
              # Or handle cleanup within monitor.stop_monitoring()
+             metrics.stop_metrics_server()
+             tracing.shutdown() # Write out spans still queued
+             profiling.shutdown() # Write out a profiling session cut short
              logger.info("Monitor mode exiting.")
              sys.exit(0) # Normal exit
 
     # if args.STUDY_KEY: # Logic removed
         # run_pipeline(args.STUDY_KEY)
-    else: # Only error if --monitor flag is missing
-        parser.error("The --monitor flag is required to run the service.")
 
 if __name__ == "__main__":
     main()
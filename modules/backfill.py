@@ -0,0 +1,197 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+import oracledb
+
+from . import database_operations as db_ops
+from . import dicom_store
+from . import smb_connect
+from . import prefetch
+from . import processing_worker
+from .query import process_study_key, REPORT_READY
+
+# Only a plain (optionally schema-qualified) column name may be spliced into the date-range query
+_COLUMN_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_$#]*(\.[A-Za-z_][A-Za-z0-9_$#]*)?$")
+
+
+def parse_study_key(text):
+    """Study keys are numeric in the RIS; keep anything else as given."""
+    text = str(text).strip()
+    return int(text) if text.isdigit() else text
+
+
+def read_study_keys(path):
+    """Reads one study key per line; blank lines and lines starting with '#' are skipped, as is anything after a comma or whitespace."""
+    keys = []
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            keys.append(parse_study_key(re.split(r"[,\s]", line, maxsplit=1)[0]))
+    return keys
+
+
+def query_study_keys(config, start_date, end_date):
+    """
+    Returns the keys of the studies whose BACKFILL_DATE_COLUMN (in TSTUDY) falls in
+    [start_date, end_date] (whole days), or None if the column is not configured or the query fails.
+    """
+    column = config.get("BACKFILL_DATE_COLUMN")
+    if not column or not _COLUMN_NAME.match(column):
+        logging.error(f"BACKFILL_DATE_COLUMN must name the study date column of TSTUDY (got {column!r}).")
+        return None
+    dsn = oracledb.makedsn(config["ORACLE_HOST"], config["ORACLE_PORT"], service_name=config["ORACLE_SERVICE_NAME"])
+    try:
+        with oracledb.connect(user=config["ORACLE_USERNAME"], password=config["ORACLE_PASSWORD"], dsn=dsn) as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"SELECT STUDY_KEY FROM TSTUDY WHERE {column} >= :start_date AND {column} < :end_date ORDER BY STUDY_KEY",
+                    start_date=datetime.combine(start_date, datetime.min.time()),
+                    end_date=datetime.combine(end_date + timedelta(days=1), datetime.min.time()),
+                )
+                return [row[0] for row in cursor.fetchall()]
+    except Exception as e:
+        logging.error(f"Failed to query studies between {start_date} and {end_date}: {e}")
+        return None
+
+
+class Checkpoint:
+    """
+    Append-only JSON-lines record of finished studies, so an interrupted backfill can resume.
+
+    Studies that completed are skipped on the next run with the same file; failed ones are retried.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.completed = set()
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue # A line cut short by a crash
+                    if entry.get("ok"):
+                        self.completed.add(entry["study_key"])
+                    else:
+                        self.completed.discard(entry["study_key"])
+
+    def record(self, study_key, status, ok):
+        if not self.path:
+            return
+        entry = {"study_key": study_key, "status": status, "ok": ok, "finished": datetime.now().isoformat(timespec="seconds")}
+        with self._lock, open(self.path, 'a', encoding='utf-8') as file:
+            file.write(json.dumps(entry) + "\n")
+
+
+def _format_seconds(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m{seconds:02d}s" if hours else f"{minutes}m{seconds:02d}s"
+
+
+class _Progress:
+    """Counts finished studies and logs a progress line with an ETA after each one."""
+
+    def __init__(self, total):
+        self.total = total
+        self.succeeded = 0
+        self.failed = 0
+        self.start = time.monotonic()
+        self._lock = threading.Lock()
+
+    def finished(self, study_key, ok, detail):
+        with self._lock:
+            if ok:
+                self.succeeded += 1
+            else:
+                self.failed += 1
+            done = self.succeeded + self.failed
+            elapsed = time.monotonic() - self.start
+        eta = _format_seconds(elapsed / done * (self.total - done))
+        logging.info(f"Backfill [{done}/{self.total}] {done * 100 / self.total:.1f}% "
+                     f"ok={self.succeeded} failed={self.failed} elapsed {_format_seconds(elapsed)} ETA {eta} "
+                     f"- study {study_key}: {detail}")
+
+
+def _process(config, study_key, report_stat):
+    """Runs one study through the pipeline; returns (status, ok) read back from MongoDB."""
+    try:
+        processing_worker.process_study(config, study_key, report_stat=report_stat)
+    except Exception as e:
+        logging.error(f"Backfill of study {study_key} raised an error: {e}", exc_info=True)
+        db_ops.update_study_status(config, study_key, "error", error_message=f"Backfill failed: {str(e)[:200]}")
+        return "error", False
+    status = db_ops.get_study_status(config, study_key)
+    return status, bool(status and status.startswith("processing_complete"))
+
+
+def _resolve(config, study_key, report_stat):
+    """Dry run: only resolves the dictation path; returns (path, ok)."""
+    try:
+        path = process_study_key(config, study_key, report_stat=report_stat)
+    except Exception as e:
+        logging.error(f"Resolving the path of study {study_key} raised an error: {e}")
+        path = None
+    return path, bool(path)
+
+
+def run_backfill(config, study_keys, workers=4, checkpoint_path=None, dry_run=False, report_stat=REPORT_READY):
+    """
+    Runs the given studies through the pipeline on `workers` threads.
+
+    With a checkpoint file, studies it records as completed are skipped and every
+    finished study is appended to it. A dry run only resolves the dictation paths
+    (printed as "study_key<TAB>path"), writes nothing and ignores the checkpoint.
+    Returns (succeeded, failed) counts.
+    """
+    study_keys = list(dict.fromkeys(study_keys)) # Drop duplicates, keep order
+    checkpoint = Checkpoint(None if dry_run else checkpoint_path)
+    pending = [key for key in study_keys if key not in checkpoint.completed]
+    if len(pending) < len(study_keys):
+        logging.info(f"Skipping {len(study_keys) - len(pending)} studies already completed according to {checkpoint_path}")
+    if not pending:
+        logging.info("Nothing to backfill.")
+        return 0, 0
+
+    logging.info(f"{'Resolving' if dry_run else 'Backfilling'} {len(pending)} studies with {workers} workers")
+    progress = _Progress(len(pending))
+    executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="backfill")
+    prefetcher = None if dry_run else prefetch.get_prefetcher(config)
+    if prefetcher is not None:
+        prefetcher.add(pending, report_stat=report_stat) # Copied PREFETCH_AHEAD studies at a time, in the order they are processed
+    try:
+        task = _resolve if dry_run else _process
+        futures = {executor.submit(task, config, key, report_stat): key for key in pending}
+        for future in as_completed(futures):
+            study_key = futures[future]
+            result, ok = future.result()
+            if dry_run:
+                print(f"{study_key}\t{result or 'UNRESOLVED'}", flush=True)
+            else:
+                checkpoint.record(study_key, result, ok)
+            progress.finished(study_key, ok, result or "unresolved")
+    except KeyboardInterrupt:
+        logging.warning("Backfill interrupted: waiting for the running studies; the rest stay pending in the checkpoint.")
+        executor.shutdown(wait=True, cancel_futures=True)
+        raise
+    finally:
+        executor.shutdown(wait=True)
+        if not dry_run:
+            prefetch.close_prefetcher()
+            dicom_store.close_sink() # Release any pooled C-STORE associations
+            smb_connect.close_backend() # Close any pooled SMB sessions
+            db_ops.close_status_writer() # Write any buffered status transitions
+
+    elapsed = time.monotonic() - progress.start
+    logging.info(f"Backfill finished in {_format_seconds(elapsed)}: {progress.succeeded} ok, {progress.failed} failed")
+    return progress.succeeded, progress.failed
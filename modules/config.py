@@ -0,0 +1,36 @@
+import sys
+import threading
+
+import yaml
+
+CONFIG_PATH = "config.yaml"
+
+# Global config, loaded once by get_config and shared by every caller in the process
+_config = None
+_config_lock = threading.Lock()
+
+
+def load_config(config_path=CONFIG_PATH):
+    """Reads config_path; exits with status 1 if it is missing or not valid YAML."""
+    try:
+        with open(config_path, 'r') as file:
+            return yaml.safe_load(file) or {}
+    except FileNotFoundError:
+        print(f"Error: Configuration file not found at {config_path}", file=sys.stderr)
+        sys.exit(1)
+    except yaml.YAMLError as e:
+        print(f"Error parsing configuration file {config_path}: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+def get_config(config_path=CONFIG_PATH):
+    """
+    Returns the process-wide config, reading config_path on the first call only.
+
+    Later calls return the same dict whatever path they pass.
+    """
+    global _config
+    with _config_lock:
+        if _config is None:
+            _config = load_config(config_path)
+        return _config
@@ -8,6 +8,11 @@ import sys
 import time
 from . import database_operations as db_ops # Import the MongoDB operations
 from . import processing_worker # Import the new worker module
+from . import dicom_store
+from . import smb_connect
+from . import metrics
+from . import profiling
+from . import prefetch
 
 class DatabaseMonitor:
     def __init__(self, config):
@@ -17,6 +22,12 @@ class DatabaseMonitor:
         self.poll_interval = config.get("POLL_INTERVAL_SECONDS", 60) # Use config value or default
         self.attempted_studies = set() # Track studies attempted in this session
         self.logger = logging.getLogger('detailed') # Get the logger
+        # "staged": studies go to the stage worker pools of modules/pipeline.py instead of running one at a time
+        self.pipeline = None
+        if config.get("PIPELINE_MODE", "sequential") == "staged":
+            from .pipeline import StagedPipeline
+            self.pipeline = StagedPipeline(config)
+        self.prefetcher = prefetch.get_prefetcher(config) # None unless PREFETCH is "ON"
 
     # def worker(self):
         # """Worker thread that processes study keys from the queue."""
@@ -24,6 +35,13 @@ class DatabaseMonitor:
         # ... (old worker code removed) ...
 
     def start_monitoring(self):
+        try:
+            self._monitor()
+        finally:
+            # Also when Ctrl+C ends the loop: queued studies and buffered status transitions are not lost
+            self._shutdown()
+
+    def _monitor(self):
         # worker_thread = threading.Thread(target=self.worker, daemon=True) # No longer needed
         # worker_thread.start()
 
@@ -60,9 +78,15 @@ class DatabaseMonitor:
                     # TODO: Make query configurable?
                     query = "SELECT STUDY_KEY FROM TSTUDY WHERE STUDYSTAT = 3010"
                     self.logger.debug(f"Executing monitoring query: {query}")
-                    cursor.execute(query)
-                    rows = cursor.fetchall()
+                    with metrics.time_oracle("poll"):
+                        cursor.execute(query)
+                        rows = cursor.fetchall()
                     self.logger.debug(f"Found {len(rows)} studies with status 3010.")
+                    metrics.BACKLOG.set(len(rows))
+                    metrics.READY.set(1 if db_ops.db is not None else 0)
+                    if self.prefetcher is not None:
+                        # Start copying the new studies' DICOMs while the first ones are processed
+                        self.prefetcher.add([row[0] for row in rows if row[0] not in self.attempted_studies])
                     for row in rows:
                         study_key = row[0]
                         # Check if we already processed this key in this batch or session
@@ -75,7 +99,12 @@ class DatabaseMonitor:
                             self.logger.info(f"Adding study {study_key} to attempted set and initiating processing.")
 
                             # --- Directly call the processing worker --- 
+                            profiling.check_trigger() # Lets a profiling request take effect mid-backlog
                             try:
+                                if self.pipeline is not None:
+                                    # Returns once the study is queued; blocks while the pipeline is backed up
+                                    self.pipeline.submit(study_key)
+                                    continue
                                 # Call synchronously. The loop will wait here until process_study finishes.
                                 processing_worker.process_study(self.config, study_key)
                                 self.logger.info(f"Processing finished for study {study_key}. Continuing monitor loop.")
@@ -92,6 +121,7 @@ class DatabaseMonitor:
                 # Commit might not be necessary for SELECT, depends on Oracle config/transactions
                 # connection.commit()
             except oracledb.Error as ora_err:
+                metrics.READY.set(0)
                 self.logger.error(f"Oracle error during monitoring query: {ora_err}")
                 # Consider specific error handling (e.g., reconnect attempt, exit)
                 time.sleep(5) # Wait a bit before retrying
@@ -104,11 +134,21 @@ class DatabaseMonitor:
             for _ in range(self.poll_interval):
                 if not self.is_running:
                     break
+                profiling.check_trigger()
                 time.sleep(1)
 
+        metrics.READY.set(0)
         if connection:
             connection.close()
             self.logger.info("Oracle database connection closed.")
+
+    def _shutdown(self):
+        if self.pipeline is not None:
+            self.pipeline.close() # Finish the studies already queued
+        prefetch.close_prefetcher()
+        dicom_store.close_sink() # Release any pooled C-STORE associations
+        smb_connect.close_backend() # Close any pooled SMB sessions
+        db_ops.close_status_writer() # Write any buffered status transitions
         self.logger.info("Monitor Database Service has stopped.")
 
     def stop_monitoring(self):
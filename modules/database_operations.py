@@ -1,13 +1,51 @@
 import logging
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
+import threading
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel, MongoClient, ReturnDocument, UpdateOne, WriteConcern
+from pymongo.errors import BulkWriteError, ConnectionFailure, OperationFailure
 from datetime import datetime
 import os
+from . import metrics, tracing
 
 # Global client and db variables to reuse the connection
 client = None
 db = None
 
+# Global status writer, created on first buffered status update
+status_writer = None
+_status_writer_lock = threading.Lock()
+
+# Indexes backing the service's upserts and the dashboard's hot queries
+STUDY_INDEXES = [
+    IndexModel([("study_key", ASCENDING)], name="study_key_unique", unique=True),
+    # Keyset pagination of the dashboard list on (last_updated_timestamp, _id), with and without a status filter
+    IndexModel([("last_updated_timestamp", DESCENDING), ("_id", DESCENDING)], name="last_updated_id"),
+    IndexModel([("status", ASCENDING), ("last_updated_timestamp", DESCENDING), ("_id", DESCENDING)], name="status_last_updated_id"),
+]
+TRANSCRIPTION_INDEXES = [
+    IndexModel([("study_key", ASCENDING), ("transcription_timestamp", DESCENDING)], name="study_key_transcription_timestamp"),
+    # Dashboard export of transcriptions by date range
+    IndexModel([("transcription_timestamp", ASCENDING), ("_id", ASCENDING)], name="transcription_timestamp_id"),
+    # One document per study and attempt; legacy documents without an attempt are exempt until migrated
+    IndexModel([("study_key", ASCENDING), ("attempt", ASCENDING)], name="study_key_attempt_unique", unique=True,
+               partialFilterExpression={"attempt": {"$exists": True}}),
+    # Full-text search over the report (dashboard search page/API and admin); conclusion matches rank higher
+    IndexModel([("reading", TEXT), ("conclusion", TEXT)], name="reading_conclusion_text",
+               weights={"reading": 1, "conclusion": 2}, default_language="english"),
+]
+
+# Write error codes of a bulk status flush that a later flush can get past: a duplicate key from two
+# concurrent upserts of a new study (the retry finds the document and updates it), a primary that is
+# stepping down or shutting down, and a timed-out write. Other rejected writes would fail again.
+RETRYABLE_WRITE_ERRORS = {11000, 50, 91, 189, 262, 10107, 11600, 11602, 13435, 13436}
+
+# Document in the 'meta' collection whose counter goes up on every write the dashboard displays;
+# the dashboard keys its page cache on it, so a cached page never outlives the data it shows.
+DATA_VERSION_ID = "data_version"
+
+def is_terminal_status(status):
+    """Complete and error states are flushed to MongoDB immediately."""
+    return status == "error" or status == "completed" or status.startswith("processing_complete")
+
 def connect_db(config):
     """Establishes connection to the MongoDB database using config."""
     global client, db
@@ -15,7 +53,7 @@ def connect_db(config):
         try:
             mongodb_uri = config.get("MONGODB_URI", "mongodb://localhost:27017/")
             db_name = config.get("MONGODB_DATABASE", "audio_transcriber_db")
-            client = MongoClient(mongodb_uri)
+            client = MongoClient(mongodb_uri, event_listeners=metrics.mongo_listeners() + tracing.mongo_listeners())
             # The ismaster command is cheap and does not require auth.
             client.admin.command('ismaster')
             db = client[db_name]
@@ -37,15 +75,102 @@ def get_db(config):
         return connect_db(config)
     return db
 
-def update_study_status(config, study_key, status, error_message=None, dicom_path=None):
-    """Updates the status of a study in the 'studies' collection or creates it."""
+def ensure_indexes(config):
+    """
+    Creates the indexes the service and dashboard rely on. Safe to call on every start;
+    existing indexes are left alone.
+
+    Returns:
+        bool: True if all indexes exist afterwards, False otherwise.
+    """
     database = get_db(config)
-    if not database:
-        logging.error("Database connection not available. Cannot update study status.")
-        return
+    if database is None:
+        logging.error("Database connection not available. Cannot create indexes.")
+        return False
 
-    now = datetime.utcnow()
-    query = {"study_key": study_key}
+    ok = True
+    for collection, indexes in ((database.studies, STUDY_INDEXES), (database.transcriptions, TRANSCRIPTION_INDEXES)):
+        for index in indexes:
+            name = index.document["name"]
+            try:
+                collection.create_indexes([index])
+                logging.debug(f"Index {collection.name}.{name} is in place")
+            except OperationFailure as e:
+                if e.code == 85:
+                    # IndexOptionsConflict: same keys already indexed under another name (e.g. by a djongo migration)
+                    logging.debug(f"Index {collection.name}.{name} already exists under a different name")
+                    continue
+                ok = False
+                if e.code == 11000:
+                    # Unique index build hit existing duplicates; they must be merged by hand first.
+                    logging.error(f"Cannot create unique index {collection.name}.{name}: duplicate values exist. {e}")
+                else:
+                    logging.error(f"Failed to create index {collection.name}.{name}: {e}")
+    if ok:
+        logging.info("MongoDB indexes verified.")
+    return ok
+
+def _plan_stages(plan):
+    """
+    Flattens an explain() winning plan into the list of stage names.
+
+    Also unwraps the {"queryPlan": ...} of the slot-based engine (MongoDB 5.1+) and
+    the per-shard winning plans of a sharded cluster ({"shards": [...]}).
+    """
+    if "queryPlan" in plan:
+        return _plan_stages(plan["queryPlan"])
+    stages = [plan.get("stage")]
+    for shard in plan.get("shards", []):
+        stages.extend(_plan_stages(shard.get("winningPlan", {})))
+    if "inputStage" in plan:
+        stages.extend(_plan_stages(plan["inputStage"]))
+    for child in plan.get("inputStages", []):
+        stages.extend(_plan_stages(child))
+    return stages
+
+def plan_uses_index(stages):
+    """True if the plan reads an index (IXSCAN, or EXPRESS_IXSCAN on MongoDB 8) and has no COLLSCAN or in-memory SORT."""
+    return any("IXSCAN" in str(stage) for stage in stages) and "COLLSCAN" not in stages and "SORT" not in stages
+
+def check_query_plans(config):
+    """
+    Explains the hot queries and checks each one is answered from an index
+    (an IXSCAN, no COLLSCAN and no in-memory SORT).
+
+    Returns:
+        list[tuple]: (query name, passed, winning plan stages) per query, or None without a DB.
+    """
+    database = get_db(config)
+    if database is None:
+        logging.error("Database connection not available. Cannot check query plans.")
+        return None
+
+    hot_queries = {
+        "status upsert by study_key": database.studies.find({"study_key": ""}),
+        "studies page, newest first": database.studies.find({}).sort([("last_updated_timestamp", DESCENDING), ("_id", DESCENDING)]).limit(50),
+        "studies page by status, newest first": database.studies.find({"status": "error"}).sort([("last_updated_timestamp", DESCENDING), ("_id", DESCENDING)]).limit(50),
+        "transcriptions of a study, newest first": database.transcriptions.find({"study_key": ""}).sort("transcription_timestamp", DESCENDING),
+        "transcriptions export by date range": database.transcriptions.find({"transcription_timestamp": {"$gte": datetime(2000, 1, 1)}}).sort([("transcription_timestamp", ASCENDING), ("_id", ASCENDING)]),
+    }
+    results = []
+    for name, cursor in hot_queries.items():
+        stages = _plan_stages(cursor.explain()["queryPlanner"]["winningPlan"])
+        passed = plan_uses_index(stages)
+        results.append((name, passed, stages))
+        log = logging.info if passed else logging.error
+        log(f"Query plan for '{name}': {' <- '.join(str(stage) for stage in stages)}")
+    return results
+
+def bump_data_version(database):
+    """Increments the dashboard data version counter (see DATA_VERSION_ID)."""
+    try:
+        database.meta.update_one({"_id": DATA_VERSION_ID}, {"$inc": {"version": 1}}, upsert=True)
+    except Exception as e:
+        # Only cache freshness depends on it; the dashboard's cache timeout still bounds staleness
+        logging.warning(f"Failed to bump dashboard data version: {e}")
+
+def _build_status_update(study_key, status, now, error_message=None, dicom_path=None):
+    """Builds the update document for a status transition."""
     update_fields = {
         "$set": {
             "status": status,
@@ -64,6 +189,183 @@ def update_study_status(config, study_key, status, error_message=None, dicom_pat
         # Ensure error message is removed if status is not 'error'
         if status != 'error':
              update_fields["$unset"] = {"error_message": ""}
+    return update_fields
+
+class StatusWriter:
+    """
+    Buffers study status transitions and writes them with bulk_write.
+
+    Transitions for the same study are coalesced into one upsert, so a study that
+    moves through several states between flushes costs a single write. The buffer
+    is flushed when it holds STATUS_FLUSH_BATCH_SIZE studies, every
+    STATUS_FLUSH_INTERVAL_SECONDS, and immediately on terminal states.
+    """
+
+    def __init__(self, config, database):
+        self.batch_size = max(1, int(config.get("STATUS_FLUSH_BATCH_SIZE", 50)))
+        self.interval = float(config.get("STATUS_FLUSH_INTERVAL_SECONDS", 2))
+        write_concern = WriteConcern(
+            w=config.get("STATUS_WRITE_CONCERN_W", 1),
+            j=config.get("STATUS_WRITE_CONCERN_J", False),
+        )
+        self.database = database
+        self.collection = database.studies.with_options(write_concern=write_concern)
+        self._pending = {} # study_key -> coalesced update document
+        self._writing = {} # The batch a flush has taken from _pending and not yet written
+        self._lock = threading.Lock()
+        # Held for the whole swap-and-write so flushes land in submission order
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="status-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, study_key, status, error_message=None, dicom_path=None):
+        now = datetime.utcnow()
+        update = _build_status_update(study_key, status, now, error_message=error_message, dicom_path=dicom_path)
+        with self._lock:
+            pending = self._pending.get(study_key)
+            if pending is None:
+                self._pending[study_key] = update
+            else:
+                self._merge(pending, update)
+            buffered = len(self._pending)
+        logging.debug(f"Buffered status {status} for study {study_key} ({buffered} studies pending)")
+        if is_terminal_status(status) or buffered >= self.batch_size:
+            self.flush()
+
+    @staticmethod
+    def _merge(pending, update):
+        """Folds a later transition into the pending update; the later values win."""
+        pending_set = pending.setdefault("$set", {})
+        pending_unset = pending.setdefault("$unset", {})
+        for field, value in update.get("$set", {}).items():
+            pending_set[field] = value
+            pending_unset.pop(field, None)
+        for field in update.get("$unset", {}):
+            pending_set.pop(field, None)
+            pending_unset[field] = ""
+        if not pending_set:
+            del pending["$set"]
+        if not pending_unset:
+            del pending["$unset"]
+        # $setOnInsert keeps the first transition's received_timestamp
+        if "$setOnInsert" in update:
+            pending.setdefault("$setOnInsert", update["$setOnInsert"])
+
+    def submit_fields(self, study_key, fields):
+        """Buffers extra fields for a study; they go out with the next flush."""
+        self.submit_update(study_key, {"$set": fields})
+
+    def submit_update(self, study_key, update):
+        """Buffers a $set/$unset update for a study; it goes out with the next flush."""
+        with self._lock:
+            pending = self._pending.get(study_key)
+            if pending is None:
+                self._pending[study_key] = {operator: dict(fields) for operator, fields in update.items()}
+            else:
+                self._merge(pending, update)
+
+    def pending_update(self, study_key):
+        """Returns a copy of the study's update that is buffered or being written, or None."""
+        with self._lock:
+            writing, pending = self._writing.get(study_key), self._pending.get(study_key)
+            if writing is None and pending is None:
+                return None
+            update = {operator: dict(fields) for operator, fields in (writing or pending).items()}
+            if writing is not None and pending is not None:
+                self._merge(update, pending)
+        return update
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._writing = pending
+            if not pending:
+                return
+            operations = [UpdateOne({"study_key": key}, update, upsert=True) for key, update in pending.items()]
+            try:
+                result = self.collection.bulk_write(operations, ordered=False)
+                logging.info(f"Flushed {len(operations)} study status updates "
+                             f"({result.upserted_count} created, {result.modified_count} modified)")
+            except BulkWriteError as e:
+                # Operations were built in pending order, so each error's index names its study
+                keys = list(pending)
+                errors = e.details.get("writeErrors", [])
+                retry = {keys[error["index"]] for error in errors if error.get("code") in RETRYABLE_WRITE_ERRORS}
+                logging.error(f"Bulk status update partially failed ({len(retry)} of {len(errors)} "
+                              f"failed updates retried with the next flush): {errors}")
+                self._requeue({key: pending[key] for key in retry})
+            except Exception as e:
+                logging.error(f"Failed to flush {len(operations)} study status updates: {e}; retrying with the next flush")
+                self._requeue(pending)
+                return
+            finally:
+                with self._lock:
+                    self._writing = {}
+            # One bump per flush: the whole batch becomes visible together
+            bump_data_version(self.database)
+
+    def _requeue(self, failed):
+        """Puts the updates of a failed flush back in front of those submitted since."""
+        with self._lock:
+            for study_key, update in failed.items():
+                newer = self._pending.get(study_key)
+                if newer is not None:
+                    self._merge(update, newer)
+                self._pending[study_key] = update
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=self.interval + 5)
+        self.flush()
+
+def get_status_writer(config):
+    """Returns the shared StatusWriter, creating it on first use. None if MongoDB is unavailable."""
+    global status_writer
+    with _status_writer_lock:
+        if status_writer is None:
+            database = get_db(config)
+            if database is None:
+                return None
+            status_writer = StatusWriter(config, database)
+        return status_writer
+
+def flush_status_updates():
+    """Writes any buffered status transitions now."""
+    if status_writer is not None:
+        status_writer.flush()
+
+def close_status_writer():
+    """Stops the background flush thread and writes whatever is still buffered."""
+    global status_writer
+    with _status_writer_lock:
+        if status_writer is not None:
+            status_writer.close()
+            status_writer = None
+
+def update_study_status(config, study_key, status, error_message=None, dicom_path=None):
+    """Updates the status of a study in the 'studies' collection or creates it."""
+    if config.get("STATUS_BUFFERING", "ON") == "ON":
+        writer = get_status_writer(config)
+        if writer is None:
+            logging.error("Database connection not available. Cannot update study status.")
+            return
+        writer.submit(study_key, status, error_message=error_message, dicom_path=dicom_path)
+        return
+
+    database = get_db(config)
+    if database is None:
+        logging.error("Database connection not available. Cannot update study status.")
+        return
+
+    now = datetime.utcnow()
+    query = {"study_key": study_key}
+    update_fields = _build_status_update(study_key, status, now, error_message=error_message, dicom_path=dicom_path)
 
     try:
         logging.debug(f"Updating study {study_key} status to {status}")
@@ -75,31 +377,189 @@ def update_study_status(config, study_key, status, error_message=None, dicom_pat
         else:
              # This might happen if the status is already set to the target value
              logging.debug(f"No changes needed for study {study_key} status {status}")
+        bump_data_version(database)
 
     except Exception as e:
         logging.error(f"Failed to update status for study {study_key}: {e}")
 
-def save_transcription(config, study_key, report_list, sr_path=None):
-    """Saves the transcription result to the 'transcriptions' collection."""
+def record_study_timings(config, study_key, timings):
+    """Stores a finished study's per-stage timings (StageTimer.as_document()) as 'timings' on its study document."""
+    if config.get("STATUS_BUFFERING", "ON") == "ON":
+        writer = get_status_writer(config)
+        if writer is not None:
+            # Rides along with the next bulk flush instead of costing its own round trip
+            writer.submit_fields(study_key, {"timings": timings})
+            return
+
     database = get_db(config)
-    if not database:
-        logging.error("Database connection not available. Cannot save transcription.")
+    if database is None:
+        logging.error("Database connection not available. Cannot record study timings.")
         return
+    try:
+        database.studies.update_one({"study_key": study_key}, {"$set": {"timings": timings}})
+    except Exception as e:
+        logging.error(f"Failed to record timings for study {study_key}: {e}")
+
+def get_study_status(config, study_key):
+    """Returns the study's current status (buffered transitions are written first), or None."""
+    flush_status_updates()
+    database = get_db(config)
+    if database is None:
+        logging.error("Database connection not available. Cannot read study status.")
+        return None
+    try:
+        study = database.studies.find_one({"study_key": study_key}, projection={"status": True, "_id": False})
+    except Exception as e:
+        logging.error(f"Failed to read status of study {study_key}: {e}")
+        return None
+    return study.get("status") if study else None
+
+def _update_study(config, study_key, update, what):
+    """Applies update to the study document, buffered like status transitions unless STATUS_BUFFERING is OFF."""
+    if config.get("STATUS_BUFFERING", "ON") == "ON":
+        writer = get_status_writer(config)
+        if writer is not None:
+            writer.submit_update(study_key, update)
+            return
+
+    database = get_db(config)
+    if database is None:
+        logging.error(f"Database connection not available. Cannot {what}.")
+        return
+    try:
+        database.studies.update_one({"study_key": study_key}, update, upsert=True)
+    except Exception as e:
+        logging.error(f"Failed to {what} for study {study_key}: {e}")
+
+def get_checkpoints(config, study_key):
+    """Returns the study's stage checkpoints, with its buffered changes applied; {} if there are none or on failure."""
+    # Taken before the read: whatever is written meanwhile is then in both, and applying it twice changes nothing
+    writer = status_writer
+    buffered = writer.pending_update(study_key) if writer is not None else None
+    database = get_db(config)
+    if database is None:
+        logging.error("Database connection not available. Cannot read stage checkpoints.")
+        return {}
+    try:
+        study = database.studies.find_one({"study_key": study_key}, projection={"checkpoints": True, "_id": False})
+    except Exception as e:
+        logging.error(f"Failed to read stage checkpoints of study {study_key}: {e}")
+        return {}
+    checkpoints = dict((study or {}).get("checkpoints") or {})
+    for field, value in (buffered or {}).get("$set", {}).items():
+        if field.startswith("checkpoints."):
+            checkpoints[field[len("checkpoints."):]] = value
+    for field in (buffered or {}).get("$unset", {}):
+        if field.startswith("checkpoints."):
+            checkpoints.pop(field[len("checkpoints."):], None)
+    return checkpoints
+
+def set_checkpoint(config, study_key, name, fields, clear=()):
+    """Records checkpoint `name` (fields plus a timestamp) on the study and removes the checkpoints named in clear."""
+    update = {"$set": {f"checkpoints.{name}": dict(fields, at=datetime.utcnow())}}
+    if clear:
+        update["$unset"] = {f"checkpoints.{other}": "" for other in clear}
+    _update_study(config, study_key, update, f"record the {name} checkpoint")
+
+def clear_checkpoints(config, study_key, names):
+    """Removes the named checkpoints from the study."""
+    _update_study(config, study_key, {"$unset": {f"checkpoints.{name}": "" for name in names}}, "clear stage checkpoints")
+
+def get_transcription(config, transcription_id):
+    """Returns the transcription document with this _id, or None."""
+    database = get_db(config)
+    if database is None:
+        logging.error("Database connection not available. Cannot read transcription.")
+        return None
+    try:
+        return database.transcriptions.find_one({"_id": transcription_id})
+    except Exception as e:
+        logging.error(f"Failed to read transcription {transcription_id}: {e}")
+        return None
+
+def begin_attempt(config, study_key):
+    """
+    Starts a new processing attempt for a study.
+
+    Returns:
+        int: The attempt number (1 for the first run), or None if the database is unavailable.
+    """
+    database = get_db(config)
+    if database is None:
+        logging.error("Database connection not available. Cannot start processing attempt.")
+        return None
 
     now = datetime.utcnow()
-    document = {
-        "study_key": study_key,
-        "report_text": report_list,
-        "transcription_timestamp": now
+    try:
+        study = database.studies.find_one_and_update(
+            {"study_key": study_key},
+            {"$inc": {"attempts": 1}, "$setOnInsert": {"received_timestamp": now, "last_updated_timestamp": now}},
+            projection={"attempts": True, "_id": False},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        logging.debug(f"Starting attempt {study['attempts']} for study {study_key}")
+        return study["attempts"]
+    except Exception as e:
+        logging.error(f"Failed to start processing attempt for study {study_key}: {e}")
+        return None
+
+def save_transcription(config, study_key, transcription_dict, attempt=None, model=None, prompt_version=None, audio_hash=None):
+    """
+    Saves the transcription result to the 'transcriptions' collection.
+
+    There is one document per study and attempt; calling this again for the same
+    attempt updates that document in place.
+
+    Returns:
+        ObjectId: The transcription document's _id, or None on failure.
+    """
+    database = get_db(config)
+    if database is None:
+        logging.error("Database connection not available. Cannot save transcription.")
+        return None
+
+    now = datetime.utcnow()
+    fields = {
+        "reading": transcription_dict.get("Reading", ""),
+        "conclusion": transcription_dict.get("Conclusion", ""),
+        "model": model,
+        "prompt_version": prompt_version,
+        "audio_hash": audio_hash,
+        "transcription_timestamp": now,
     }
-    if sr_path:
-        document["sr_path"] = sr_path
 
     try:
-        logging.debug(f"Saving transcription for study {study_key}")
-        result = database.transcriptions.insert_one(document)
-        logging.info(f"Transcription saved for study {study_key} with ID: {result.inserted_id}")
+        logging.debug(f"Saving transcription for study {study_key} (attempt {attempt})")
+        document = database.transcriptions.find_one_and_update(
+            {"study_key": study_key, "attempt": attempt},
+            {"$set": fields},
+            projection={"_id": True},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        logging.info(f"Transcription saved for study {study_key} with ID: {document['_id']}")
+        bump_data_version(database)
+        return document["_id"]
     except Exception as e:
         logging.error(f"Failed to save transcription for study {study_key}: {e}")
+        return None
+
+def set_transcription_sr_path(config, study_key, attempt, sr_path):
+    """Records the generated SR's location on the attempt's transcription document."""
+    database = get_db(config)
+    if database is None:
+        logging.error("Database connection not available. Cannot record SR path.")
+        return
+
+    try:
+        result = database.transcriptions.update_one({"study_key": study_key, "attempt": attempt}, {"$set": {"sr_path": sr_path}})
+        if result.matched_count:
+            logging.info(f"SR path recorded for study {study_key}: {sr_path}")
+            bump_data_version(database)
+        else:
+            logging.warning(f"No transcription found for study {study_key} attempt {attempt}; SR path not recorded.")
+    except Exception as e:
+        logging.error(f"Failed to record SR path for study {study_key}: {e}")
 
 # Consider adding functions for querying data if needed by the core service itself 
\ No newline at end of file
@@ -0,0 +1,194 @@
+import argparse
+import logging
+import os
+import queue
+import threading
+
+from pydicom.uid import ExplicitVRLittleEndian, ImplicitVRLittleEndian
+
+# C-STORE status codes that mean the SCP kept the object (success plus the storage warnings).
+_STORED_STATUSES = (0x0000, 0xB000, 0xB006, 0xB007)
+
+# Global sink reused across studies so the associations in its pool stay open between calls.
+_sink = None
+_sink_lock = threading.Lock()
+
+
+class DicomStoreSink:
+    """
+    Sends SR datasets to a PACS/SCP via C-STORE over a pool of reused associations.
+
+    Associations are opened lazily, returned to the pool after each send and only
+    released on close() or when the SCP aborts them, so consecutive SRs travel over
+    the same association. If it has dropped, it is re-established once and the SR
+    resent. pynetdicom is only imported here, so it is not needed with SR_CSTORE off.
+    """
+
+    def __init__(self, config):
+        from pynetdicom import AE
+        from pynetdicom.sop_class import BasicTextSRStorage, ComprehensiveSRStorage, EnhancedSRStorage
+        self.config = config
+        self.logger = logging.getLogger('detailed')
+        self.host = config.get("SR_CSTORE_HOST", "127.0.0.1")
+        self.port = int(config.get("SR_CSTORE_PORT", 104))
+        self.called_ae = config.get("SR_CSTORE_CALLED_AE", "ANY-SCP")
+        self.calling_ae = config.get("SR_CSTORE_CALLING_AE", "PG_TRANSCRIBER")
+        self.pool_size = max(1, int(config.get("SR_CSTORE_POOL_SIZE", 2)))
+
+        self.ae = AE(ae_title=self.calling_ae)
+        self.ae.acse_timeout = config.get("SR_CSTORE_TIMEOUT_SECONDS", 30)
+        self.ae.dimse_timeout = config.get("SR_CSTORE_TIMEOUT_SECONDS", 30)
+        self.ae.network_timeout = config.get("SR_CSTORE_TIMEOUT_SECONDS", 30)
+        for sop_class in (EnhancedSRStorage, BasicTextSRStorage, ComprehensiveSRStorage):
+            self.ae.add_requested_context(sop_class, [ExplicitVRLittleEndian, ImplicitVRLittleEndian])
+
+        # Idle associations ready for reuse; the semaphore caps how many exist at once.
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.pool_size)
+        self._closed = False
+
+    def describe(self):
+        return f"{self.called_ae}@{self.host}:{self.port}"
+
+    def _open(self):
+        self.logger.info(f"Opening C-STORE association to {self.describe()}")
+        assoc = self.ae.associate(self.host, self.port, ae_title=self.called_ae)
+        if not assoc.is_established:
+            self.logger.error(f"Association to {self.describe()} was rejected, aborted or never connected.")
+            return None
+        return assoc
+
+    def _acquire(self):
+        """Takes a pool slot and returns an established association, or None if none could be opened."""
+        self._slots.acquire()
+        while True:
+            try:
+                assoc = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if assoc.is_established:
+                return assoc
+            self.logger.debug(f"Discarding stale association to {self.describe()}")
+        try:
+            return self._open()
+        except Exception:
+            self._slots.release() # No association to hand back later
+            raise
+
+    def _release(self, assoc):
+        if assoc is not None and assoc.is_established and not self._closed:
+            self._idle.put(assoc)
+        elif assoc is not None and assoc.is_established:
+            assoc.release()
+        self._slots.release()
+
+    def _send_one(self, assoc, ds):
+        """Returns True if stored, False if the SCP refused it, None if the association was lost."""
+        try:
+            status = assoc.send_c_store(ds)
+        except (RuntimeError, ValueError) as e:
+            # Raised when the association is gone or no presentation context matches the dataset.
+            self.logger.error(f"C-STORE of {ds.get('SOPInstanceUID', '?')} failed: {e}")
+            return None if not assoc.is_established else False
+        if not status or 'Status' not in status:
+            # An empty status means the SCP aborted or the DIMSE response timed out.
+            return None
+        if status.Status in _STORED_STATUSES:
+            return True
+        self.logger.error(f"C-STORE of {ds.get('SOPInstanceUID', '?')} refused by {self.describe()} with status 0x{status.Status:04X}")
+        return False
+
+    def store(self, ds):
+        """Sends one dataset over a pooled association. Returns True if the SCP stored it."""
+        reconnected = False
+        assoc = self._acquire()
+        try:
+            while assoc is not None:
+                outcome = self._send_one(assoc, ds)
+                if outcome is not None:
+                    return outcome
+                # Association dropped; re-establish once and resend.
+                assoc.abort()
+                if reconnected:
+                    break
+                self.logger.warning(f"Association to {self.describe()} lost, reconnecting.")
+                reconnected = True
+                assoc = self._open()
+            return False
+        finally:
+            self._release(assoc)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                assoc = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if assoc.is_established:
+                assoc.release()
+        self.logger.info(f"C-STORE association pool to {self.describe()} closed.")
+
+
+def get_sink(config):
+    """Returns the shared DicomStoreSink, creating it on first use."""
+    global _sink
+    with _sink_lock:
+        if _sink is None:
+            _sink = DicomStoreSink(config)
+        return _sink
+
+
+def close_sink():
+    global _sink
+    with _sink_lock:
+        if _sink is not None:
+            _sink.close()
+            _sink = None
+
+
+def start_local_storage_scp(port=11112, ae_title="LOCAL_SCP", output_dir=None, received=None):
+    """
+    Starts a local storage SCP in a background thread, as a stand-in for the PACS.
+
+    Args:
+        port (int): Port to listen on.
+        ae_title (str): AE title the SCP answers to.
+        output_dir (str, optional): Folder to write received objects to.
+        received (list, optional): If given, each received dataset is appended to it.
+
+    Returns:
+        The pynetdicom server; call shutdown() on it to stop.
+    """
+    from pynetdicom import AE, evt, StoragePresentationContexts
+
+    def handle_store(event):
+        ds = event.dataset
+        ds.file_meta = event.file_meta
+        if received is not None:
+            received.append(ds)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+            ds.save_as(os.path.join(output_dir, f"{ds.SOPInstanceUID}.dcm"), enforce_file_format=True)
+        return 0x0000
+
+    ae = AE(ae_title=ae_title)
+    ae.supported_contexts = StoragePresentationContexts
+    logging.info(f"Starting local storage SCP {ae_title} on port {port}")
+    return ae.start_server(("127.0.0.1", port), block=False, evt_handlers=[(evt.EVT_C_STORE, handle_store)])
+
+
+if __name__ == '__main__':
+    # Local stand-in for the PACS: python -m modules.dicom_store --port 11112 --output-dir received_sr
+    parser = argparse.ArgumentParser(description="Run a local storage SCP that accepts C-STORE requests.")
+    parser.add_argument("--port", type=int, default=11112)
+    parser.add_argument("--ae-title", default="LOCAL_SCP")
+    parser.add_argument("--output-dir", default="received_sr")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = start_local_storage_scp(args.port, args.ae_title, args.output_dir)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
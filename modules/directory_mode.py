@@ -0,0 +1,332 @@
+import fnmatch
+import logging
+import os
+import queue
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from . import database_operations as db_ops
+from . import dicom_store
+from . import smb_connect
+from .encapsulate_text_as_enhanced_sr import EncapsulateTextAsEnhancedSR
+from .extract_audio import ExtractAudio, audio_hash
+from .logger_config import log_context
+from .processing_worker import deliver_sr
+from .stage_timer import StageTimer
+from .transcribe import Transcribe, PROMPT_VERSION
+from . import metrics, tracing
+
+OUTPUTS = ("mongo", "sr", "both")
+
+# Final index states: such files are skipped on later runs. Anything else ("error") is retried.
+DONE = "done"
+NOT_AUDIO = "not_audio"
+
+_INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    content_hash TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    study_key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    sr_path TEXT,
+    finished TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_path ON files (path);
+"""
+
+
+def is_dicom(path):
+    """True if the file has the DICOM Part 10 preamble and 'DICM' prefix."""
+    try:
+        with open(path, 'rb') as file:
+            return file.read(132)[128:] == b"DICM"
+    except OSError:
+        return False
+
+
+class DirectoryIndex:
+    """
+    Processed-marker index (SQLite) keyed by the DICOM file's content hash.
+
+    A file whose path, size and modification time match a finished entry is skipped
+    without being read; a moved or copied file is recognised by its hash, and a hash
+    being processed is claimed so identical files are not transcribed at the same time.
+    Lookups go to disk, so memory does not grow with the number of files.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._claimed = set() # Content hashes a worker is processing right now
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(_INDEX_SCHEMA)
+
+    def is_unchanged_and_done(self, path, size, mtime_ns):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT 1 FROM files WHERE path = ? AND size = ? AND mtime_ns = ? AND status IN (?, ?)",
+                (path, size, mtime_ns, DONE, NOT_AUDIO),
+            ).fetchone()
+        return row is not None
+
+    def claim(self, content_hash):
+        """Claims a content hash for processing. False if it is finished or another worker holds it."""
+        with self._lock:
+            if content_hash in self._claimed:
+                return False
+            row = self._connection.execute(
+                "SELECT 1 FROM files WHERE content_hash = ? AND status IN (?, ?)", (content_hash, DONE, NOT_AUDIO)
+            ).fetchone()
+            if row is not None:
+                return False
+            self._claimed.add(content_hash)
+            return True
+
+    def release(self, content_hash):
+        with self._lock:
+            self._claimed.discard(content_hash)
+
+    def record(self, content_hash, path, size, mtime_ns, study_key, status, sr_path=None):
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (content_hash, path, size, mtime_ns, study_key, status, sr_path, datetime.now().isoformat(timespec="seconds")),
+            )
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+def walk_files(root, pattern="*"):
+    """Yields the files under root matching pattern, one directory listing in memory at a time."""
+    for directory, subdirectories, filenames in os.walk(root):
+        subdirectories.sort()
+        for filename in sorted(filenames):
+            if fnmatch.fnmatch(filename, pattern):
+                yield os.path.join(directory, filename)
+
+
+class _Counters:
+    """Running totals, logged every `interval` seconds and at the end."""
+
+    def __init__(self, interval=30):
+        self.counts = {"scanned": 0, "skipped": 0, "listed": 0, "done": 0, "failed": 0, "not_audio": 0}
+        self.interval = interval
+        self.start = self._last_report = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, name):
+        with self._lock:
+            self.counts[name] += 1
+            now = time.monotonic()
+            if now - self._last_report < self.interval:
+                return
+            self._last_report = now
+        self.report()
+
+    def report(self, prefix="Directory progress"):
+        with self._lock:
+            counts = dict(self.counts)
+            elapsed = time.monotonic() - self.start
+        processed = counts["done"] + counts["failed"]
+        rate = processed / elapsed * 3600 if elapsed else 0
+        listed = f"{counts['listed']} to process, " if counts["listed"] else ""
+        logging.info(f"{prefix}: {counts['scanned']} files scanned, {counts['skipped']} already done, {listed}"
+                     f"{counts['done']} transcribed, {counts['failed']} failed, {counts['not_audio']} without audio "
+                     f"({rate:.0f} files/hour)")
+
+
+class DirectoryWorker:
+    """One worker thread's pipeline objects; the Gemini model and extractor are reused between files."""
+
+    def __init__(self, config, root, output, sr_root, work_dir):
+        self.config = config
+        self.root = root
+        self.to_mongo = output in ("mongo", "both")
+        self.to_sr = output in ("sr", "both")
+        self.sr_root = sr_root
+        self.work_dir = work_dir
+        self.extractor = ExtractAudio(config)
+        self.transcriber = Transcribe(config)
+        self.logger = logging.getLogger('detailed')
+
+    def _status(self, study_key, status, **kwargs):
+        if self.to_mongo:
+            db_ops.update_study_status(self.config, study_key, status, **kwargs)
+
+    def process_file(self, path, study_key):
+        """Transcribes one file; returns (index status, SR path or None)."""
+        # A name of its own per file, so no other worker can write or delete this WAV
+        handle, wav_path = tempfile.mkstemp(prefix=f"{study_key}-", suffix=".wav", dir=self.work_dir)
+        os.close(handle)
+        try:
+            return self._process_file(path, study_key, wav_path)
+        finally:
+            # Whatever the outcome, including files without audio: the work folder may be kept between runs
+            if os.path.exists(wav_path):
+                os.remove(wav_path)
+
+    def _process_file(self, path, study_key, wav_path):
+        timer = StageTimer(study_key)
+        try:
+            self.extractor.extract_audio(path, timer=timer, wav_path=wav_path)
+        except AttributeError as e:
+            # A DICOM without a waveform (e.g. an image in the same archive): nothing to transcribe,
+            # and no study document is created for it
+            self.logger.info(f"Skipping {path}: {e}")
+            return NOT_AUDIO, None
+        except Exception as e:
+            self.logger.error(f"Audio extraction failed for {path}: {e}")
+            return "error", None
+
+        attempt = db_ops.begin_attempt(self.config, study_key) if self.to_mongo else None
+        self._status(study_key, "transcribing", dicom_path=path)
+        metrics.STUDIES_STARTED.inc()
+        metrics.IN_FLIGHT.inc()
+        try:
+            transcription = self.transcriber.transcribe(path, wav_path, timer=timer)
+            if not transcription or not isinstance(transcription, dict):
+                self._status(study_key, "error", error_message="No transcription generated or transcription failed")
+                return "error", None
+
+            if self.to_mongo:
+                with timer.stage("mongo_save"):
+                    db_ops.save_transcription(self.config, study_key, transcription, attempt=attempt,
+                                              model=self.config.get("MODEL_NAME"), prompt_version=PROMPT_VERSION,
+                                              audio_hash=audio_hash(wav_path))
+                self._status(study_key, "processing_complete")
+
+            sr_path = None
+            if self.to_sr:
+                # The SR tree mirrors the input tree, so equal file names in different folders do not collide
+                relative = os.path.relpath(os.path.dirname(path), self.root)
+                sr_config = dict(self.config, SR_OUTPUT_FOLDER=os.path.normpath(os.path.join(self.sr_root, relative)))
+                with timer.stage("sr"):
+                    sr_path = deliver_sr(sr_config, EncapsulateTextAsEnhancedSR(sr_config), transcription, path)
+                if not sr_path:
+                    self._status(study_key, "error", error_message="SR encapsulation failed (returned None)")
+                    return "error", None
+                if self.to_mongo:
+                    db_ops.set_transcription_sr_path(self.config, study_key, attempt, sr_path)
+                    self._status(study_key, "processing_complete_sr")
+            return DONE, sr_path
+        except Exception as e:
+            self.logger.error(f"Pipeline error for file {path}: {e}", exc_info=True)
+            self._status(study_key, "error", error_message=f"Pipeline failed: {str(e)[:200]}")
+            return "error", None
+        finally:
+            metrics.IN_FLIGHT.dec()
+            if self.to_mongo:
+                db_ops.record_study_timings(self.config, study_key, timer.as_document())
+
+
+def _worker_loop(worker, paths, index, counters, dry_run):
+    while True:
+        item = paths.get()
+        if item is None:
+            return
+        path, stat = item
+        content_hash = None
+        try:
+            content_hash = audio_hash(path) # SHA-256 of the whole DICOM, read in chunks
+            if not index.claim(content_hash):
+                # Finished, or an identical file is being processed by another worker
+                content_hash = None
+                counters.add("skipped")
+                continue
+            # Files have no RIS study key; the content hash identifies them in MongoDB instead
+            study_key = f"file-{content_hash[:16]}"
+            if dry_run:
+                print(f"{study_key}\t{path}", flush=True)
+                counters.add("listed")
+                continue
+            with tracing.trace(study_key), log_context(study_key=study_key):
+                status, sr_path = worker.process_file(path, study_key)
+            index.record(content_hash, path, stat.st_size, stat.st_mtime_ns, study_key, status, sr_path)
+            counters.add("done" if status == DONE else "not_audio" if status == NOT_AUDIO else "failed")
+        except Exception as e:
+            logging.error(f"Failed to process {path}: {e}", exc_info=True)
+            counters.add("failed")
+        finally:
+            if content_hash is not None:
+                index.release(content_hash)
+
+
+def run_directory(config, root, output="mongo", workers=4, index_path="directory_index.sqlite",
+                  pattern="*", sr_root=None, work_dir=None, dry_run=False):
+    """
+    Transcribes every DICOM dictation under root without the RIS.
+
+    Paths are streamed from the directory walk through a bounded queue to `workers`
+    threads, so memory stays flat however large the tree is. Results go to MongoDB
+    (study key "file-<hash prefix>") and/or Enhanced SRs under sr_root, mirroring the
+    input tree. Finished files are recorded in the index and skipped on later runs.
+    A dry run only lists the files that would be processed.
+    Returns the final counts.
+    """
+    if output not in OUTPUTS:
+        raise ValueError(f"output must be one of {', '.join(OUTPUTS)}")
+    root = os.path.abspath(root)
+    sr_root = sr_root or config.get("SR_OUTPUT_FOLDER", "sr_output")
+    temporary_work_dir = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix="pg_transcriber_")
+    os.makedirs(work_dir, exist_ok=True)
+    index = DirectoryIndex(index_path)
+    counters = _Counters()
+    paths = queue.Queue(maxsize=max(1, workers) * 2)
+    logging.info(f"{'Listing' if dry_run else 'Transcribing'} DICOM files under {root} with {workers} workers "
+                 f"(output: {output}, index: {index_path})")
+
+    threads = []
+    for number in range(max(1, workers)):
+        worker = None if dry_run else DirectoryWorker(config, root, output, sr_root, work_dir)
+        thread = threading.Thread(target=_worker_loop, args=(worker, paths, index, counters, dry_run),
+                                  name=f"directory-{number}", daemon=True)
+        thread.start()
+        threads.append(thread)
+    try:
+        for path in walk_files(root, pattern):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue # Removed since the directory was listed
+            # Checked before anything is read, so unchanged finished files cost one stat and one lookup
+            if index.is_unchanged_and_done(path, stat.st_size, stat.st_mtime_ns):
+                counters.add("scanned")
+                counters.add("skipped")
+                continue
+            if not is_dicom(path):
+                continue
+            counters.add("scanned")
+            paths.put((path, stat)) # Blocks while the workers are busy: the walk never runs far ahead
+    except KeyboardInterrupt:
+        logging.warning("Directory run interrupted: finishing the files in progress; rerun to continue.")
+        while True:
+            try:
+                paths.get_nowait()
+            except queue.Empty:
+                break
+        raise
+    finally:
+        for _ in threads:
+            paths.put(None)
+        for thread in threads:
+            thread.join()
+        index.close()
+        if temporary_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        if not dry_run:
+            dicom_store.close_sink() # Release any pooled C-STORE associations
+            smb_connect.close_backend() # Close any pooled SMB sessions
+            db_ops.close_status_writer() # Write any buffered status transitions
+        counters.report("Directory run finished")
+    return counters.counts
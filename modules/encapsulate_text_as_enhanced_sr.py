@@ -4,17 +4,27 @@ from datetime import datetime
 import os
 import logging
 import traceback
+from . import smb_connect
 
 class EncapsulateTextAsEnhancedSR:
     def __init__(self, config):
         self.config = config
         self.sr_output_folder = config["SR_OUTPUT_FOLDER"]
+        self.storage = smb_connect.get_backend(config)
         self.logger = logging.getLogger('detailed')
 
     def encapsulate_text_as_enhanced_sr(self, report_list, original_dcm_path):
+        """Builds the Enhanced SR and saves it to SR_OUTPUT_FOLDER. Returns the saved path or None."""
+        sr_ds = self.build_sr_dataset(report_list, original_dcm_path)
+        if sr_ds is None:
+            return None
+        return self.save_sr_dataset(sr_ds)
+
+    def build_sr_dataset(self, report_list, original_dcm_path):
+        """Builds the Enhanced SR dataset in memory without writing it. Returns the dataset or None."""
         self.logger.info(f"Attempting to encapsulate text as Enhanced SR for DICOM file: {original_dcm_path}")
         try:
-            ds = pydicom.dcmread(original_dcm_path)
+            ds = pydicom.dcmread(self.storage.readable(original_dcm_path))
         except Exception as e:
             self.logger.error(f"Failed to read original DICOM file {original_dcm_path}: {e}")
             return None
@@ -28,13 +38,8 @@ class EncapsulateTextAsEnhancedSR:
         # file_meta.FileMetaInformationGroupLength = 204 # Often calculated automatically
 
         # **Create SR Dataset**
-        basename = os.path.basename(original_dcm_path).replace(".dcm", "_SR.dcm")
+        basename = smb_connect.basename(original_dcm_path).replace(".dcm", "_SR.dcm")
         sr_filename = os.path.join(self.sr_output_folder, basename)
-        try:
-            os.makedirs(self.sr_output_folder, exist_ok=True)
-        except OSError as e:
-            self.logger.error(f"Failed to create output directory {self.sr_output_folder}: {e}")
-            return None
 
         sr_ds = FileDataset(sr_filename, {}, file_meta=file_meta, preamble=b"\0" * 128)
 
@@ -81,6 +86,9 @@ class EncapsulateTextAsEnhancedSR:
 
         # **Build Content Sequence from report_list**
         content_items = []
+        if isinstance(report_list, dict):
+            # The pipeline passes the transcription dict directly; treat it as a single section.
+            report_list = [report_list]
         if not isinstance(report_list, list):
             self.logger.error(f"Expected report_list to be a list, but got {type(report_list)}")
             return None
@@ -137,14 +145,23 @@ class EncapsulateTextAsEnhancedSR:
         # Assign root container to the main dataset's ContentSequence
         sr_ds.ContentSequence = [root_container]
 
-        # **Ensure Correct Endianness and VR**
-        sr_ds.is_little_endian = True
-        sr_ds.is_implicit_VR = False
+        # Encoded as file_meta.TransferSyntaxUID (Explicit VR Little Endian) when saved or sent
+
+        return sr_ds
+
+    def save_sr_dataset(self, sr_ds):
+        """Writes a dataset from build_sr_dataset to SR_OUTPUT_FOLDER. Returns the saved path or None."""
+        sr_filename = sr_ds.filename
+        try:
+            os.makedirs(self.sr_output_folder, exist_ok=True)
+        except OSError as e:
+            self.logger.error(f"Failed to create output directory {self.sr_output_folder}: {e}")
+            return None
 
         # Save file
         try:
             # Explicitly use Little Endian Explicit VR
-            sr_ds.save_as(sr_filename, write_like_original=False)
+            sr_ds.save_as(sr_filename, enforce_file_format=True)
             self.logger.info(f"Enhanced SR saved successfully to: {sr_filename}")
             return sr_filename
         except Exception as e:
@@ -1,25 +1,45 @@
 import pydicom
 import numpy as np
 from scipy.io.wavfile import write
+import hashlib
 import time
 import os
 import logging
+import tempfile
+from . import smb_connect
+from .stage_timer import NULL_TIMER
+
+def audio_hash(path, chunk_size=1024 * 1024):
+    """Returns the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
 
 class ExtractAudio:
     def __init__(self, config):
         self.config = config
+        self.storage = smb_connect.get_backend(config) # How DICOM paths are read (local disk, Windows share, SMB client)
         self.logger = logging.getLogger('detailed')
 
-    def extract_audio(self, dcm_path):
+    def extract_audio(self, dcm_path, timer=NULL_TIMER, wav_path=None):
+        """
+        Writes the dictation of dcm_path as a WAV file and returns its path.
+
+        By default the WAV is written next to the DICOM (same name, .wav), or to the
+        temporary folder when the storage backend reads the DICOM without an OS path;
+        pass wav_path to write it elsewhere, e.g. when the DICOM folder is read-only.
+        """
         self.logger.info(f"Extracting audio from DICOM file: {dcm_path}")
 
         # Check if the file exists before proceeding.
-        if not os.path.exists(dcm_path):
+        if not self.storage.exists(dcm_path):
             self.logger.error(f"File does not exist: {dcm_path}")
             raise FileNotFoundError(f"File does not exist: {dcm_path}")
 
         # On Windows, apply the long path prefix if needed.
-        if os.name == 'nt' and len(dcm_path) > 260:
+        if os.name == 'nt' and len(dcm_path) > 260 and self.storage.local_path(dcm_path) == dcm_path:
             self.logger.debug("Applying long path prefix for Windows")
             dcm_path = r"\\?\{}".format(dcm_path)
 
@@ -27,7 +47,9 @@ class ExtractAudio:
         ds = None
         for attempt in range(retries):
             try:
-                ds = pydicom.dcmread(dcm_path)
+                with timer.stage("dicom_read"):
+                    ds = pydicom.dcmread(self.storage.readable(dcm_path))
+                timer.add_bytes("dicom_read", self.storage.getsize(dcm_path))
                 self.logger.info(f"DICOM file read successfully on attempt {attempt + 1}")
                 break  # Exit loop on success.
             except FileNotFoundError as e:
@@ -82,6 +104,7 @@ class ExtractAudio:
         if 'WaveformBitsAllocated' not in waveform:
              self.logger.warning("WaveformBitsAllocated tag not found. Assuming 16-bit audio (int16).")
 
+        decode_started = time.perf_counter()
         audio_data = np.frombuffer(waveform.WaveformData, dtype=dtype)
 
         # Check number of channels
@@ -96,9 +119,18 @@ class ExtractAudio:
             raise AttributeError("Sampling frequency not found in the waveform data.")
 
         try:
-            # Generate the output WAV path.
-            wav_path = dcm_path.replace(".dcm", ".wav")
+            # Generate the output WAV path; files without a .dcm extension get .wav appended
+            # rather than being overwritten.
+            if wav_path is None:
+                local_dcm_path = self.storage.local_path(dcm_path)
+                if local_dcm_path is None:
+                    handle, wav_path = tempfile.mkstemp(prefix="pg_transcriber_", suffix=".wav")
+                    os.close(handle)
+                else:
+                    root, extension = os.path.splitext(local_dcm_path)
+                    wav_path = (root if extension.lower() == ".dcm" else local_dcm_path) + ".wav"
             write(wav_path, int(waveform.SamplingFrequency), audio_data)
+            timer.record("audio_decode", time.perf_counter() - decode_started, audio_data.nbytes)
             self.logger.info(f"Audio extracted and saved to: {wav_path}")
         except Exception as e:
             self.logger.error(f"Failed to write WAV file: {e}")
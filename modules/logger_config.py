@@ -1,34 +1,155 @@
+import atexit
+import copy
+import json
 import logging
-from logging.handlers import RotatingFileHandler
-import yaml
+import queue
 import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
-def setup_logging(config_path='config.yaml', log_file='app.log'):
-    with open(config_path, 'r') as file:
-        config = yaml.safe_load(file)
-    
-    log_levels = config.get('LOGGING_LEVELS', {})
-    basic_level = getattr(logging, log_levels.get('basic', 'INFO').upper(), logging.INFO)
-    detailed_level = getattr(logging, log_levels.get('detailed', 'DEBUG').upper(), logging.DEBUG)
-    error_level = getattr(logging, log_levels.get('error', 'ERROR').upper(), logging.ERROR)
-    
-    log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    
-    file_handler = RotatingFileHandler(log_file, maxBytes=5*1024*1024, backupCount=2, encoding='utf-8')
-    file_handler.setFormatter(log_formatter)
-    
-    stream_handler = logging.StreamHandler(sys.stdout)
-    stream_handler.setFormatter(log_formatter)
-    stream_handler.encoding = 'utf-8'
-    
-    root_logger = logging.getLogger()
-    if root_logger.hasHandlers():
-        root_logger.handlers.clear()
-
-    logging.basicConfig(
-        level=basic_level,
-        handlers=[file_handler, stream_handler]
-    )
-    
-    logging.getLogger('detailed').setLevel(detailed_level)
-    logging.getLogger('error').setLevel(error_level)
\ No newline at end of file
+from .config import get_config
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Global listener that writes queued records to the file and console, started by setup_logging
+_listener = None
+_setup_lock = threading.Lock()
+
+# Per-thread fields (study_key, stage) added to every record logged by that thread
+_context = threading.local()
+
+
+def _current_context():
+    fields = getattr(_context, "fields", None)
+    if fields is None:
+        fields = _context.fields = {}
+    return fields
+
+
+@contextmanager
+def log_context(**fields):
+    """Adds fields (e.g. study_key, stage) to the records logged by this thread inside the block."""
+    current = _current_context()
+    previous = dict(current)
+    current.update(fields)
+    try:
+        yield
+    finally:
+        _context.fields = previous
+
+
+class _ContextQueueHandler(QueueHandler):
+    """
+    Hands records to the listener thread. Runs in the logging thread, so it stamps the
+    thread's log_context fields on the record and renders message and traceback here;
+    everything after that (formatting, console and file I/O) happens on the listener.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        for name, value in _current_context().items():
+            setattr(record, name, value)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        if record.stack_info:
+            record.stack_info = str(record.stack_info)
+        return record
+
+    def enqueue(self, record):
+        # The queue is unbounded: a put never blocks the pipeline
+        self.queue.put_nowait(record)
+
+
+class _TextFormatter(logging.Formatter):
+    """The classic log line, with [study stage] after the logger name when the record has them."""
+
+    def format(self, record):
+        text = super().format(record)
+        study_key, stage = getattr(record, "study_key", None), getattr(record, "stage", None)
+        if study_key is None and stage is None:
+            return text
+        tag = " ".join(str(value) for value in (study_key, stage) if value is not None)
+        return text.replace(f" - {record.name} - ", f" - {record.name} [{tag}] - ", 1)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, thread, plus study_key/stage/exception when present."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for field in ("study_key", "stage"):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(config_path='config.yaml', log_file='app.log', config=None):
+    """
+    Configures logging once per process; later calls do nothing.
+
+    Loggers only put records on a queue; a listener thread writes them to log_file
+    (rotating) and stdout. LOG_FORMAT "json" writes JSON lines instead of text.
+    Without a config, the process-wide config (modules.config) is used.
+    """
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+        if config is None:
+            config = get_config(config_path)
+
+        log_levels = config.get('LOGGING_LEVELS', {})
+        basic_level = getattr(logging, log_levels.get('basic', 'INFO').upper(), logging.INFO)
+        detailed_level = getattr(logging, log_levels.get('detailed', 'DEBUG').upper(), logging.DEBUG)
+        error_level = getattr(logging, log_levels.get('error', 'ERROR').upper(), logging.ERROR)
+
+        if str(config.get('LOG_FORMAT', 'text')).lower() == 'json':
+            log_formatter = JsonFormatter()
+        else:
+            log_formatter = _TextFormatter(TEXT_FORMAT)
+
+        file_handler = RotatingFileHandler(log_file, maxBytes=5*1024*1024, backupCount=2, encoding='utf-8')
+        file_handler.setFormatter(log_formatter)
+
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(log_formatter)
+        stream_handler.encoding = 'utf-8'
+
+        root_logger = logging.getLogger()
+        if root_logger.hasHandlers():
+            root_logger.handlers.clear()
+
+        log_queue = queue.SimpleQueue()
+        root_logger.addHandler(_ContextQueueHandler(log_queue))
+        root_logger.setLevel(basic_level)
+        _listener = QueueListener(log_queue, file_handler, stream_handler)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+        logging.getLogger('detailed').setLevel(detailed_level)
+        logging.getLogger('error').setLevel(error_level)
+
+
+def shutdown_logging():
+    """Writes out queued records and stops the listener thread."""
+    global _listener
+    with _setup_lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
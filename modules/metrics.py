@@ -0,0 +1,270 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from pymongo import monitoring
+
+from . import stage_timer
+
+# Latency buckets in seconds: pipeline stages run from milliseconds (Mongo save) to minutes (generation)
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+CALL_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_registry = []
+_installed = False
+
+# Global HTTP server, started by start_metrics_server
+_server = None
+
+
+class _Metric:
+    """
+    Base for the metric types: one value per label combination, guarded by a lock.
+
+    An update is a dict lookup and an addition under an uncontended lock, cheap enough
+    for the per-study hot path; nothing is formatted until /metrics is scraped.
+    """
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(label, "")) for label in self.labelnames)
+
+    def _labels_text(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ""
+        escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+        return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{self._labels_text(key)} {value}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=STAGE_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Per-bucket (non-cumulative) counts, then sum and count
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][index] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = [(key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items()]
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{self._labels_text(key, [('le', f'{bound:g}')])} {cumulative}")
+            lines.append(f"{self.name}_bucket{self._labels_text(key, [('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_sum{self._labels_text(key)} {total}")
+            lines.append(f"{self.name}_count{self._labels_text(key)} {count}")
+        return lines
+
+
+# --- Service metrics ---
+BACKLOG = Gauge("transcriber_backlog_studies", "Studies waiting for transcription (STUDYSTAT 3010) at the last Oracle poll.")
+IN_FLIGHT = Gauge("transcriber_in_flight_studies", "Studies currently being processed.")
+STUDIES_STARTED = Counter("transcriber_studies_started_total", "Processing runs started.")
+STUDY_RETRIES = Counter("transcriber_study_retries_total", "Processing runs that were a repeat attempt for the study (attempt > 1).")
+STAGE_SECONDS = Histogram("transcriber_stage_seconds", "Wall time per pipeline stage.", ["stage"], STAGE_BUCKETS)
+STAGE_BYTES = Counter("transcriber_stage_bytes_total", "Bytes handled per pipeline stage (stage=\"upload\": audio uploaded to Gemini).", ["stage"])
+GEMINI_ERRORS = Counter("transcriber_gemini_errors_total", "Failed Gemini calls by operation and error type.", ["operation", "error"])
+ORACLE_SECONDS = Histogram("transcriber_oracle_query_seconds", "Oracle round trips by query.", ["query"], CALL_BUCKETS)
+ORACLE_ERRORS = Counter("transcriber_oracle_errors_total", "Failed Oracle round trips by query.", ["query"])
+MONGO_SECONDS = Histogram("transcriber_mongo_command_seconds", "MongoDB command latency by command.", ["command"], CALL_BUCKETS)
+MONGO_ERRORS = Counter("transcriber_mongo_command_errors_total", "Failed MongoDB commands by command.", ["command"])
+STAGES_SKIPPED = Counter("transcriber_stages_skipped_total", "Work skipped on a resumed run because its stage checkpoint was found.", ["stage"])
+PIPELINE_QUEUE_DEPTH = Gauge("transcriber_pipeline_queue_depth", "Studies waiting in front of each stage of the staged pipeline.", ["stage"])
+PIPELINE_BUSY_WORKERS = Gauge("transcriber_pipeline_busy_workers", "Staged-pipeline workers currently running a study, per stage.", ["stage"])
+PREFETCH_REQUESTS = Counter("transcriber_prefetch_requests_total", "DICOM reads served from the prefetch cache (result=\"hit\") or from the share (\"miss\").", ["result"])
+PREFETCH_CACHE_BYTES = Gauge("transcriber_prefetch_cache_bytes", "Size of the DICOMs in the local prefetch cache.")
+READY = Gauge("transcriber_ready", "1 while the monitor is connected to Oracle and MongoDB and its last poll succeeded.")
+
+
+@contextmanager
+def count_errors(counter, **labels):
+    """Counts an exception escaping the block under the given labels (plus error=<class name>) and re-raises it."""
+    try:
+        yield
+    except Exception as e:
+        counter.inc(error=type(e).__name__, **labels)
+        raise
+
+
+@contextmanager
+def time_oracle(query):
+    """Times one Oracle round trip; failures are counted and re-raised."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        ORACLE_ERRORS.inc(query=query)
+        raise
+    finally:
+        ORACLE_SECONDS.observe(time.perf_counter() - start, query=query)
+
+
+def _observe_stage(study_key, stage, seconds, nbytes):
+    if seconds is not None:
+        STAGE_SECONDS.observe(seconds, stage=stage)
+    if nbytes:
+        STAGE_BYTES.inc(nbytes, stage=stage)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Feeds MongoDB command latencies into MONGO_SECONDS; registered on the service's MongoClient."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_SECONDS.observe(event.duration_micros / 1e6, command=event.command_name)
+
+    def failed(self, event):
+        MONGO_SECONDS.observe(event.duration_micros / 1e6, command=event.command_name)
+        MONGO_ERRORS.inc(command=event.command_name)
+
+
+def install(config):
+    """
+    Turns on collection of stage timings and Mongo command latencies.
+
+    Call before database_operations.connect_db so the MongoClient gets the command listener.
+    """
+    global _installed
+    if _installed:
+        return
+    stage_timer.add_observer(_observe_stage)
+    _installed = True
+
+
+def mongo_listeners():
+    """Event listeners for the service's MongoClient (none unless install() was called)."""
+    return [MongoCommandMetrics()] if _installed else []
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def is_ready():
+    return READY.get() == 1
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/metrics":
+            self._reply(200, render(), "text/plain; version=0.0.4; charset=utf-8")
+        elif path == "/healthz":
+            # Liveness: the process is up and serving
+            self._reply(200, "ok\n")
+        elif path == "/readyz":
+            ready = is_ready()
+            self._reply(200 if ready else 503, "ready\n" if ready else "not ready\n")
+        else:
+            self._reply(404, "not found\n")
+
+    def _reply(self, status, body, content_type="text/plain; charset=utf-8"):
+        payload = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would flood the service log
+        logging.getLogger('detailed').debug(f"metrics: {self.address_string()} {format % args}")
+
+
+def start_metrics_server(config):
+    """Serves /metrics, /healthz and /readyz on METRICS_HOST:METRICS_PORT in a background thread."""
+    global _server
+    if _server is not None:
+        return _server
+    host = config.get("METRICS_HOST", "127.0.0.1")
+    port = int(config.get("METRICS_PORT", 9108))
+    try:
+        _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        logging.error(f"Cannot start metrics endpoint on {host}:{port}: {e}")
+        return None
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    logging.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+    return _server
+
+
+def stop_metrics_server():
+    global _server
+    if _server is not None:
+        _server.shutdown()
+        _server.server_close()
+        _server = None
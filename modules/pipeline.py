@@ -0,0 +1,100 @@
+import logging
+import queue
+import threading
+
+from . import metrics, profiling, tracing
+from .logger_config import log_context
+from .processing_worker import STAGES, StudyJob, finish_study, run_stage, start_study
+from .query import REPORT_READY
+
+# Worker threads per stage and the config key that overrides each count
+STAGE_WORKERS = {
+    "resolve": ("PIPELINE_RESOLVE_WORKERS", 2),
+    "extract": ("PIPELINE_EXTRACT_WORKERS", 2),
+    "transcribe": ("PIPELINE_TRANSCRIBE_WORKERS", 4),
+    "deliver": ("PIPELINE_DELIVER_WORKERS", 1),
+}
+
+# Put on a stage's queue once per worker by close()
+_STOP = object()
+
+
+def _stage_name(stage):
+    return stage.__name__.replace("_stage", "")
+
+
+class StagedPipeline:
+    """
+    Runs the stages of processing_worker (resolve, extract, transcribe, deliver) on
+    separate worker pools joined by bounded queues.
+
+    While one study waits for Gemini, the next ones are already being resolved in
+    Oracle and read from the share. A full queue blocks the stage feeding it, and
+    submit() blocks when the resolve queue is full, so the poll never runs far ahead
+    of the slowest stage. Queue depths and busy workers are exported per stage.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.queue_size = max(1, int(config.get("PIPELINE_QUEUE_SIZE", 4)))
+        self.stages = [(_stage_name(stage), stage) for stage in STAGES]
+        self.queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        self.threads = []
+        counts = []
+        for index, (name, _) in enumerate(self.stages):
+            key, default = STAGE_WORKERS[name]
+            workers = max(1, int(config.get(key, default)))
+            counts.append(f"{name} x{workers}")
+            for number in range(workers):
+                thread = threading.Thread(target=self._worker_loop, args=(index,),
+                                          name=f"pipeline-{name}-{number}", daemon=True)
+                thread.start()
+                self.threads.append((index, thread))
+        logging.info(f"Staged pipeline started: {', '.join(counts)} (queue size {self.queue_size})")
+
+    def _put(self, index, item):
+        self.queues[index].put(item) # Blocks while the stage is backed up
+        metrics.PIPELINE_QUEUE_DEPTH.set(self.queues[index].qsize(), stage=self.stages[index][0])
+
+    def submit(self, study_key, report_stat=REPORT_READY):
+        """Queues a study for the first stage; blocks while that stage is backed up."""
+        job = StudyJob(self.config, study_key, report_stat)
+        with log_context(study_key=study_key):
+            start_study(job)
+        self._put(0, job)
+
+    def _worker_loop(self, index):
+        name, stage = self.stages[index]
+        stage_queue = self.queues[index]
+        while True:
+            job = stage_queue.get()
+            metrics.PIPELINE_QUEUE_DEPTH.set(stage_queue.qsize(), stage=name)
+            if job is _STOP:
+                return
+            metrics.PIPELINE_BUSY_WORKERS.inc(stage=name)
+            try:
+                # Each stage is its own trace, under the study key, since the study changes threads between stages
+                with tracing.trace(job.study_key, name=f"pipeline.{name}"), log_context(study_key=job.study_key):
+                    with profiling.profile_stage(job.study_key, first=index == 0):
+                        proceed = run_stage(stage, job)
+                    if not proceed or index == len(self.stages) - 1:
+                        finish_study(job)
+            except Exception as e:
+                logging.error(f"Pipeline stage {name} failed for study {job.study_key}: {e}", exc_info=True)
+                proceed = False
+            finally:
+                metrics.PIPELINE_BUSY_WORKERS.dec(stage=name)
+            if proceed and index < len(self.stages) - 1:
+                self._put(index + 1, job)
+            else:
+                profiling.study_left(job.study_key)
+
+    def close(self):
+        """Lets every queued study finish, then stops the workers stage by stage."""
+        for index, _ in enumerate(self.stages):
+            workers = [thread for stage_index, thread in self.threads if stage_index == index]
+            for _ in workers:
+                self.queues[index].put(_STOP)
+            for thread in workers:
+                thread.join()
+        logging.info("Staged pipeline stopped.")
@@ -0,0 +1,294 @@
+import collections
+import hashlib
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+
+from . import metrics
+from . import smb_connect
+from .logger_config import log_context
+from .query import process_study_key, REPORT_READY
+
+# Cache entries live in <cache dir>/<16 hex digits of the source path>-<random>/<original file name>:
+# a folder of its own per copy, so removing an evicted entry never touches a newer copy of the same
+# source; the original name is kept because the SR file name is derived from it
+_ENTRY_DIR = re.compile(r"^[0-9a-f]{16}-[a-z0-9_]+$")
+
+# Global prefetcher, created by get_prefetcher when PREFETCH is "ON"
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+
+class DicomCache:
+    """
+    Bounded local copy of DICOM files from the share, evicted least-recently-used first.
+
+    Entries pinned by a study that is still in the pipeline are never evicted, so a
+    study reads the same local file from extraction to SR. The cache directory is
+    emptied of entries on start; it only holds copies.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = collections.OrderedDict() # source path -> (local path, size), oldest first
+        self._pins = {} # source path -> study keys using the local copy
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            if _ENTRY_DIR.match(name):
+                shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+    def new_local_path(self, source):
+        """Creates the folder of a new copy of source; returns the path to copy it to."""
+        digest = hashlib.sha256(source.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(tempfile.mkdtemp(prefix=f"{digest}-", dir=self.directory), smb_connect.basename(source))
+
+    def get(self, source, pin=None):
+        """Returns the local copy of source (pinned for the given study key) or None."""
+        with self._lock:
+            entry = self._entries.get(source)
+            if entry is None:
+                return None
+            self._entries.move_to_end(source)
+            if pin is not None:
+                self._pins.setdefault(source, set()).add(pin)
+            return entry[0]
+
+    def add(self, source, local_path, size, pin=None, partial_path=None):
+        """
+        Adds the copy of source at local_path. With partial_path, the finished copy is first
+        moved there; if another copy of the same source got into the cache first, the existing
+        entry is pinned instead and False is returned (the caller removes its copy).
+        """
+        with self._lock:
+            if partial_path is not None:
+                if source in self._entries:
+                    self._entries.move_to_end(source)
+                    if pin is not None:
+                        self._pins.setdefault(source, set()).add(pin)
+                    return False
+                os.replace(partial_path, local_path)
+            self._entries[source] = (local_path, size)
+            self.total_bytes += size
+            if pin is not None:
+                self._pins.setdefault(source, set()).add(pin)
+            evicted = self._evict_locked(keep=source)
+            metrics.PREFETCH_CACHE_BYTES.set(self.total_bytes)
+        for path in evicted:
+            shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+        return True
+
+    def unpin(self, study_key):
+        with self._lock:
+            for source in [source for source, keys in self._pins.items() if study_key in keys]:
+                self._pins[source].discard(study_key)
+                if not self._pins[source]:
+                    del self._pins[source]
+            evicted = self._evict_locked()
+            metrics.PREFETCH_CACHE_BYTES.set(self.total_bytes)
+        for path in evicted:
+            shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+    def _evict_locked(self, keep=None):
+        evicted = []
+        for source in list(self._entries):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if source == keep or source in self._pins:
+                continue
+            local_path, size = self._entries.pop(source)
+            self.total_bytes -= size
+            evicted.append(local_path)
+        return evicted
+
+
+class Prefetcher:
+    """
+    Copies the DICOMs of newly seen studies from the share to a local DicomCache in the background.
+
+    Studies are taken in the order they were added by PREFETCH_WORKERS threads, each
+    resolving the path in Oracle and copying the file with large sequential reads. The
+    resolved path is kept until the study is released, so the pipeline's resolve stage
+    reuses it instead of querying Oracle again (and the other way round). At
+    most PREFETCH_AHEAD studies are copied ahead of the pipeline; a slot is freed when
+    its study finishes (release). Extraction calls local_path, which waits for a copy
+    in progress and falls back to the share path on a miss.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.logger = logging.getLogger('detailed')
+        self.cache = DicomCache(config.get("PREFETCH_CACHE_DIR", "dicom_cache"),
+                                int(config.get("PREFETCH_CACHE_MAX_MB", 2048)) * 1024 * 1024)
+        self.ahead = max(1, int(config.get("PREFETCH_AHEAD", 16)))
+        self.chunk_size = max(64, int(config.get("PREFETCH_CHUNK_KB", 1024))) * 1024
+        self.wait_seconds = float(config.get("PREFETCH_WAIT_SECONDS", 120))
+        self._pending = collections.OrderedDict() # Study key -> report_stat, in the order added
+        self._seen = set() # Study keys queued, being copied or copied, and not yet released
+        self._active = set() # Study keys taken by a worker and not yet released
+        self._copying = {} # Study key -> Event set when its copy has finished (or failed)
+        self._sources = {} # Study key -> DICOM path resolved in Oracle, until the study is released
+        self._condition = threading.Condition()
+        self._running = True
+        self._threads = []
+        for number in range(max(1, int(config.get("PREFETCH_WORKERS", 4)))):
+            thread = threading.Thread(target=self._worker_loop, name=f"prefetch-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        self.logger.info(f"Prefetching DICOMs to {self.cache.directory} "
+                         f"({self.cache.max_bytes // (1024 * 1024)} MB, {len(self._threads)} workers, {self.ahead} studies ahead)")
+
+    def add(self, study_keys, report_stat=REPORT_READY):
+        """Queues studies for prefetching; keys already queued or in the cache are ignored."""
+        with self._condition:
+            for study_key in study_keys:
+                if study_key not in self._seen:
+                    self._seen.add(study_key)
+                    self._pending[study_key] = report_stat
+            self._condition.notify_all()
+
+    def _worker_loop(self):
+        while True:
+            with self._condition:
+                while self._running and (not self._pending or len(self._active) >= self.ahead):
+                    self._condition.wait()
+                if not self._running:
+                    return
+                study_key, report_stat = self._pending.popitem(last=False)
+                self._active.add(study_key)
+                done = self._copying[study_key] = threading.Event()
+            try:
+                with log_context(study_key=study_key):
+                    self._prefetch(study_key, report_stat)
+            except Exception as e:
+                self.logger.warning(f"Prefetch of study {study_key} failed: {e}")
+            finally:
+                done.set()
+
+    def resolve(self, study_key, report_stat=REPORT_READY):
+        """Returns the study's DICOM path, querying Oracle only if neither the prefetch nor the pipeline has."""
+        with self._condition:
+            source = self._sources.get(study_key)
+        if source is None:
+            source = process_study_key(self.config, study_key, report_stat=report_stat)
+            if source and isinstance(source, str):
+                with self._condition:
+                    if study_key in self._seen: # Not once the study is released, or it would never be removed
+                        self._sources[study_key] = source
+        return source
+
+    def _prefetch(self, study_key, report_stat):
+        source = self.resolve(study_key, report_stat)
+        if not source or not isinstance(source, str):
+            return
+        if self.cache.get(source, pin=study_key):
+            return
+        storage = smb_connect.get_backend(self.config)
+        share_user, share_pass = self.config.get('SHARE_USERNAME'), self.config.get('SHARE_PASSWORD')
+        if smb_connect.is_unc_path(source) and share_user and share_pass:
+            if not storage.connect(source, share_user, share_pass):
+                return
+        # A folder of its own: studies sharing a source file may be copying it at the same time
+        local_path = self.cache.new_local_path(source)
+        partial_path = local_path + ".partial"
+        started = time.perf_counter()
+        size = 0
+        try:
+            # Unbuffered source: every read is one large request to the share
+            with open(partial_path, 'wb') as dst, storage.open(source, 'rb', buffering=0) as src:
+                while True:
+                    chunk = src.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+                    size += len(chunk)
+            with self._condition:
+                # A study that gave up waiting and finished meanwhile must not pin the entry
+                pin = study_key if study_key in self._active else None
+            added = self.cache.add(source, local_path, size, pin=pin, partial_path=partial_path)
+        except Exception:
+            shutil.rmtree(os.path.dirname(local_path), ignore_errors=True)
+            raise
+        if not added:
+            shutil.rmtree(os.path.dirname(local_path), ignore_errors=True) # Another study copied the same file first
+            return
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - started, stage="prefetch")
+        metrics.STAGE_BYTES.inc(size, stage="prefetch")
+        self.logger.info(f"Prefetched {source} ({size} bytes) to {local_path}")
+
+    def local_path(self, study_key, source):
+        """Returns the local copy of source for the study (waiting for a copy in progress), or source itself."""
+        with self._condition:
+            if study_key in self._pending:
+                # The pipeline got here first: reading from the share now beats copying it later
+                del self._pending[study_key]
+                self._seen.discard(study_key)
+            done = self._copying.get(study_key)
+        if done is not None and not done.wait(self.wait_seconds):
+            self.logger.warning(f"Prefetch of {source} still running after {self.wait_seconds:.0f} s; reading from the share.")
+        local_path = self.cache.get(source, pin=study_key)
+        metrics.PREFETCH_REQUESTS.inc(result="hit" if local_path else "miss")
+        return local_path or source
+
+    def release(self, study_key):
+        """Called when the study has finished: frees its slot and unpins its cache entry."""
+        with self._condition:
+            self._seen.discard(study_key)
+            self._active.discard(study_key)
+            self._copying.pop(study_key, None)
+            self._sources.pop(study_key, None)
+            self._condition.notify_all()
+        self.cache.unpin(study_key)
+
+    def close(self):
+        with self._condition:
+            self._running = False
+            self._pending.clear()
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+
+def get_prefetcher(config):
+    """Returns the shared Prefetcher if PREFETCH is "ON" (creating it on first use), else None."""
+    global _prefetcher
+    if config.get("PREFETCH", "OFF") != "ON":
+        return None
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = Prefetcher(config)
+        return _prefetcher
+
+
+def resolve_path(config, study_key, report_stat=REPORT_READY):
+    """The study's DICOM path from the RIS, shared with the prefetcher so each study is looked up once."""
+    prefetcher = _prefetcher
+    if prefetcher is None:
+        return process_study_key(config, study_key, report_stat=report_stat)
+    return prefetcher.resolve(study_key, report_stat)
+
+
+def local_path(study_key, source):
+    """The path extraction should read: the prefetched copy if there is one, else source."""
+    prefetcher = _prefetcher
+    return prefetcher.local_path(study_key, source) if prefetcher is not None else source
+
+
+def release(study_key):
+    prefetcher = _prefetcher
+    if prefetcher is not None:
+        prefetcher.release(study_key)
+
+
+def close_prefetcher():
+    global _prefetcher
+    with _prefetcher_lock:
+        if _prefetcher is not None:
+            _prefetcher.close()
+            _prefetcher = None
@@ -1,166 +1,460 @@
 import logging
 import os
 import sys
+import tempfile
 
 # Assuming necessary modules are in the parent 'modules' directory or installed
 from . import database_operations as db_ops
 from . import smb_connect
-from .query import process_study_key
-from .extract_audio import ExtractAudio
-from .transcribe import Transcribe
+from .query import REPORT_READY
+from .extract_audio import ExtractAudio, audio_hash
+from .transcribe import Transcribe, PROMPT_VERSION
 from .store_transcribed_report import StoreTranscribedReport # If used and enabled
 from .encapsulate_text_as_enhanced_sr import EncapsulateTextAsEnhancedSR # If used and enabled
+from . import dicom_store
+from . import prefetch
+from .stage_timer import StageTimer
+from .logger_config import log_context
+from . import metrics, tracing, profiling
 
 # Note: Config is passed as an argument, no need to load it here unless for defaults
 # from modules.logger_config import setup_logging # Logging should be configured by the caller (main.py or monitor)
 
-def process_study(config, study_key):
-    """Processes a single study key through the transcription pipeline."""
-    final_path = None
-    audio_path = None
-    sr_path = None # Initialize sr_path
-    logger = logging.getLogger('detailed') # Get the logger configured by the main script
-    logger.info(f"--- Starting pipeline for study key: {study_key} ---")
+def deliver_sr(config, encapsulator, transcription_dict, dicom_path):
+    """
+    Builds the Enhanced SR and delivers it.
+
+    With SR_CSTORE "ON" the SR is sent straight to the configured PACS over the pooled
+    C-STORE association; if that fails it is written to SR_OUTPUT_FOLDER instead.
+    Returns the spool path or a dicom:// reference to the stored instance, or None on failure.
+    """
+    logger = logging.getLogger('detailed')
+    if config.get('SR_CSTORE', 'OFF') != 'ON':
+        return encapsulator.encapsulate_text_as_enhanced_sr(transcription_dict, dicom_path)
 
+    sr_ds = encapsulator.build_sr_dataset(transcription_dict, dicom_path)
+    if sr_ds is None:
+        return None
+    sink = dicom_store.get_sink(config)
     try:
-        # Record initial status or update existing one
-        db_ops.update_study_status(config, study_key, "processing_query")
-        final_path = process_study_key(config, study_key)
-        logger.info(f"DICOM file path found: {final_path}")
+        with tracing.span("sr.cstore", destination=sink.describe()):
+            stored = sink.store(sr_ds)
+    except Exception as e:
+        logger.error(f"C-STORE to {sink.describe()} raised an error: {e}", exc_info=True)
+        stored = False
+    if stored:
+        logger.info(f"Enhanced SR {sr_ds.SOPInstanceUID} stored on {sink.describe()}")
+        return f"dicom://{sink.describe()}/{sr_ds.SOPInstanceUID}"
+    logger.warning(f"C-STORE to {sink.describe()} failed. Falling back to spool folder {encapsulator.sr_output_folder}.")
+    with tracing.span("sr.spool_save"):
+        return encapsulator.save_sr_dataset(sr_ds)
 
-        # Check if path is valid before proceeding
-        if not final_path or not isinstance(final_path, str):
-             error_msg = f"Failed to retrieve a valid DICOM path for study {study_key}. Path received: {final_path}"
-             logger.error(error_msg)
-             db_ops.update_study_status(config, study_key, "error", error_message=error_msg)
-             return # Exit processing
-
-        # --- Add Network Share Connection Logic ---
-        # Check if path is UNC and if credentials are in config
-        share_user = config.get('SHARE_USERNAME')
-        share_pass = config.get('SHARE_PASSWORD')
-
-        is_unc_path = final_path.startswith('\\')
-
-        if is_unc_path and share_user and share_pass:
-            logger.info(f"UNC path detected: {final_path}. Attempting network share connection.")
-            if not smb_connect.connect_to_share(final_path, share_user, share_pass):
-                # Connection failed - log error and update status
-                error_msg = f"Failed to authenticate to network share for path: {final_path}"
-                logger.error(error_msg)
-                db_ops.update_study_status(config, study_key, "error", error_message=error_msg)
-                return # Exit pipeline if connection failed
-            else:
-                logger.info("Network share connection successful or already established.")
-        elif is_unc_path and (not share_user or not share_pass):
-            logger.warning(f"UNC path detected ({final_path}) but SHARE_USERNAME or SHARE_PASSWORD not found in config.yaml. Proceeding without explicit authentication.")
-        # --- End Network Share Connection Logic ---
-
-        # Update status with DICOM path (after potential share connection)
-        db_ops.update_study_status(config, study_key, "processing_audio", dicom_path=final_path)
-
-        # Initialize components needed for the pipeline
-        extract_audio = ExtractAudio(config)
-        transcribe = Transcribe(config)
-
-
-        # Extract audio
-        logger.info(f"Attempting to extract audio from: {final_path}")
-        audio_path = extract_audio.extract_audio(final_path)
-        # Check if audio extraction was successful
-        if not audio_path:
-             error_msg = f"Audio extraction failed for DICOM file: {final_path}"
-             logger.error(error_msg)
-             # update_study_status should ideally be called within extract_audio on failure,
-             # but we add a fallback here.
-             db_ops.update_study_status(config, study_key, "error", error_message=error_msg)
-             return # Exit processing
-
-        logger.info(f"Audio extracted successfully to: {audio_path}")
-        db_ops.update_study_status(config, study_key, "transcribing")
 
-        # Transcribe
-        logger.info(f"Starting transcription for DICOM {final_path} and audio {audio_path}")
-        # The transcribe method now returns a dict or None
-        transcription_dict = transcribe.transcribe(final_path, audio_path)
+class StudyJob:
+    """
+    One study on its way through the pipeline stages.
 
-        # Save transcription result to DB *before* optional steps
-        if transcription_dict and isinstance(transcription_dict, dict):
-            logger.info(f"Transcription successful for study {study_key}. Saving result.")
-            db_ops.save_transcription(config, study_key, transcription_dict) # Pass the dict directly
-            db_ops.update_study_status(config, study_key, "processing_complete") # Initial complete status
-        else:
-            logger.warning(f"No transcription was generated or returned for study {study_key}.")
-            db_ops.update_study_status(config, study_key, "error", error_message="No transcription generated or transcription failed")
-            # Skip further processing if no report
-            return # Exit pipeline function
-
-        # Optional: Encapsulate SR
-        if config.get('ENCAPSULATE_TEXT_AS_ENHANCED_SR', 'OFF') == 'ON':
-            logger.info(f"Encapsulation enabled. Processing SR for study {study_key}.")
-            try:
-                # Initialize only if needed
-                encapsulate_text_as_enhanced_sr = EncapsulateTextAsEnhancedSR(config)
-                sr_path = encapsulate_text_as_enhanced_sr.encapsulate_text_as_enhanced_sr(transcription_dict, final_path) # Pass dict
-
-                # Check if SR generation was successful before logging/saving
-                if sr_path:
-                    logger.info(f"Enhanced SR saved to: {sr_path}")
-                    # Update transcription record with SR path
-                    db_ops.save_transcription(config, study_key, transcription_dict, sr_path=sr_path) # Update existing record
-                    db_ops.update_study_status(config, study_key, "processing_complete_sr") # More specific complete status
-                else:
-                    logger.error(f"Enhanced SR generation failed for study {study_key}. sr_path is None.")
-                    db_ops.update_study_status(config, study_key, "error", error_message="SR encapsulation failed (returned None)")
-
-            except Exception as e:
-                 logger.error(f"Failed during SR encapsulation for {study_key}: {e}", exc_info=True) # Add exc_info for details
-                 db_ops.update_study_status(config, study_key, "error", error_message=f"SR encapsulation failed: {str(e)[:200]}") # Truncate long errors
-
-        # Optional: Store report (potentially legacy/alternative storage)
-        if config.get('STORE_TRANSCRIBED_REPORT', 'OFF') == 'ON':
-            logger.info(f"Legacy report storage enabled. Storing report for study {study_key}.")
-            try:
-                # Initialize only if needed
-                store_transcribed_report = StoreTranscribedReport(config)
-                # Adapt this call based on what store_transcribed_report expects.
-                # If it expects the list format, wrap the dict: [transcription_dict]
-                # If it expects the dict, pass it directly: transcription_dict
-                # Assuming it might still expect the list:
-                store_transcribed_report.store_transcribed_report(study_key, [transcription_dict])
-                logger.info(f"Legacy report stored successfully for {study_key}.")
-                # db_ops.update_study_status(config, study_key, "processing_complete_stored") # Even more specific status if needed
-            except Exception as e:
-                 logger.error(f"Failed during custom report storage for {study_key}: {e}", exc_info=True)
-                 # Avoid overwriting a potential SR error with this less critical one? Or append?
-                 # Let's just log for now, assuming DB status reflects primary outcome.
-                 # db_ops.update_study_status(config, study_key, "error", error_message=f"Custom storage failed: {str(e)[:200]}")
+    Carries what a stage hands to the next (attempt, DICOM paths, WAV path,
+    transcription), so the stages can run one after another in process_study or on
+    separate worker pools (modules/pipeline.py). checkpoints holds what an earlier,
+    unfinished run of the study already completed (see start_study).
+    """
+
+    def __init__(self, config, study_key, report_stat=REPORT_READY):
+        self.config = config
+        self.study_key = study_key
+        self.report_stat = report_stat
+        self.timer = StageTimer(study_key) # Per-stage durations/bytes, stored on the study when it finishes
+        self.attempt = None
+        self.final_path = None
+        self.dicom_path = None # Where the DICOM is read: the prefetched local copy, or final_path
+        self.audio_path = None
+        self.audio_hash = None
+        self.transcription = None
+        self.transcription_attempt = None # Attempt whose transcription document holds transcription
+        self.sr_path = None
+        self.checkpoints = None # Stage checkpoints of an earlier run; None with STAGE_CHECKPOINTS "OFF"
+
+
+# Stage checkpoints recorded on the study document (field "checkpoints"), in pipeline order
+CHECKPOINTS = ("resolve", "extract", "transcribe", "sr", "writeback")
+
+# Checkpoints that no longer hold once the named one is redone
+CHECKPOINT_DEPENDENTS = {
+    "resolve": ("extract", "transcribe", "sr", "writeback"),
+    "extract": ("transcribe", "sr", "writeback"),
+    "transcribe": ("sr", "writeback"),
+    "sr": (),
+    "writeback": (),
+}
+
+
+def checkpoint(job, name):
+    """The named checkpoint from an earlier run of the study, or None."""
+    return job.checkpoints.get(name) if job.checkpoints else None
+
+
+def record_checkpoint(job, name, **fields):
+    """Records a stage checkpoint on the study and drops the ones depending on it."""
+    if job.checkpoints is None:
+        return
+    dependents = CHECKPOINT_DEPENDENTS.get(name, ())
+    for dependent in dependents:
+        job.checkpoints.pop(dependent, None)
+    job.checkpoints[name] = fields
+    db_ops.set_checkpoint(job.config, job.study_key, name, fields, clear=dependents)
+
+
+def drop_checkpoint(job, name):
+    """Drops checkpoint name and the ones depending on it, so the next run of the study redoes that stage."""
+    if job.checkpoints is None:
+        return
+    names = (name,) + CHECKPOINT_DEPENDENTS[name]
+    for dropped in names:
+        job.checkpoints.pop(dropped, None)
+    db_ops.clear_checkpoints(job.config, job.study_key, names)
+
+
+def redo_from(config, study_key, name):
+    """Clears checkpoint name and everything after it, so the next run of the study redoes that stage onwards."""
+    db_ops.clear_checkpoints(config, study_key, (name,) + CHECKPOINT_DEPENDENTS[name] + ("finished",))
 
-        # Optional: Print output
-        if config.get('PRINT_GEMINI_OUTPUT', 'OFF') == 'ON':
-            logger.info(f"Printing Gemini Output for {study_key}:")
-            print(transcription_dict) # Print the dictionary
 
-        logger.info(f"--- Pipeline finished for study key: {study_key} ---")
+def process_study(config, study_key, report_stat=REPORT_READY):
+    """
+    Processes a single study key through the transcription pipeline.
 
+    report_stat selects the report whose dictation is used (see query.process_study_key).
+    """
+    # The study key is the trace ID; every stage below becomes a span of this trace.
+    # Log records of the run carry the study key as well.
+    with tracing.trace(study_key), profiling.profile_study(study_key), log_context(study_key=study_key):
+        _process_study(config, study_key, report_stat)
+
+
+def _process_study(config, study_key, report_stat):
+    job = StudyJob(config, study_key, report_stat)
+    start_study(job)
+    try:
+        for stage in STAGES:
+            if not run_stage(stage, job):
+                return
+    finally:
+        finish_study(job)
+
+
+def start_study(job):
+    logger = logging.getLogger('detailed') # Get the logger configured by the main script
+    logger.info(f"--- Starting pipeline for study key: {job.study_key} ---")
+    metrics.STUDIES_STARTED.inc()
+    metrics.IN_FLIGHT.inc()
+
+    if job.config.get("STAGE_CHECKPOINTS", "ON") != "ON":
+        return
+    checkpoints = db_ops.get_checkpoints(job.config, job.study_key)
+    if "finished" in checkpoints:
+        # The last run went through: this one starts over
+        db_ops.clear_checkpoints(job.config, job.study_key, list(checkpoints))
+        checkpoints = {}
+    elif checkpoints:
+        logger.info(f"Resuming study {job.study_key}; checkpoints from an earlier run: {', '.join(checkpoints)}")
+    job.checkpoints = checkpoints
+
+
+def run_stage(stage, job):
+    """
+    Runs one stage function on the job. Returns True if the study should go on to the next stage.
+
+    A stage returns False after recording its own error status; an exception escaping
+    it is logged and recorded here.
+    """
+    logger = logging.getLogger('detailed')
+    study_key, config = job.study_key, job.config
+    try:
+        return stage(job)
     except FileNotFoundError as fnf_err:
         # Specifically catch FileNotFoundError which might occur if path is wrong
         error_msg = f"Pipeline error (FileNotFound) for study key {study_key}: {fnf_err}"
         logger.error(error_msg)
         db_ops.update_study_status(config, study_key, "error", error_message=str(fnf_err))
-
     except Exception as err:
         # General error handler
         error_msg = f"Pipeline error for study key {study_key}: {err}"
         logger.error(error_msg, exc_info=True) # Log full traceback for unexpected errors
         db_ops.update_study_status(config, study_key, "error", error_message=f"Pipeline failed: {str(err)[:200]}")
+    return False
 
-    finally:
-        # Cleanup temporary audio file
-        if audio_path and os.path.exists(audio_path):
-            logger.debug(f"Attempting to delete temporary audio file: {audio_path}")
-            try:
-                os.remove(audio_path)
-                logger.info(f"Temporary audio file deleted: {audio_path}")
-            except Exception as e:
-                logger.warning(f"Failed to delete temporary audio file {audio_path}: {e}") 
\ No newline at end of file
+
+def finish_study(job):
+    """Runs once per study after its last stage, whether it succeeded or not."""
+    logger = logging.getLogger('detailed')
+    metrics.IN_FLIGHT.dec()
+    prefetch.release(job.study_key) # Frees the prefetch slot and lets the cached copy be evicted
+    # Record where the study's time went
+    db_ops.record_study_timings(job.config, job.study_key, job.timer.as_document())
+
+    # Cleanup temporary audio file
+    audio_path = job.audio_path
+    if audio_path and os.path.exists(audio_path):
+        logger.debug(f"Attempting to delete temporary audio file: {audio_path}")
+        try:
+            os.remove(audio_path)
+            logger.info(f"Temporary audio file deleted: {audio_path}")
+        except Exception as e:
+            logger.warning(f"Failed to delete temporary audio file {audio_path}: {e}")
+
+
+def resolve_stage(job):
+    """Oracle lookup of the DICOM path, plus the share connection for UNC paths (database-bound)."""
+    logger = logging.getLogger('detailed')
+    config, study_key, timer = job.config, job.study_key, job.timer
+
+    # Each run gets its own attempt number; the transcription document is keyed by it
+    job.attempt = db_ops.begin_attempt(config, study_key)
+    if job.attempt and job.attempt > 1:
+        metrics.STUDY_RETRIES.inc()
+    # Record initial status or update existing one
+    db_ops.update_study_status(config, study_key, "processing_query")
+    resolved = checkpoint(job, "resolve")
+    if resolved:
+        final_path = resolved.get("dicom_path")
+        logger.info(f"DICOM file path from the resolve checkpoint: {final_path}")
+        metrics.STAGES_SKIPPED.inc(stage="resolve")
+    else:
+        with timer.stage("oracle_query"):
+            # Shared with the prefetcher, which may have looked the study up already
+            final_path = prefetch.resolve_path(config, study_key, report_stat=job.report_stat)
+        logger.info(f"DICOM file path found: {final_path}")
+
+    # Check if path is valid before proceeding
+    if not final_path or not isinstance(final_path, str):
+        error_msg = f"Failed to retrieve a valid DICOM path for study {study_key}. Path received: {final_path}"
+        logger.error(error_msg)
+        db_ops.update_study_status(config, study_key, "error", error_message=error_msg)
+        return False
+    job.final_path = final_path
+
+    # --- Add Network Share Connection Logic ---
+    # Check if path is UNC and if credentials are in config
+    share_user = config.get('SHARE_USERNAME')
+    share_pass = config.get('SHARE_PASSWORD')
+
+    is_unc_path = smb_connect.is_unc_path(final_path)
+
+    if is_unc_path and share_user and share_pass:
+        logger.info(f"UNC path detected: {final_path}. Attempting network share connection.")
+        with timer.stage("share_connect"):
+            share_connected = smb_connect.get_backend(config).connect(final_path, share_user, share_pass)
+        if not share_connected:
+            # Connection failed - log error and update status
+            error_msg = f"Failed to authenticate to network share for path: {final_path}"
+            logger.error(error_msg)
+            db_ops.update_study_status(config, study_key, "error", error_message=error_msg)
+            return False
+        else:
+            logger.info("Network share connection successful or already established.")
+    elif is_unc_path and (not share_user or not share_pass):
+        logger.warning(f"UNC path detected ({final_path}) but SHARE_USERNAME or SHARE_PASSWORD not found in config.yaml. Proceeding without explicit authentication.")
+    # --- End Network Share Connection Logic ---
+
+    if not resolved:
+        record_checkpoint(job, "resolve", dicom_path=final_path)
+    # Update status with DICOM path (after potential share connection)
+    db_ops.update_study_status(config, study_key, "processing_audio", dicom_path=final_path)
+    return True
+
+
+def extract_stage(job):
+    """Reads the DICOM from the share and decodes its waveform to a WAV (I/O, then CPU)."""
+    logger = logging.getLogger('detailed')
+    config, study_key, final_path = job.config, job.study_key, job.final_path
+    job.dicom_path = prefetch.local_path(study_key, final_path)
+
+    if load_checkpointed_transcription(job):
+        logger.info("Transcription found from an earlier run; skipping audio extraction.")
+        metrics.STAGES_SKIPPED.inc(stage="extract")
+        return True
+    extracted = checkpoint(job, "extract")
+    if extracted and _audio_unchanged(extracted.get("audio_path"), extracted.get("audio_hash")):
+        logger.info(f"Reusing audio extracted by an earlier run: {extracted['audio_path']}")
+        metrics.STAGES_SKIPPED.inc(stage="extract")
+        job.audio_path, job.audio_hash = extracted["audio_path"], extracted["audio_hash"]
+        db_ops.update_study_status(config, study_key, "transcribing")
+        return True
+
+    # Extract audio
+    extract_audio = ExtractAudio(config)
+    logger.info(f"Attempting to extract audio from: {job.dicom_path}")
+    # A WAV of its own per study, never next to the DICOM on the share: studies sharing a source
+    # file would write and delete the same WAV. A prefetched copy is local, so it goes next to that.
+    if job.dicom_path != final_path:
+        wav_path = f"{os.path.splitext(job.dicom_path)[0]}-{study_key}.wav"
+    else:
+        handle, wav_path = tempfile.mkstemp(prefix=f"pg_transcriber_{study_key}_", suffix=".wav")
+        os.close(handle)
+    job.audio_path = wav_path # finish_study removes it, also when extraction fails
+    try:
+        audio_path = extract_audio.extract_audio(job.dicom_path, timer=job.timer, wav_path=wav_path)
+    except FileNotFoundError:
+        # The resolved path cannot be read: the next run asks the RIS again instead of reusing it
+        drop_checkpoint(job, "resolve")
+        raise
+    # Check if audio extraction was successful
+    if not audio_path:
+        error_msg = f"Audio extraction failed for DICOM file: {final_path}"
+        logger.error(error_msg)
+        # update_study_status should ideally be called within extract_audio on failure,
+        # but we add a fallback here.
+        db_ops.update_study_status(config, study_key, "error", error_message=error_msg)
+        return False
+    job.audio_path = audio_path
+    job.audio_hash = audio_hash(audio_path)
+    record_checkpoint(job, "extract", audio_path=audio_path, audio_hash=job.audio_hash)
+
+    logger.info(f"Audio extracted successfully to: {audio_path}")
+    db_ops.update_study_status(config, study_key, "transcribing")
+    return True
+
+
+def _audio_unchanged(path, expected_hash):
+    """True if the WAV an earlier run extracted is still there with the same contents."""
+    try:
+        return bool(path) and os.path.exists(path) and audio_hash(path) == expected_hash
+    except OSError:
+        return False
+
+
+def load_checkpointed_transcription(job):
+    """Loads the transcription named by the transcribe checkpoint into the job. Returns True if there was one."""
+    transcribed = checkpoint(job, "transcribe")
+    if not transcribed:
+        return False
+    document = db_ops.get_transcription(job.config, transcribed.get("transcription_id"))
+    if document is None:
+        logging.getLogger('detailed').warning(f"Transcription {transcribed.get('transcription_id')} of the transcribe checkpoint "
+                                              f"was not found; transcribing study {job.study_key} again.")
+        return False
+    job.transcription = {"Reading": document.get("reading", ""), "Conclusion": document.get("conclusion", "")}
+    job.transcription_attempt = document.get("attempt")
+    return True
+
+
+def transcribe_stage(job):
+    """Uploads the audio and waits for Gemini (remote latency), then saves the result."""
+    logger = logging.getLogger('detailed')
+    config, study_key, timer = job.config, job.study_key, job.timer
+    if job.transcription is not None:
+        # Loaded from the transcribe checkpoint by extract_stage
+        logger.info(f"Reusing the transcription of attempt {job.transcription_attempt} for study {study_key}.")
+        metrics.STAGES_SKIPPED.inc(stage="transcribe")
+        db_ops.update_study_status(config, study_key, "processing_complete")
+        return True
+    transcribe = Transcribe(config)
+
+    # Transcribe
+    logger.info(f"Starting transcription for DICOM {job.dicom_path} and audio {job.audio_path}")
+    # The transcribe method now returns a dict or None
+    transcription_dict = transcribe.transcribe(job.dicom_path, job.audio_path, timer=timer)
+
+    # Save transcription result to DB *before* optional steps
+    if transcription_dict and isinstance(transcription_dict, dict):
+        logger.info(f"Transcription successful for study {study_key}. Saving result.")
+        with timer.stage("mongo_save"):
+            transcription_id = db_ops.save_transcription(config, study_key, transcription_dict, attempt=job.attempt,
+                                                         model=config.get("MODEL_NAME"), prompt_version=PROMPT_VERSION,
+                                                         audio_hash=job.audio_hash)
+        if transcription_id is not None:
+            record_checkpoint(job, "transcribe", transcription_id=transcription_id, attempt=job.attempt)
+        db_ops.update_study_status(config, study_key, "processing_complete") # Initial complete status
+    else:
+        logger.warning(f"No transcription was generated or returned for study {study_key}.")
+        db_ops.update_study_status(config, study_key, "error", error_message="No transcription generated or transcription failed")
+        # Skip further processing if no report
+        return False
+    job.transcription = transcription_dict
+    job.transcription_attempt = job.attempt
+    return True
+
+
+def deliver_stage(job):
+    """Optional outputs: Enhanced SR (spool folder or C-STORE) and the RIS write-back."""
+    logger = logging.getLogger('detailed')
+    config, study_key, timer = job.config, job.study_key, job.timer
+    transcription_dict = job.transcription
+    failed = False # Any delivery failed: the study is not marked finished, so a rerun retries it
+
+    # Optional: Encapsulate SR
+    delivered = checkpoint(job, "sr")
+    if config.get('ENCAPSULATE_TEXT_AS_ENHANCED_SR', 'OFF') == 'ON' and delivered:
+        job.sr_path = delivered.get("sr_path")
+        logger.info(f"Enhanced SR already delivered by an earlier run: {job.sr_path}")
+        metrics.STAGES_SKIPPED.inc(stage="sr")
+        db_ops.update_study_status(config, study_key, "processing_complete_sr")
+    elif config.get('ENCAPSULATE_TEXT_AS_ENHANCED_SR', 'OFF') == 'ON':
+        logger.info(f"Encapsulation enabled. Processing SR for study {study_key}.")
+        try:
+            # Initialize only if needed
+            encapsulate_text_as_enhanced_sr = EncapsulateTextAsEnhancedSR(config)
+            with timer.stage("sr"):
+                sr_path = job.sr_path = deliver_sr(config, encapsulate_text_as_enhanced_sr, transcription_dict, job.dicom_path) # Pass dict
+
+            # Check if SR generation was successful before logging/saving
+            if sr_path:
+                logger.info(f"Enhanced SR saved to: {sr_path}")
+                # Update transcription record with SR path
+                with timer.stage("mongo_save"):
+                    db_ops.set_transcription_sr_path(config, study_key, job.transcription_attempt, sr_path) # Update existing record in place
+                record_checkpoint(job, "sr", sr_path=sr_path)
+                db_ops.update_study_status(config, study_key, "processing_complete_sr") # More specific complete status
+            else:
+                logger.error(f"Enhanced SR generation failed for study {study_key}. sr_path is None.")
+                failed = True
+                db_ops.update_study_status(config, study_key, "error", error_message="SR encapsulation failed (returned None)")
+
+        except Exception as e:
+             logger.error(f"Failed during SR encapsulation for {study_key}: {e}", exc_info=True) # Add exc_info for details
+             failed = True
+             db_ops.update_study_status(config, study_key, "error", error_message=f"SR encapsulation failed: {str(e)[:200]}") # Truncate long errors
+
+    # Optional: Store report (potentially legacy/alternative storage)
+    written_back = checkpoint(job, "writeback")
+    if config.get('STORE_TRANSCRIBED_REPORT', 'OFF') == 'ON' and written_back and written_back.get("status") == "done":
+        logger.info(f"Report already written back to the RIS by an earlier run for {study_key}.")
+        metrics.STAGES_SKIPPED.inc(stage="writeback")
+    elif config.get('STORE_TRANSCRIBED_REPORT', 'OFF') == 'ON':
+        logger.info(f"Legacy report storage enabled. Storing report for study {study_key}.")
+        try:
+            # Initialize only if needed
+            store_transcribed_report = StoreTranscribedReport(config)
+            # Adapt this call based on what store_transcribed_report expects.
+            # If it expects the list format, wrap the dict: [transcription_dict]
+            # If it expects the dict, pass it directly: transcription_dict
+            # Assuming it might still expect the list:
+            with timer.stage("writeback"):
+                store_transcribed_report.store_transcribed_report(study_key, [transcription_dict])
+            logger.info(f"Legacy report stored successfully for {study_key}.")
+            record_checkpoint(job, "writeback", status="done")
+            # Written now rather than with the next flush: after a crash the report must not be written back twice
+            db_ops.flush_status_updates()
+            # db_ops.update_study_status(config, study_key, "processing_complete_stored") # Even more specific status if needed
+        except Exception as e:
+             logger.error(f"Failed during custom report storage for {study_key}: {e}", exc_info=True)
+             failed = True
+             record_checkpoint(job, "writeback", status="failed", error=str(e)[:200])
+             # Avoid overwriting a potential SR error with this less critical one? Or append?
+             # Let's just log for now, assuming DB status reflects primary outcome.
+             # db_ops.update_study_status(config, study_key, "error", error_message=f"Custom storage failed: {str(e)[:200]}")
+
+    # Optional: Print output
+    if config.get('PRINT_GEMINI_OUTPUT', 'OFF') == 'ON':
+        logger.info(f"Printing Gemini Output for {study_key}:")
+        print(transcription_dict) # Print the dictionary
+
+    if not failed:
+        record_checkpoint(job, "finished")
+    logger.info(f"--- Pipeline finished for study key: {study_key} ---")
+    return True
+
+
+# Run in this order by process_study, each on its own worker pool by modules/pipeline.py
+STAGES = (resolve_stage, extract_stage, transcribe_stage, deliver_stage)
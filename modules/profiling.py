@@ -0,0 +1,270 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import signal
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Settings, filled in by install()
+_settings = {
+    "dir": "profiles",
+    "trigger_file": "profile.trigger",
+    "studies": 10,
+    "snapshot_seconds": 300,
+    "snapshots": 6,
+    "top": 30,
+}
+
+_lock = threading.Lock()
+_profile = None # cProfile.Profile of the running capture, or None
+_remaining = 0 # Studies still to capture
+_captured = [] # (study_key, seconds) of the studies in the capture
+_stage_profiles = [] # cProfile.Profile of each profiled pipeline stage run
+_staged = {} # study_key -> seconds so far, for studies in the capture still in the staged pipeline
+_signalled = False # Set by the signal handler, acted on by check_trigger()
+_memory_thread = None
+_stop = threading.Event()
+
+
+def _timestamp():
+    return time.strftime("%Y%m%d-%H%M%S")
+
+
+def _output_path(name):
+    os.makedirs(_settings["dir"], exist_ok=True)
+    return os.path.join(_settings["dir"], name)
+
+
+def request(studies=None):
+    """
+    Starts a profiling session: cProfile over the next `studies` studies (PROFILE_STUDIES by default)
+    and tracemalloc snapshots every PROFILE_SNAPSHOT_SECONDS, PROFILE_SNAPSHOTS times.
+    """
+    global _profile, _remaining, _captured, _stage_profiles
+    studies = int(studies or _settings["studies"])
+    with _lock:
+        if _profile is None:
+            _profile = cProfile.Profile()
+            _captured, _stage_profiles = [], []
+            _staged.clear()
+        _remaining = max(_remaining, studies)
+    logging.info(f"Profiling the next {studies} studies; results go to {os.path.abspath(_settings['dir'])}")
+    _start_memory_snapshots()
+
+
+def check_trigger():
+    """
+    Starts a session if the trigger file exists or the profiling signal was received.
+
+    The trigger file may contain the number of studies to profile; it is deleted once read.
+    Called by the monitor between studies and while it waits for the next poll.
+    """
+    global _signalled
+    if _signalled:
+        _signalled = False
+        request()
+    trigger_file = _settings["trigger_file"]
+    if not trigger_file or not os.path.exists(trigger_file):
+        return
+    try:
+        with open(trigger_file, encoding="utf-8") as file:
+            content = file.read().strip()
+        os.remove(trigger_file)
+    except OSError as e:
+        logging.error(f"Could not read profiling trigger file {trigger_file}: {e}")
+        return
+    request(int(content) if content.isdigit() else None)
+
+
+@contextmanager
+def profile_study(study_key):
+    """Profiles the block if a session is running; the session is written out after its last study."""
+    global _profile, _remaining
+    with _lock:
+        profile = _profile if _remaining > 0 else None
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        with _lock:
+            _captured.append((study_key, time.perf_counter() - start))
+            _remaining -= 1
+            finished = _remaining <= 0
+            if finished:
+                _profile = None
+        if finished:
+            _write_profile([profile], list(_captured))
+
+
+@contextmanager
+def profile_stage(study_key, first=False):
+    """
+    Profiles one stage of a study in the staged pipeline if the study is in the capture.
+
+    A study joins the capture at its first stage. The stages run on different threads and cProfile
+    follows one thread, so every stage run gets its own profile; they are merged when the session is
+    written out. The pipeline calls study_left() once the study is done with.
+    """
+    with _lock:
+        if _profile is not None and study_key not in _staged and first and _remaining - len(_staged) > 0:
+            _staged[study_key] = 0.0
+        profiled = _profile is not None and study_key in _staged
+    if not profiled:
+        yield
+        return
+    profile = cProfile.Profile()
+    start = time.perf_counter()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        with _lock:
+            if study_key in _staged: # Not if the session was written out by shutdown() meanwhile
+                _staged[study_key] += time.perf_counter() - start
+                _stage_profiles.append(profile)
+
+
+def study_left(study_key):
+    """Counts a study of the staged pipeline as captured; the session is written out after its last study."""
+    global _profile, _remaining
+    with _lock:
+        if study_key not in _staged:
+            return
+        _captured.append((study_key, _staged.pop(study_key)))
+        _remaining -= 1
+        finished = _remaining <= 0
+        if finished:
+            profiles, studies = [_profile] + _stage_profiles, list(_captured)
+            _profile = None
+    if finished:
+        _write_profile(profiles, studies)
+
+
+def _write_profile(profiles, studies):
+    base = _output_path(f"cpu-{_timestamp()}")
+    profiles = [profile for profile in profiles if profile.getstats()] # pstats rejects a profile that never ran
+    if not profiles:
+        return
+    try:
+        stats = pstats.Stats(*profiles)
+        stats.dump_stats(base + ".prof")
+        summary = io.StringIO()
+        total = sum(seconds for _, seconds in studies)
+        summary.write(f"{len(studies)} studies profiled, {total:.2f} s in total\n")
+        for study_key, seconds in studies:
+            summary.write(f"  {study_key}: {seconds:.2f} s\n")
+        for order in ("cumulative", "tottime"):
+            summary.write(f"\n=== Top {_settings['top']} functions by {order} time ===\n")
+            stats = pstats.Stats(*profiles, stream=summary)
+            stats.strip_dirs().sort_stats(order).print_stats(_settings["top"])
+        with open(base + ".txt", "w", encoding="utf-8") as file:
+            file.write(summary.getvalue())
+        logging.info(f"CPU profile of {len(studies)} studies written to {base}.prof (summary: {base}.txt)")
+    except OSError as e:
+        logging.error(f"Could not write CPU profile to {base}: {e}")
+
+
+def _start_memory_snapshots():
+    global _memory_thread
+    with _lock:
+        if _memory_thread is not None and _memory_thread.is_alive():
+            return
+        _memory_thread = threading.Thread(target=_take_memory_snapshots, name="profiling-memory", daemon=True)
+        _memory_thread.start()
+
+
+# The profilers' own bookkeeping would otherwise crowd the top of the memory summary
+_MEMORY_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, cProfile.__file__),
+    tracemalloc.Filter(False, pstats.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+]
+
+
+def _take_memory_snapshots():
+    """Compares each snapshot against the first one, so steady growth shows up at the top of the summary."""
+    started_here = not tracemalloc.is_tracing()
+    if started_here:
+        tracemalloc.start(10)
+    try:
+        baseline = tracemalloc.take_snapshot().filter_traces(_MEMORY_FILTERS)
+        for index in range(1, _settings["snapshots"] + 1):
+            if _stop.wait(_settings["snapshot_seconds"]):
+                break
+            snapshot = tracemalloc.take_snapshot().filter_traces(_MEMORY_FILTERS)
+            _write_memory_summary(snapshot, baseline, index)
+            if index == _settings["snapshots"]:
+                snapshot.dump(_output_path(f"memory-{_timestamp()}.snapshot"))
+    except Exception as e:
+        logging.error(f"Memory profiling failed: {e}", exc_info=True)
+    finally:
+        if started_here:
+            tracemalloc.stop()
+
+
+def _write_memory_summary(snapshot, baseline, index):
+    path = _output_path(f"memory-{_timestamp()}-{index}.txt")
+    current, peak = tracemalloc.get_traced_memory()
+    top = _settings["top"]
+    lines = [f"Snapshot {index}/{_settings['snapshots']}: {current / 1e6:.1f} MB traced, peak {peak / 1e6:.1f} MB", ""]
+    lines.append(f"=== Top {top} growth since profiling started ===")
+    lines.extend(str(stat) for stat in snapshot.compare_to(baseline, "lineno")[:top])
+    lines.append("")
+    lines.append(f"=== Top {top} allocations now ===")
+    lines.extend(str(stat) for stat in snapshot.statistics("lineno")[:top])
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("\n".join(lines) + "\n")
+    logging.info(f"Memory snapshot {index} written to {path}")
+
+
+def _on_signal(signum, frame):
+    # Only set a flag: the handler runs on the main thread, which may be holding _lock
+    global _signalled
+    _signalled = True
+
+
+def install(config, start=False):
+    """
+    Reads the PROFILE_* settings and registers the profiling signal (SIGUSR1, where the platform has it).
+
+    With start=True (the --profile flag) a session begins right away.
+    """
+    _settings.update({
+        "dir": config.get("PROFILE_DIR", _settings["dir"]),
+        "trigger_file": config.get("PROFILE_TRIGGER_FILE", _settings["trigger_file"]),
+        "studies": int(config.get("PROFILE_STUDIES", _settings["studies"])),
+        "snapshot_seconds": int(config.get("PROFILE_SNAPSHOT_SECONDS", _settings["snapshot_seconds"])),
+        "snapshots": int(config.get("PROFILE_SNAPSHOTS", _settings["snapshots"])),
+        "top": int(config.get("PROFILE_TOP", _settings["top"])),
+    })
+    if hasattr(signal, "SIGUSR1") and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGUSR1, _on_signal)
+    if start:
+        request()
+
+
+def shutdown():
+    """Writes out a session that is still running and stops the memory snapshots."""
+    global _profile, _remaining
+    _stop.set()
+    with _lock:
+        profiles, studies = [_profile] + _stage_profiles, list(_captured)
+        running = _profile is not None
+        _profile, _remaining = None, 0
+        _staged.clear()
+    if running and studies:
+        _write_profile(profiles, studies)
+    if _memory_thread is not None:
+        _memory_thread.join(timeout=30)
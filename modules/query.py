@@ -1,58 +1,73 @@
 import oracledb
 import os
 import logging
-import sys
-from modules.logger_config import setup_logging
+from modules import metrics, tracing
 
-setup_logging()
+# REPORT_STAT of a report waiting for transcription
+REPORT_READY = 3010
 
 
-def process_study_key(config, study_key):
+def process_study_key(config, study_key, report_stat=REPORT_READY):
+    """
+    Resolves the DICOM path of the study's dictation from the RIS, or returns None.
+
+    Only reports with REPORT_STAT = report_stat are considered; with report_stat=None
+    the study's newest report is used whatever its state (backfill of reported studies).
+    """
     # Create DSN from individual config values if ORACLE_DSN is not provided.
     logging.info("Creating DSN for Oracle connection.")
     dsn = oracledb.makedsn(config["ORACLE_HOST"], config["ORACLE_PORT"], service_name=config["ORACLE_SERVICE_NAME"])
     logging.info(f"DSN: {dsn}")
 
     logging.info("Connecting to Oracle database.")
-    connection = oracledb.connect(user=config["ORACLE_USERNAME"], password=config["ORACLE_PASSWORD"], dsn=dsn)
+    with metrics.time_oracle("connect"), tracing.span("oracle.connect"):
+        connection = oracledb.connect(user=config["ORACLE_USERNAME"], password=config["ORACLE_PASSWORD"], dsn=dsn)
 
     logging.info("Creating cursor for database operations.")
     cursor = connection.cursor()
     try:
         # Retrieve REPORT_KEY for the given STUDY_KEY where REPORT_STAT indicates readiness.
-        cursor.execute(
-            "SELECT REPORT_KEY FROM TREPORT WHERE STUDY_KEY = :study_key AND REPORT_STAT = 3010",
-            study_key=study_key
-        )
-        row = cursor.fetchone() # Get the first matching report key
+        with metrics.time_oracle("report_key"), tracing.span("oracle.report_key"):
+            if report_stat is None:
+                cursor.execute(
+                    "SELECT REPORT_KEY FROM TREPORT WHERE STUDY_KEY = :study_key ORDER BY REPORT_KEY DESC",
+                    study_key=study_key
+                )
+            else:
+                cursor.execute(
+                    "SELECT REPORT_KEY FROM TREPORT WHERE STUDY_KEY = :study_key AND REPORT_STAT = :report_stat",
+                    study_key=study_key, report_stat=report_stat
+                )
+            row = cursor.fetchone() # Get the first matching report key
         if not row:
             # Update error message for clarity
-            logging.error(f"No TREPORT record found for STUDY_KEY={study_key} with REPORT_STAT=3010")
-            # Consider returning None or raising a specific exception instead of sys.exit(1)
-            # For now, keep sys.exit to match previous behavior on failure.
-            sys.exit(1)
+            condition = "" if report_stat is None else f" with REPORT_STAT={report_stat}"
+            logging.error(f"No TREPORT record found for STUDY_KEY={study_key}{condition}")
+            return None
         report_key = row[0] # Extract the report_key
 
         # Query TDICTATION using the correctly identified report_key
-        cursor.execute(
-            "SELECT PATHNAME, FILENAME, LSTORAGE_KEY FROM TDICTATION WHERE REPORT_KEY = :report_key",
-            report_key=report_key
-        )
-        dictation_row = cursor.fetchone()
+        with metrics.time_oracle("dictation"), tracing.span("oracle.dictation"):
+            cursor.execute(
+                "SELECT PATHNAME, FILENAME, LSTORAGE_KEY FROM TDICTATION WHERE REPORT_KEY = :report_key",
+                report_key=report_key
+            )
+            dictation_row = cursor.fetchone()
         if not dictation_row:
             logging.error(f"No TDICTATION record found for REPORT_KEY={report_key}")
-            sys.exit(1)
+            return None
         pathname, filename, lstorage_key = dictation_row
 
         # Get storage location from TSTORAGE using LSTORAGE_KEY
-        cursor.execute(
-            "SELECT SHARE_FOLDER FROM TSTORAGE WHERE STORAGE_KEY = :lstorage_key",
-            lstorage_key=lstorage_key
-        )
-        storage_row = cursor.fetchone()
+        with metrics.time_oracle("storage"), tracing.span("oracle.storage"):
+            cursor.execute(
+                "SELECT SHARE_FOLDER FROM TSTORAGE WHERE STORAGE_KEY = :lstorage_key",
+                lstorage_key=lstorage_key
+            )
+            storage_row = cursor.fetchone()
         if not storage_row:
             logging.error("No TSTORAGE record found for storage configuration")
-            sys.exit(1)
+            return None
         share_folder = storage_row[0]
 
         # Construct UNC path using share name from TSTORAGE
@@ -1,71 +1,312 @@
+import io
 import logging
-import win32wnet
-import win32netcon
-import pywintypes
+import os
 import re
+import threading
+import time
 
-def connect_to_share(unc_path, username, password):
+STORAGE_BACKENDS = ("auto", "local", "win32", "smb")
+
+# \\server\share at the start of a UNC path
+_SHARE_ROOT = re.compile(r"^(\\\\[^\\]+\\[^\\]+)")
+
+# Global backend, created by get_backend from STORAGE_BACKEND
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def is_unc_path(path):
+    return bool(path) and path.startswith('\\')
+
+
+def basename(path):
+    """File name of a local or UNC path, on any OS (posixpath does not split on backslashes)."""
+    return os.path.basename(path.replace('\\', '/')) if is_unc_path(path) else os.path.basename(path)
+
+
+def share_root(unc_path):
+    """Returns \\\\server\\share of a UNC path, or None if it has no share part."""
+    match = _SHARE_ROOT.match(unc_path or "")
+    return match.group(1) if match else None
+
+
+class LocalBackend:
+    """
+    Reads paths with the operating system: local disks, mapped drives, and UNC paths
+    where the OS itself reaches the share (Windows).
+
+    With root set, UNC paths are read from <root>/<server>/<share>/... instead, so the
+    pipeline can be tested against a local copy of the share.
     """
-    Establishes a connection to a network share using provided credentials.
 
-    Args:
-        unc_path (str): The full UNC path to a file or directory on the share.
-        username (str): The username for authentication (e.g., 'DOMAIN\\user', '.\\user').
-        password (str): The password for authentication.
+    name = "local"
+
+    def __init__(self, root=None):
+        self.root = root
+
+    def local_path(self, path):
+        """The path to open with the OS, or None if only this backend can read it."""
+        if self.root and is_unc_path(path):
+            return os.path.join(self.root, *[part for part in path.split('\\') if part])
+        return path
+
+    def connect(self, unc_path, username, password):
+        return True
+
+    def open(self, path, mode='rb', buffering=-1):
+        return open(self.local_path(path), mode, buffering=buffering)
+
+    def exists(self, path):
+        return os.path.exists(self.local_path(path))
+
+    def getsize(self, path):
+        return os.path.getsize(self.local_path(path))
+
+    def readable(self, path):
+        """What pydicom.dcmread should be given for path: the OS path, or the file's contents in one read."""
+        local_path = self.local_path(path)
+        if local_path is not None:
+            return local_path
+        with self.open(path) as file:
+            return io.BytesIO(file.read())
 
-    Returns:
-        bool: True if connection succeeded or already exists, False otherwise.
+    def close(self):
+        pass
+
+
+class Win32Backend(LocalBackend):
     """
-    if not unc_path or not unc_path.startswith('\\'):
-        logging.debug(f"Path '{unc_path}' is not a UNC path. No connection needed.")
-        return True # Not a UNC path, so connection is implicitly successful
+    UNC paths through Windows networking (pywin32).
 
-    # Extract the share root (\\server\share) from the full path
-    match = re.match(r"^(\\\\[^\\]+\\[^\\]+)", unc_path)
-    if not match:
-        logging.error(f"Could not extract share root from UNC path: {unc_path}")
-        return False
-    share_root = match.group(1)
+    Each share root is connected with WNetAddConnection2 once. Later studies on the
+    same share skip the call; the root is re-checked every health_check_seconds and
+    reconnected if it is no longer reachable.
+    """
 
-    logging.info(f"Attempting connection to network share: {share_root}")
+    name = "win32"
 
-    try:
-        # Define the network resource
-        nr = win32wnet.NETRESOURCE()
-        nr.dwType = win32netcon.RESOURCETYPE_DISK
-        nr.lpRemoteName = share_root
-        # nr.lpLocalName = None  # No drive letter mapping needed
-
-        # Attempt to add the connection
-        # CONNECT_UPDATE_PROFILE ensures the connection is persistent for the user session
-        # but doesn't require mapping a drive letter.
-        win32wnet.WNetAddConnection2(nr, password, username, win32netcon.CONNECT_UPDATE_PROFILE)
-        logging.info(f"Successfully established connection to {share_root}")
+    def __init__(self, health_check_seconds=300):
+        super().__init__()
+        import pywintypes
+        import win32netcon
+        import win32wnet
+        self._pywintypes, self._win32netcon, self._win32wnet = pywintypes, win32netcon, win32wnet
+        self.health_check_seconds = health_check_seconds
+        self._connected = {} # Share root -> time.monotonic() of the last successful connect or check
+        self._lock = threading.Lock()
+
+    def connect(self, unc_path, username, password):
+        """
+        Establishes a connection to the share of unc_path using the given credentials.
+
+        Returns True if the connection succeeded or already exists (or the path is not
+        a UNC path), False otherwise.
+        """
+        if not is_unc_path(unc_path):
+            logging.debug(f"Path '{unc_path}' is not a UNC path. No connection needed.")
+            return True # Not a UNC path, so connection is implicitly successful
+
+        root = share_root(unc_path)
+        if not root:
+            logging.error(f"Could not extract share root from UNC path: {unc_path}")
+            return False
+
+        with self._lock:
+            checked = self._connected.get(root)
+        if checked is not None:
+            if time.monotonic() - checked < self.health_check_seconds:
+                return True
+            if os.path.isdir(root):
+                with self._lock:
+                    self._connected[root] = time.monotonic()
+                return True
+            logging.warning(f"Network share {root} is no longer reachable; reconnecting.")
+            with self._lock:
+                self._connected.pop(root, None)
+
+        if not self._add_connection(root, username, password):
+            return False
+        with self._lock:
+            self._connected[root] = time.monotonic()
         return True
 
-    except pywintypes.error as e:
-        # Error codes reference: https://learn.microsoft.com/en-us/windows/win32/debug/system-error-codes
-        # ERROR_ALREADY_ASSIGNED (85) or ERROR_SESSION_CREDENTIAL_CONFLICT (1219)
-        # often mean a connection exists, possibly with different credentials.
-        # ERROR_DEVICE_ALREADY_REMEMBERED (1202) can mean a persistent connection exists.
-        if e.winerror in (85, 1219, 1202):
-            logging.warning(f"Connection to {share_root} likely already exists or conflicts: {e.strerror} (Code: {e.winerror}). Assuming access is possible.")
-            # It's often okay to proceed if a connection already exists
+    def _add_connection(self, root, username, password):
+        logging.info(f"Attempting connection to network share: {root}")
+        try:
+            # Define the network resource
+            nr = self._win32wnet.NETRESOURCE()
+            nr.dwType = self._win32netcon.RESOURCETYPE_DISK
+            nr.lpRemoteName = root
+            # nr.lpLocalName = None  # No drive letter mapping needed
+
+            # Attempt to add the connection
+            # CONNECT_UPDATE_PROFILE ensures the connection is persistent for the user session
+            # but doesn't require mapping a drive letter.
+            self._win32wnet.WNetAddConnection2(nr, password, username, self._win32netcon.CONNECT_UPDATE_PROFILE)
+            logging.info(f"Successfully established connection to {root}")
             return True
-        # ERROR_LOGON_FAILURE (1326) - Bad username/password
-        elif e.winerror == 1326:
-            logging.error(f"Authentication failed for {share_root} with username '{username}'. Check credentials. Error: {e.strerror}")
+
+        except self._pywintypes.error as e:
+            # Error codes reference: https://learn.microsoft.com/en-us/windows/win32/debug/system-error-codes
+            # ERROR_ALREADY_ASSIGNED (85) or ERROR_SESSION_CREDENTIAL_CONFLICT (1219)
+            # often mean a connection exists, possibly with different credentials.
+            # ERROR_DEVICE_ALREADY_REMEMBERED (1202) can mean a persistent connection exists.
+            if e.winerror in (85, 1219, 1202):
+                logging.warning(f"Connection to {root} likely already exists or conflicts: {e.strerror} (Code: {e.winerror}). Assuming access is possible.")
+                # It's often okay to proceed if a connection already exists
+                return True
+            # ERROR_LOGON_FAILURE (1326) - Bad username/password
+            elif e.winerror == 1326:
+                logging.error(f"Authentication failed for {root} with username '{username}'. Check credentials. Error: {e.strerror}")
+                return False
+            # ERROR_BAD_NETPATH (53) - Network path not found
+            elif e.winerror == 53:
+                logging.error(f"Network path not found: {root}. Check server/share name. Error: {e.strerror}")
+                return False
+            else:
+                logging.error(f"Failed to connect to {root}: {e.strerror} (Code: {e.winerror})")
+                return False
+        except Exception as e:
+            logging.error(f"An unexpected error occurred during network share connection to {root}: {e}")
+            return False
+
+
+class SMBBackend(LocalBackend):
+    """
+    UNC paths through a pure-Python SMB client (smbprotocol's smbclient), for workers
+    without Windows networking, e.g. on Linux.
+
+    One session per server is registered and reused by every read (smbclient pools the
+    connections); it is re-checked every health_check_seconds and re-registered if the
+    share stopped answering. Paths that are not UNC paths are read from the local disk.
+    """
+
+    name = "smb"
+
+    def __init__(self, health_check_seconds=300, connection_timeout=60):
+        super().__init__()
+        import smbclient
+        self._smbclient = smbclient
+        self.health_check_seconds = health_check_seconds
+        self.connection_timeout = connection_timeout
+        self._sessions = {} # Server -> time.monotonic() of the last successful register or check
+        self._lock = threading.Lock()
+
+    def local_path(self, path):
+        return None if is_unc_path(path) else path
+
+    def connect(self, unc_path, username, password):
+        """Registers (or re-checks) the SMB session for the server of unc_path. Returns True on success."""
+        if not is_unc_path(unc_path):
+            return True
+        root = share_root(unc_path)
+        if not root:
+            logging.error(f"Could not extract share root from UNC path: {unc_path}")
             return False
-        # ERROR_BAD_NETPATH (53) - Network path not found
-        elif e.winerror == 53:
-             logging.error(f"Network path not found: {share_root}. Check server/share name. Error: {e.strerror}")
-             return False
-        else:
-            logging.error(f"Failed to connect to {share_root}: {e.strerror} (Code: {e.winerror})")
+        server = root.split('\\')[2]
+
+        with self._lock:
+            checked = self._sessions.get(server)
+        if checked is not None:
+            if time.monotonic() - checked < self.health_check_seconds:
+                return True
+            try:
+                self._smbclient.stat(root)
+                with self._lock:
+                    self._sessions[server] = time.monotonic()
+                return True
+            except Exception as e:
+                logging.warning(f"SMB session to {server} failed its health check ({e}); reconnecting.")
+                with self._lock:
+                    self._sessions.pop(server, None)
+                try:
+                    self._smbclient.delete_session(server)
+                except Exception:
+                    pass # The connection is already gone
+
+        logging.info(f"Opening SMB session to {server} for {root}")
+        try:
+            self._smbclient.register_session(server, username=username, password=password,
+                                             connection_timeout=self.connection_timeout)
+        except Exception as e:
+            logging.error(f"Failed to open an SMB session to {server} as '{username}': {e}")
             return False
-    except Exception as e:
-        logging.error(f"An unexpected error occurred during network share connection to {share_root}: {e}")
-        return False
+        with self._lock:
+            self._sessions[server] = time.monotonic()
+        return True
+
+    def open(self, path, mode='rb', buffering=-1):
+        if not is_unc_path(path):
+            return open(path, mode, buffering=buffering)
+        return self._smbclient.open_file(path, mode=mode, buffering=buffering)
+
+    def exists(self, path):
+        if not is_unc_path(path):
+            return os.path.exists(path)
+        try:
+            self._smbclient.stat(path)
+            return True
+        except OSError:
+            return False
+
+    def getsize(self, path):
+        if not is_unc_path(path):
+            return os.path.getsize(path)
+        return self._smbclient.stat(path).st_size
+
+    def close(self):
+        with self._lock:
+            self._sessions.clear()
+        self._smbclient.reset_connection_cache(fail_on_error=False)
+
+
+def _auto_backend(config):
+    """The backend "auto" stands for: Windows networking on Windows, else the SMB client when share credentials are set."""
+    if os.name == "nt":
+        return "win32"
+    if config.get("SHARE_USERNAME") and not config.get("STORAGE_LOCAL_ROOT"):
+        # Without Windows networking the OS cannot open the \\server\share paths from the RIS
+        logging.info("STORAGE_BACKEND 'auto' with SHARE_USERNAME set on a non-Windows host: using 'smb'.")
+        return "smb"
+    return "local"
+
+
+def _create_backend(config):
+    name = config.get("STORAGE_BACKEND", "auto")
+    if name == "auto":
+        name = _auto_backend(config)
+    health_check_seconds = float(config.get("STORAGE_HEALTH_CHECK_SECONDS", 300))
+    try:
+        if name == "win32":
+            return Win32Backend(health_check_seconds)
+        if name == "smb":
+            return SMBBackend(health_check_seconds, float(config.get("SMB_CONNECTION_TIMEOUT_SECONDS", 60)))
+    except ImportError as e:
+        package = "pywin32" if name == "win32" else "smbprotocol"
+        logging.error(f"STORAGE_BACKEND '{name}' needs the {package} package: {e}")
+        raise
+    if name != "local":
+        logging.error(f"Unknown STORAGE_BACKEND '{name}' (expected one of {', '.join(STORAGE_BACKENDS)}); using 'local'.")
+    return LocalBackend(config.get("STORAGE_LOCAL_ROOT"))
+
+
+def get_backend(config):
+    """Returns the shared storage backend, created from config (STORAGE_BACKEND) on first use."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = _create_backend(config)
+            logging.info(f"Reading DICOM files with the '{_backend.name}' storage backend.")
+        return _backend
+
+
+def close_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is not None:
+            _backend.close()
+            _backend = None
+
 
 # Example usage (for testing):
 # if __name__ == '__main__':
@@ -80,12 +321,13 @@ def connect_to_share(unc_path, username, password):
 #     test_path = r"\\172.31.100.60\Longterm\some\test\file.dcm" # Replace with a valid path on your share
 #     user = config.get('SHARE_USERNAME')
 #     pwd = config.get('SHARE_PASSWORD')
+#     storage = get_backend(config)
 
 #     if user and pwd:
-#         if connect_to_share(test_path, user, pwd):
+#         if storage.connect(test_path, user, pwd):
 #             print(f"Connection to share seems successful (or already exists).")
-#             # Try accessing the path now, e.g., os.path.exists(test_path)
+#             # Try accessing the path now, e.g., storage.exists(test_path)
 #         else:
 #             print(f"Failed to connect to the share.")
 #     else:
-#         print("SHARE_USERNAME or SHARE_PASSWORD not found in config.yaml") 
\ No newline at end of file
+#         print("SHARE_USERNAME or SHARE_PASSWORD not found in config.yaml")
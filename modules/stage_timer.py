@@ -0,0 +1,90 @@
+import time
+from contextlib import contextmanager
+
+from . import tracing
+from .logger_config import log_context
+
+# Callables observer(study_key, stage, seconds, nbytes) notified of every recorded stage
+# (seconds is None for byte-only updates); used by modules/metrics.
+_observers = []
+
+
+def add_observer(observer):
+    if observer not in _observers:
+        _observers.append(observer)
+
+
+class StageTimer:
+    """
+    Accumulates wall time (monotonic clock) and byte counts per pipeline stage for one study.
+
+    A stage may run more than once (e.g. the DICOM is read by extraction and by
+    transcription); durations, calls and bytes accumulate under the same name.
+    """
+
+    def __init__(self, study_key=None):
+        self.study_key = study_key
+        self.started = time.perf_counter()
+        self.stages = {} # name -> [seconds, calls, bytes]
+
+    @contextmanager
+    def stage(self, name):
+        # Each stage is also a span of the study's trace (a no-op unless tracing is on),
+        # and log records inside it carry the stage name
+        start = time.perf_counter()
+        try:
+            with tracing.span(name), log_context(stage=name):
+                yield self
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds, nbytes=0):
+        entry = self.stages.get(name)
+        if entry is None:
+            self.stages[name] = [seconds, 1, nbytes]
+        else:
+            entry[0] += seconds
+            entry[1] += 1
+            entry[2] += nbytes
+        for observer in _observers:
+            observer(self.study_key, name, seconds, nbytes)
+
+    def add_bytes(self, name, nbytes):
+        entry = self.stages.get(name)
+        if entry is None:
+            self.stages[name] = [0.0, 0, nbytes]
+        else:
+            entry[2] += nbytes
+        for observer in _observers:
+            observer(self.study_key, name, None, nbytes)
+
+    def as_document(self):
+        """Compact form stored on the study: milliseconds, plus calls/bytes only when informative."""
+        stages = {}
+        for name, (seconds, calls, nbytes) in self.stages.items():
+            entry = {"ms": round(seconds * 1000, 1)}
+            if calls > 1:
+                entry["calls"] = calls
+            if nbytes:
+                entry["bytes"] = nbytes
+            stages[name] = entry
+        return {"total_ms": round((time.perf_counter() - self.started) * 1000, 1), "stages": stages}
+
+
+class NullStageTimer:
+    """Stand-in used when a caller does not pass a timer."""
+
+    study_key = None
+
+    @contextmanager
+    def stage(self, name):
+        yield self
+
+    def record(self, name, seconds, nbytes=0):
+        pass
+
+    def add_bytes(self, name, nbytes):
+        pass
+
+
+NULL_TIMER = NullStageTimer()
@@ -0,0 +1,247 @@
+import argparse
+import glob
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from pymongo import monitoring
+
+# Mongo commands recorded as spans; reads are left to the metrics endpoint
+_MONGO_WRITE_COMMANDS = {"insert", "update", "delete", "findAndModify", "findandmodify"}
+# Spans waiting for the writer thread; beyond this they are dropped rather than slowing processing
+SPAN_QUEUE_SIZE = 10000
+
+_enabled = False
+_local = threading.local() # trace_id and the stack of open span ids, per thread
+_handler = None # _DroppingQueueHandler feeding the file writer thread
+_listener = None
+
+
+def _stack():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def current_trace_id():
+    return getattr(_local, "trace_id", None)
+
+
+def _export(record):
+    # The record is only queued here; the QueueListener thread writes and rotates the file,
+    # so a pipeline thread never waits on disk. The handler is called directly rather than
+    # through a logger so service log levels cannot filter spans.
+    handler = _handler
+    if handler is not None:
+        handler.handle(logging.makeLogRecord({"msg": json.dumps(record, default=str), "levelno": logging.INFO, "levelname": "INFO"}))
+
+
+@contextmanager
+def trace(trace_id, name="process_study", **attributes):
+    """Opens a trace (the study key is the trace ID) with a root span around the block."""
+    if not _enabled:
+        yield
+        return
+    previous_trace, previous_stack = current_trace_id(), getattr(_local, "stack", None)
+    _local.trace_id, _local.stack = str(trace_id), []
+    try:
+        with span(name, **attributes):
+            yield
+    finally:
+        _local.trace_id, _local.stack = previous_trace, previous_stack
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Records the block as a span of the current trace. A no-op outside a trace or
+    when tracing is off, so call sites need no guards.
+    """
+    trace_id = current_trace_id() if _enabled else None
+    if trace_id is None:
+        yield
+        return
+    stack = _stack()
+    span_id = uuid.uuid4().hex[:16]
+    parent_id = stack[-1] if stack else None
+    stack.append(span_id)
+    started = time.time()
+    start = time.perf_counter()
+    status, error = "ok", None
+    try:
+        yield
+    except BaseException as e:
+        status, error = "error", f"{type(e).__name__}: {e}"[:300]
+        raise
+    finally:
+        stack.pop()
+        record_span(trace_id, name, started, time.perf_counter() - start, span_id, parent_id, status, error, attributes)
+
+
+def record_span(trace_id, name, started, seconds, span_id=None, parent_id=None, status="ok", error=None, attributes=None):
+    """Exports one finished span; used directly for spans timed elsewhere (e.g. Mongo commands)."""
+    record = {
+        "trace_id": trace_id,
+        "span_id": span_id or uuid.uuid4().hex[:16],
+        "parent_id": parent_id,
+        "name": name,
+        "start": round(started, 6),
+        "duration_ms": round(seconds * 1000, 3),
+        "status": status,
+        "thread": threading.current_thread().name,
+    }
+    if error:
+        record["error"] = error
+    if attributes:
+        record["attributes"] = attributes
+    _export(record)
+
+
+class MongoWriteSpans(monitoring.CommandListener):
+    """Turns MongoDB write commands issued inside a trace into child spans of the current span."""
+
+    def started(self, event):
+        pass
+
+    def _finish(self, event, status, error=None):
+        trace_id = current_trace_id()
+        if trace_id is None or event.command_name not in _MONGO_WRITE_COMMANDS:
+            return
+        seconds = event.duration_micros / 1e6
+        stack = _stack()
+        record_span(trace_id, f"mongo.{event.command_name}", time.time() - seconds, seconds,
+                    parent_id=stack[-1] if stack else None, status=status, error=error)
+
+    def succeeded(self, event):
+        self._finish(event, "ok")
+
+    def failed(self, event):
+        self._finish(event, "error", str(event.failure)[:300])
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """Drops spans instead of blocking when the writer falls behind."""
+
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _DroppingQueueHandler.dropped += 1
+
+
+def install(config):
+    """
+    Starts exporting spans to TRACE_FILE (JSON lines, rotated at TRACE_MAX_BYTES).
+
+    Call before database_operations.connect_db so Mongo writes become spans.
+    """
+    global _enabled, _handler, _listener
+    if _enabled:
+        return
+    trace_file = config.get("TRACE_FILE", "traces/spans.jsonl")
+    directory = os.path.dirname(trace_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    file_handler = RotatingFileHandler(
+        trace_file,
+        maxBytes=int(config.get("TRACE_MAX_BYTES", 10 * 1024 * 1024)),
+        backupCount=int(config.get("TRACE_BACKUP_COUNT", 5)),
+        encoding="utf-8",
+    )
+    file_handler.setFormatter(logging.Formatter("%(message)s"))
+    span_queue = queue.Queue(maxsize=SPAN_QUEUE_SIZE)
+    _handler = _DroppingQueueHandler(span_queue)
+    _listener = QueueListener(span_queue, file_handler)
+    _listener.start()
+    _enabled = True
+    logging.info(f"Tracing enabled; spans are written to {trace_file}")
+
+
+def mongo_listeners():
+    return [MongoWriteSpans()] if _enabled else []
+
+
+def shutdown():
+    """Writes out queued spans and stops the exporter thread."""
+    global _enabled, _handler, _listener
+    _enabled = False
+    _handler = None
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    if _DroppingQueueHandler.dropped:
+        logging.warning(f"{_DroppingQueueHandler.dropped} trace spans were dropped because the trace writer fell behind.")
+
+
+# --- Timeline CLI ---
+
+def load_spans(trace_file, trace_id):
+    """All spans of one trace from the trace file and its rotated backups, oldest first."""
+    spans = []
+    for path in sorted(glob.glob(trace_file + "*"), reverse=True):
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                if f'"{trace_id}"' not in line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get("trace_id") == trace_id:
+                    spans.append(record)
+    spans.sort(key=lambda record: record["start"])
+    return spans
+
+
+def format_timeline(spans, width=50):
+    """
+    Renders each run (root span) of a trace as an indented tree with one bar per span,
+    positioned and sized on the run's time axis.
+    """
+    children = {}
+    for record in spans:
+        children.setdefault(record.get("parent_id"), []).append(record)
+    lines = []
+    for root in children.get(None, []):
+        total = max(root["duration_ms"], 0.001)
+        started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(root["start"]))
+        lines.append(f"{root['name']} started {started}, {root['duration_ms'] / 1000:.2f} s{'' if root['status'] == 'ok' else ' [' + root['status'] + ']'}")
+
+        def walk(record, depth):
+            offset_ms = (record["start"] - root["start"]) * 1000
+            begin = min(width - 1, max(0, int(offset_ms / total * width)))
+            length = max(1, int(round(record["duration_ms"] / total * width)))
+            bar = " " * begin + "#" * min(length, width - begin)
+            label = "  " * depth + record["name"]
+            flag = "" if record["status"] == "ok" else f"  !! {record.get('error', record['status'])}"
+            lines.append(f"  {offset_ms / 1000:8.2f}s |{bar:<{width}}| {record['duration_ms'] / 1000:8.3f}s  {label}{flag}")
+            for child in children.get(record["span_id"], []):
+                walk(child, depth + 1)
+
+        walk(root, 0)
+        lines.append("")
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    # python -m modules.tracing STUDY_KEY [--file traces/spans.jsonl]
+    parser = argparse.ArgumentParser(description="Print the span timeline recorded for a study.")
+    parser.add_argument("study_key")
+    parser.add_argument("--file", default="traces/spans.jsonl", help="TRACE_FILE of the service (rotated backups are read too)")
+    parser.add_argument("--width", type=int, default=50)
+    args = parser.parse_args()
+
+    recorded = load_spans(args.file, args.study_key)
+    if not recorded:
+        print(f"No spans for study {args.study_key} in {args.file}*")
+    else:
+        print(format_timeline(recorded, args.width))
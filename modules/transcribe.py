@@ -3,8 +3,14 @@ import pydicom
 import google.generativeai as genai
 import google.api_core.exceptions as google_exceptions
 import logging
+import os
 from pydantic import BaseModel
 import json
+from .stage_timer import NULL_TIMER
+from . import metrics, smb_connect
+
+# Bump whenever the prompt in Transcribe.transcribe changes; it is stored with every transcription.
+PROMPT_VERSION = "1"
 
 class Transcription(BaseModel):
     Reading: str
@@ -14,16 +20,18 @@ class Transcribe:
     def __init__(self, config):
         genai.configure(api_key=config["GEMINI_API_KEY"])
         self.model = genai.GenerativeModel(config["MODEL_NAME"])
+        self.storage = smb_connect.get_backend(config)
         self.logger = logging.getLogger('detailed')
 
-    def transcribe(self, dcm_path, audio_path):
+    def transcribe(self, dcm_path, audio_path, timer=NULL_TIMER):
         self.logger.info(f"Transcribing audio file: {audio_path} for DICOM file: {dcm_path}")
 
         try:
             # Read DICOM file
             self.logger.debug(f"Reading DICOM file: {dcm_path}")
             try:
-                ds = pydicom.dcmread(dcm_path)
+                with timer.stage("dicom_read"):
+                    ds = pydicom.dcmread(self.storage.readable(dcm_path))
                 self.logger.debug("DICOM file read successfully")
             except FileNotFoundError:
                 self.logger.error(f"DICOM file not found: {dcm_path}")
@@ -39,7 +47,9 @@ class Transcribe:
             # Upload audio file to Gemini API
             self.logger.debug(f"Uploading audio file: {audio_path} to Gemini API")
             try:
-                uploaded_file = genai.upload_file(audio_path)
+                with timer.stage("upload"), metrics.count_errors(metrics.GEMINI_ERRORS, operation="upload"):
+                    uploaded_file = genai.upload_file(audio_path)
+                timer.add_bytes("upload", os.path.getsize(audio_path))
                 self.logger.debug(f"Audio file uploaded successfully: {uploaded_file}")
             except FileNotFoundError:
                 self.logger.error(f"Audio file not found: {audio_path}")
@@ -86,13 +96,14 @@ Follow these instructions STRICTLY:
             self.logger.debug("Generating content with Gemini API")
 
             try:
-                response = self.model.generate_content(
-                    [uploaded_file, prompt],
-                    generation_config=genai.GenerationConfig(
-                        response_mime_type="application/json"
-                        # response_schema=Transcription
+                with timer.stage("generation"), metrics.count_errors(metrics.GEMINI_ERRORS, operation="generate"):
+                    response = self.model.generate_content(
+                        [uploaded_file, prompt],
+                        generation_config=genai.GenerationConfig(
+                            response_mime_type="application/json"
+                            # response_schema=Transcription
+                        )
                     )
-                )
                 raw_json_response = response.text
                 self.logger.info(f"Transcription completed for audio file: {audio_path}")
                 # self.logger.debug(f"Raw response text was: {raw_json_response}") # Log raw before stripping if needed
@@ -118,15 +129,18 @@ Follow these instructions STRICTLY:
                              #     return None
                              return transcription_dict # Return the validated dictionary
                         else:
+                            metrics.GEMINI_ERRORS.inc(operation="generate", error="MissingFields")
                             self.logger.error("Parsed dictionary is missing 'Reading' or 'Conclusion' key.")
                             self.logger.debug(f"Parsed dictionary was: {transcription_dict}")
                             return None
                     else:
+                        metrics.GEMINI_ERRORS.inc(operation="generate", error="NotAnObject")
                         self.logger.error(f"Expected a dictionary, but parsing yielded: {type(transcription_dict)}")
                         self.logger.debug(f"Parsed response was: {transcription_dict}")
                         return None
 
                 except json.JSONDecodeError as json_err:
+                    metrics.GEMINI_ERRORS.inc(operation="generate", error="JSONDecodeError")
                     self.logger.error(f"Failed to parse JSON response from Gemini: {json_err}")
                     # self.logger.debug(f"Raw response text was: {report_content}") # Use new variable name
                     self.logger.debug(f"Raw response text was: {raw_json_response}")
@@ -0,0 +1,20 @@
+"""Monitor shutdown: the cleanup runs however the monitoring loop ends."""
+import pytest
+
+database_monitor = pytest.importorskip("modules.database_monitor")
+
+
+def test_ctrl_c_still_shuts_down(monkeypatch):
+    closed = []
+    for module, name in ((database_monitor.prefetch, "close_prefetcher"), (database_monitor.dicom_store, "close_sink"),
+                         (database_monitor.smb_connect, "close_backend"), (database_monitor.db_ops, "close_status_writer")):
+        monkeypatch.setattr(module, name, lambda name=name: closed.append(name))
+    monitor = database_monitor.DatabaseMonitor({})
+
+    def interrupted():
+        raise KeyboardInterrupt
+    monkeypatch.setattr(monitor, "_monitor", interrupted)
+
+    with pytest.raises(KeyboardInterrupt):
+        monitor.start_monitoring()
+    assert closed == ["close_prefetcher", "close_sink", "close_backend", "close_status_writer"]
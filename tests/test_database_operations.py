@@ -0,0 +1,136 @@
+"""StatusWriter buffering and flushing, against mongomock."""
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from modules import database_operations as db_ops
+
+
+@pytest.fixture
+def database():
+    return mongomock.MongoClient()["test"]
+
+
+@pytest.fixture
+def writer(database):
+    # A long interval keeps the background thread out of the way; flushes happen when the test asks
+    writer = db_ops.StatusWriter({"STATUS_FLUSH_INTERVAL_SECONDS": 3600, "STATUS_FLUSH_BATCH_SIZE": 100}, database)
+    yield writer
+    writer._stop.set()
+
+
+def fail_next_bulk_write(monkeypatch, writer):
+    real = writer.collection.bulk_write
+    calls = []
+
+    def bulk_write(operations, **kwargs):
+        calls.append(len(operations))
+        if len(calls) == 1:
+            raise AutoReconnect("connection reset")
+        return real(operations, **kwargs)
+    monkeypatch.setattr(writer.collection, "bulk_write", bulk_write)
+    return calls
+
+
+def test_transitions_are_coalesced_into_one_write(writer, database):
+    writer.submit("s1", "processing_query")
+    writer.submit("s1", "processing_audio", dicom_path="/a.dcm")
+    writer.submit_fields("s1", {"timings": {"total_ms": 1.0}})
+    writer.flush()
+
+    study = database.studies.find_one({"study_key": "s1"})
+    assert study["status"] == "processing_audio"
+    assert study["dicom_path"] == "/a.dcm"
+    assert study["timings"] == {"total_ms": 1.0}
+
+
+def test_failed_flush_is_retried_by_the_next_one(writer, database, monkeypatch):
+    calls = fail_next_bulk_write(monkeypatch, writer)
+    writer.submit("s1", "processing_audio", dicom_path="/a.dcm")
+    writer.submit("s2", "transcribing")
+    writer.submit_update("s2", {"$set": {"checkpoints.resolve": {"dicom_path": "/b.dcm"}}})
+    writer.flush()
+    assert database.studies.count_documents({}) == 0
+
+    writer.flush()
+    assert calls == [2, 2]
+    assert database.studies.find_one({"study_key": "s1"})["status"] == "processing_audio"
+    study = database.studies.find_one({"study_key": "s2"})
+    assert study["status"] == "transcribing"
+    assert study["checkpoints"] == {"resolve": {"dicom_path": "/b.dcm"}}
+
+
+def test_updates_submitted_after_a_failed_flush_win(writer, database, monkeypatch):
+    fail_next_bulk_write(monkeypatch, writer)
+    writer.submit("s1", "processing_audio", dicom_path="/a.dcm")
+    writer.flush()
+    received = writer._pending["s1"]["$setOnInsert"]["received_timestamp"]
+
+    writer.submit("s1", "error", error_message="boom")  # Terminal: flushes at once
+    study = database.studies.find_one({"study_key": "s1"})
+    assert study["status"] == "error"
+    assert study["error_message"] == "boom"
+    assert study["dicom_path"] == "/a.dcm"
+    assert study["received_timestamp"] == received.replace(microsecond=received.microsecond // 1000 * 1000) # BSON dates keep ms
+
+
+def test_setoninsert_of_a_later_transition_is_kept(writer, database):
+    writer.submit_fields("s1", {"timings": {}})
+    writer.submit("s1", "processing_query")
+    writer.flush()
+
+    study = database.studies.find_one({"study_key": "s1"})
+    assert study["status"] == "processing_query"
+    assert "received_timestamp" in study
+
+
+def test_pending_update_covers_the_batch_being_written(writer, monkeypatch):
+    real = writer.collection.bulk_write
+    seen = []
+
+    def bulk_write(operations, **kwargs):
+        seen.append(writer.pending_update("s1"))
+        return real(operations, **kwargs)
+    monkeypatch.setattr(writer.collection, "bulk_write", bulk_write)
+    writer.submit_update("s1", {"$set": {"checkpoints.resolve": {"dicom_path": "/a.dcm"}}})
+    writer.flush()
+
+    assert seen[0]["$set"]["checkpoints.resolve"] == {"dicom_path": "/a.dcm"}
+    assert writer.pending_update("s1") is None
+
+
+def test_get_checkpoints_applies_buffered_changes_without_flushing(writer, database, monkeypatch):
+    monkeypatch.setattr(db_ops, "get_db", lambda config: database)
+    monkeypatch.setattr(db_ops, "status_writer", writer)
+    database.studies.insert_one({"study_key": "s1", "checkpoints": {"resolve": {"dicom_path": "/a.dcm"},
+                                                                    "extract": {"audio_path": "/a.wav"}}})
+    db_ops.set_checkpoint({}, "s1", "transcribe", {"attempt": 2}, clear=("extract",))
+
+    checkpoints = db_ops.get_checkpoints({}, "s1")
+    assert set(checkpoints) == {"resolve", "transcribe"}
+    assert checkpoints["transcribe"]["attempt"] == 2
+    assert "transcribe" not in database.studies.find_one({"study_key": "s1"})["checkpoints"] # Still buffered
+
+
+def test_retryable_write_errors_are_requeued(writer, database, monkeypatch):
+    real = writer.collection.bulk_write
+
+    def bulk_write(operations, **kwargs):
+        real(operations[1:2], **kwargs)
+        raise BulkWriteError({"writeErrors": [
+            {"index": 0, "code": 11000, "errmsg": "E11000 duplicate key error"},
+            {"index": 2, "code": 121, "errmsg": "Document failed validation"},
+        ]})
+    monkeypatch.setattr(writer.collection, "bulk_write", bulk_write)
+    writer.submit("s1", "processing_audio")
+    writer.submit("s2", "transcribing")
+    writer.submit("s3", "transcribing")
+    writer.flush()
+
+    assert database.studies.find_one({"study_key": "s2"})["status"] == "transcribing"
+    assert set(writer._pending) == {"s1"} # s2 was written, s3 would be rejected again
+    monkeypatch.setattr(writer.collection, "bulk_write", real)
+    writer.flush()
+    assert database.studies.find_one({"study_key": "s1"})["status"] == "processing_audio"
@@ -0,0 +1,198 @@
+"""DicomStoreSink against the local storage SCP stand-in (modules.dicom_store.start_local_storage_scp)."""
+import socket
+import time
+
+import pytest
+
+pytest.importorskip("pynetdicom")
+
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+from pynetdicom import AE, evt, StoragePresentationContexts
+from pynetdicom.sop_class import EnhancedSRStorage
+
+from modules import dicom_store
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def make_sr():
+    ds = Dataset()
+    ds.SOPClassUID = EnhancedSRStorage
+    ds.SOPInstanceUID = generate_uid()
+    ds.Modality = "SR"
+    ds.file_meta = FileMetaDataset()
+    ds.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    return ds
+
+
+def sink_config(port, **overrides):
+    config = {"SR_CSTORE_HOST": "127.0.0.1", "SR_CSTORE_PORT": port, "SR_CSTORE_CALLED_AE": "LOCAL_SCP",
+              "SR_CSTORE_POOL_SIZE": 1, "SR_CSTORE_TIMEOUT_SECONDS": 5}
+    config.update(overrides)
+    return config
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+@pytest.fixture
+def scp():
+    """Local storage SCP; yields (server, port, received datasets)."""
+    port, received = free_port(), []
+    server = dicom_store.start_local_storage_scp(port=port, received=received)
+    yield server, port, received
+    server.shutdown()
+
+
+@pytest.fixture
+def sink_factory():
+    sinks = []
+
+    def create(config):
+        sink = dicom_store.DicomStoreSink(config)
+        sinks.append(sink)
+        return sink
+    yield create
+    for sink in sinks:
+        sink.close()
+
+
+def count_opens(sink):
+    opened = []
+    original = sink._open
+
+    def _open():
+        assoc = original()
+        opened.append(assoc)
+        return assoc
+    sink._open = _open
+    return opened
+
+
+def test_association_is_reused_between_stores(scp, sink_factory):
+    _, port, received = scp
+    sink = sink_factory(sink_config(port))
+    opened = count_opens(sink)
+
+    for _ in range(3):
+        assert sink.store(make_sr())
+    assert len(received) == 3
+    assert len(opened) == 1
+    assert opened[0].is_established # Kept open in the pool
+
+
+def test_reconnects_after_the_scp_aborts_an_idle_association(scp, sink_factory):
+    server, port, received = scp
+    sink = sink_factory(sink_config(port))
+    opened = count_opens(sink)
+    assert sink.store(make_sr())
+
+    for assoc in server.active_associations:
+        assoc.abort()
+    assert wait_for(lambda: not opened[0].is_established)
+
+    assert sink.store(make_sr())
+    assert len(received) == 2
+    assert len(opened) == 2
+
+
+def test_reconnects_and_resends_when_aborted_mid_send(sink_factory):
+    port, received, aborted = free_port(), [], []
+
+    def handle_store(event):
+        if len(received) == 2 and not aborted:
+            # Drop the association before answering the third C-STORE
+            aborted.append(event.request.AffectedSOPInstanceUID)
+            event.assoc.abort()
+            return 0xC000
+        received.append(event.dataset.SOPInstanceUID)
+        return 0x0000
+
+    ae = AE(ae_title="LOCAL_SCP")
+    ae.supported_contexts = StoragePresentationContexts
+    server = ae.start_server(("127.0.0.1", port), block=False, evt_handlers=[(evt.EVT_C_STORE, handle_store)])
+    try:
+        sink = sink_factory(sink_config(port))
+        opened = count_opens(sink)
+        datasets = [make_sr() for _ in range(4)]
+
+        assert [sink.store(ds) for ds in datasets] == [True] * 4
+        assert received == [ds.SOPInstanceUID for ds in datasets]
+        assert aborted == [datasets[2].SOPInstanceUID]
+        assert len(opened) == 2
+    finally:
+        server.shutdown()
+
+
+def test_store_fails_without_scp(sink_factory):
+    sink = sink_factory(sink_config(free_port()))
+    assert not sink.store(make_sr())
+    assert not sink.store(make_sr()) # The pool slot was given back
+    assert sink._idle.empty()
+
+
+def test_an_error_opening_the_association_frees_its_pool_slot(sink_factory, monkeypatch):
+    sink = sink_factory(sink_config(free_port()))
+
+    def associate(*args, **kwargs):
+        raise OSError("no route to host")
+    monkeypatch.setattr(sink.ae, "associate", associate)
+
+    for _ in range(2): # With a pool of one, a leaked slot would block the second call for good
+        with pytest.raises(OSError):
+            sink.store(make_sr())
+    assert sink._slots.acquire(timeout=1)
+
+
+def test_deliver_sr_falls_back_to_the_spool_folder(tmp_path, sink_factory, monkeypatch):
+    processing_worker = pytest.importorskip("modules.processing_worker") # Needs the whole pipeline's dependencies
+
+    config = dict(sink_config(free_port()), SR_CSTORE="ON")
+    monkeypatch.setattr(dicom_store, "_sink", sink_factory(config))
+    saved = []
+
+    class Encapsulator:
+        sr_output_folder = str(tmp_path)
+
+        def build_sr_dataset(self, transcription_dict, dicom_path):
+            return make_sr()
+
+        def save_sr_dataset(self, sr_ds):
+            saved.append(sr_ds.SOPInstanceUID)
+            return str(tmp_path / f"{sr_ds.SOPInstanceUID}.dcm")
+
+    path = processing_worker.deliver_sr(config, Encapsulator(), {"Reading": "r", "Conclusion": "c"}, "study.dcm")
+    assert path == str(tmp_path / f"{saved[0]}.dcm")
+
+
+def test_deliver_sr_returns_a_dicom_reference_when_stored(scp, sink_factory, monkeypatch):
+    processing_worker = pytest.importorskip("modules.processing_worker") # Needs the whole pipeline's dependencies
+
+    _, port, received = scp
+    config = dict(sink_config(port), SR_CSTORE="ON")
+    monkeypatch.setattr(dicom_store, "_sink", sink_factory(config))
+    sr = make_sr()
+
+    class Encapsulator:
+        sr_output_folder = None
+
+        def build_sr_dataset(self, transcription_dict, dicom_path):
+            return sr
+
+        def save_sr_dataset(self, sr_ds):
+            raise AssertionError("stored SRs must not be spooled")
+
+    path = processing_worker.deliver_sr(config, Encapsulator(), {"Reading": "r", "Conclusion": "c"}, "study.dcm")
+    assert path == f"dicom://LOCAL_SCP@127.0.0.1:{port}/{sr.SOPInstanceUID}"
+    assert [ds.SOPInstanceUID for ds in received] == [sr.SOPInstanceUID]
@@ -0,0 +1,114 @@
+"""Directory mode: the file index, in-flight claims and the walk, with a stand-in worker."""
+import os
+import time
+
+import pytest
+
+directory_mode = pytest.importorskip("modules.directory_mode")
+
+DICOM_PREAMBLE = b"\0" * 128 + b"DICM"
+
+
+def write_dicom(path, payload=b"waveform"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(DICOM_PREAMBLE + payload)
+
+
+class FakeWorker:
+    """Stands in for DirectoryWorker: records the calls and holds each file long enough to overlap."""
+
+    instances = []
+
+    def __init__(self, config, root, output, sr_root, work_dir):
+        self.calls = []
+        FakeWorker.instances.append(self)
+
+    def process_file(self, path, study_key):
+        self.calls.append((path, study_key))
+        time.sleep(0.2)
+        return directory_mode.DONE, None
+
+
+@pytest.fixture
+def fake_worker(monkeypatch):
+    FakeWorker.instances = []
+    monkeypatch.setattr(directory_mode, "DirectoryWorker", FakeWorker)
+    return FakeWorker
+
+
+def processed(fake_worker):
+    return [call for worker in fake_worker.instances for call in worker.calls]
+
+
+def test_claim_is_exclusive_until_released(tmp_path):
+    index = directory_mode.DirectoryIndex(str(tmp_path / "index.sqlite"))
+    assert index.claim("abc")
+    assert not index.claim("abc")
+    index.release("abc")
+    assert index.claim("abc")
+    index.release("abc")
+
+    index.record("abc", "/x.dcm", 1, 1, "file-abc", directory_mode.DONE)
+    assert not index.claim("abc")
+    index.close()
+
+
+def test_identical_files_are_processed_once(tmp_path, fake_worker):
+    write_dicom(str(tmp_path / "in" / "a" / "x.dcm"))
+    write_dicom(str(tmp_path / "in" / "b" / "x.dcm"))
+
+    counts = directory_mode.run_directory({}, str(tmp_path / "in"), workers=2,
+                                          index_path=str(tmp_path / "index.sqlite"), work_dir=str(tmp_path / "work"))
+
+    assert len(processed(fake_worker)) == 1
+    assert counts["done"] == 1
+    assert counts["skipped"] == 1
+
+
+def test_unchanged_finished_files_are_not_read(tmp_path, fake_worker, monkeypatch):
+    path = str(tmp_path / "in" / "x.dcm")
+    write_dicom(path)
+    index_path = str(tmp_path / "index.sqlite")
+    directory_mode.run_directory({}, str(tmp_path / "in"), workers=1, index_path=index_path,
+                                 work_dir=str(tmp_path / "work"))
+
+    def unexpected_read(path):
+        raise AssertionError(f"{path} was read")
+    monkeypatch.setattr(directory_mode, "is_dicom", unexpected_read)
+    monkeypatch.setattr(directory_mode, "audio_hash", unexpected_read)
+    counts = directory_mode.run_directory({}, str(tmp_path / "in"), workers=1, index_path=index_path,
+                                          work_dir=str(tmp_path / "work"))
+
+    assert counts["skipped"] == 1
+    assert len(processed(fake_worker)) == 1
+
+
+def test_interrupt_is_raised_after_the_queue_is_drained(tmp_path, fake_worker, monkeypatch):
+    for number in range(3):
+        write_dicom(str(tmp_path / "in" / f"{number}.dcm"), payload=bytes([number]))
+    real_walk = directory_mode.walk_files
+
+    def interrupted_walk(root, pattern="*"):
+        for number, path in enumerate(real_walk(root, pattern)):
+            if number == 1:
+                raise KeyboardInterrupt
+            yield path
+    monkeypatch.setattr(directory_mode, "walk_files", interrupted_walk)
+
+    with pytest.raises(KeyboardInterrupt):
+        directory_mode.run_directory({}, str(tmp_path / "in"), workers=1,
+                                     index_path=str(tmp_path / "index.sqlite"), work_dir=str(tmp_path / "work"))
+    assert len(processed(fake_worker)) <= 1
+
+
+def test_no_wav_is_left_for_files_without_audio(tmp_path):
+    class NoWaveform:
+        def extract_audio(self, path, timer=None, wav_path=None):
+            raise AttributeError("DICOM file does not contain a WaveformSequence.")
+
+    worker = object.__new__(directory_mode.DirectoryWorker) # Without the Gemini client
+    worker.work_dir, worker.extractor, worker.logger = str(tmp_path), NoWaveform(), directory_mode.logging.getLogger()
+
+    assert worker.process_file(str(tmp_path / "image.dcm"), "file-0") == (directory_mode.NOT_AUDIO, None)
+    assert os.listdir(tmp_path) == []
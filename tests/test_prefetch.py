@@ -0,0 +1,117 @@
+"""Prefetcher: shared RIS lookups and concurrent copies of the same source file."""
+import os
+import time
+
+import pytest
+
+prefetch = pytest.importorskip("modules.prefetch")
+
+from modules import smb_connect
+
+
+class SlowBackend(smb_connect.LocalBackend):
+    """Local reads that take a while to open, so copies started together overlap."""
+
+    def open(self, path, mode='rb', buffering=-1):
+        time.sleep(0.2)
+        return super().open(path, mode, buffering)
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = str(tmp_path / "share" / "x.dcm")
+    os.makedirs(os.path.dirname(path))
+    with open(path, "wb") as file:
+        file.write(os.urandom(100_000))
+    return path
+
+
+@pytest.fixture
+def lookups(monkeypatch, source):
+    calls = []
+
+    def process_study_key(config, study_key, report_stat=None):
+        calls.append(study_key)
+        return source
+    monkeypatch.setattr(prefetch, "process_study_key", process_study_key)
+    return calls
+
+
+@pytest.fixture
+def prefetcher(tmp_path, monkeypatch):
+    monkeypatch.setattr(smb_connect, "get_backend", lambda config=None: SlowBackend())
+    prefetcher = prefetch.get_prefetcher({"PREFETCH": "ON", "PREFETCH_CACHE_DIR": str(tmp_path / "cache"),
+                                          "PREFETCH_WORKERS": 2, "PREFETCH_AHEAD": 4})
+    yield prefetcher
+    prefetch.close_prefetcher()
+
+
+def wait_for_copies(prefetcher, study_keys):
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        with prefetcher._condition:
+            events = [prefetcher._copying.get(study_key) for study_key in study_keys]
+        if all(event is not None and event.is_set() for event in events):
+            return
+        time.sleep(0.01)
+    raise AssertionError("prefetch did not finish")
+
+
+def test_concurrent_copies_of_one_source_keep_the_cached_copy(prefetcher, lookups, source):
+    prefetcher.add(["s1", "s2"])
+    wait_for_copies(prefetcher, ["s1", "s2"])
+
+    local_paths = {prefetch.local_path(study_key, source) for study_key in ("s1", "s2")}
+    assert len(local_paths) == 1
+    local_path = local_paths.pop()
+    assert local_path != source
+    with open(local_path, "rb") as copy, open(source, "rb") as original:
+        assert copy.read() == original.read()
+    assert os.listdir(os.path.dirname(local_path)) == [os.path.basename(source)] # No partial files left
+    assert len(prefetcher.cache._entries) == 1
+    assert prefetcher.cache.total_bytes == os.path.getsize(source)
+    assert len(os.listdir(prefetcher.cache.directory)) == 1 # The discarded copy's folder is gone
+
+
+def test_pipeline_reuses_the_prefetched_lookup(prefetcher, lookups, source):
+    prefetcher.add(["s1"])
+    wait_for_copies(prefetcher, ["s1"])
+
+    assert prefetch.resolve_path({}, "s1") == source
+    assert lookups == ["s1"]
+
+    prefetch.release("s1")
+    assert prefetch.resolve_path({}, "s1") == source
+    assert lookups == ["s1", "s1"]
+    assert "s1" not in prefetcher._sources # A lookup after the release is not kept
+
+
+def test_prefetch_reuses_the_pipeline_lookup(prefetcher, lookups, source):
+    with prefetcher._condition:
+        prefetcher._seen.add("s1") # Queued, not yet taken by a prefetch worker
+    assert prefetch.resolve_path({}, "s1") == source
+    with prefetcher._condition:
+        prefetcher._seen.discard("s1")
+    prefetcher.add(["s1"])
+    wait_for_copies(prefetcher, ["s1"])
+
+    assert lookups == ["s1"]
+    assert prefetch.local_path("s1", source) != source
+
+
+def test_eviction_leaves_a_newer_copy_of_the_same_source(prefetcher, source, tmp_path):
+    cache = prefetcher.cache
+    first, second = cache.new_local_path(source), cache.new_local_path(source)
+    assert os.path.dirname(first) != os.path.dirname(second)
+    for path in (first, second):
+        with open(path, "wb") as file:
+            file.write(b"copy")
+    cache.add(source, first, 4)
+
+    other = cache.new_local_path("/elsewhere/y.dcm")
+    cache.max_bytes = 4
+    cache.add("/elsewhere/y.dcm", other, 4) # Evicts the first copy of source
+
+    assert cache.get(source) is None
+    assert not os.path.exists(first)
+    assert os.path.exists(second) # Still being written by another copy of the same source
@@ -0,0 +1,83 @@
+"""Stage checkpoints of the pipeline, against mongomock."""
+import os
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+processing_worker = pytest.importorskip("modules.processing_worker")
+
+from modules import database_operations as db_ops
+from modules import prefetch, smb_connect
+
+CONFIG = {"STAGE_CHECKPOINTS": "ON", "STATUS_BUFFERING": "ON", "STATUS_FLUSH_INTERVAL_SECONDS": 3600,
+          "STORAGE_BACKEND": "local"}
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = mongomock.MongoClient()["test"]
+    monkeypatch.setattr(db_ops, "get_db", lambda config: database)
+    yield database
+    db_ops.close_status_writer()
+    smb_connect.close_backend()
+
+
+def start(study_key):
+    job = processing_worker.StudyJob(CONFIG, study_key)
+    processing_worker.start_study(job)
+    return job
+
+
+def test_unreadable_resolved_path_is_not_reused(database, monkeypatch, tmp_path):
+    lookups = []
+
+    def resolve_path(config, study_key, report_stat=None):
+        lookups.append(study_key)
+        return str(tmp_path / "missing.dcm")
+    monkeypatch.setattr(prefetch, "resolve_path", resolve_path)
+
+    for _ in range(2):
+        job = start("s1")
+        assert processing_worker.run_stage(processing_worker.resolve_stage, job)
+        assert "resolve" in job.checkpoints
+        assert not processing_worker.run_stage(processing_worker.extract_stage, job)
+        assert "resolve" not in job.checkpoints
+        wav_path = job.audio_path
+        processing_worker.finish_study(job)
+        assert not os.path.exists(wav_path) # The WAV created for the failed extraction is removed
+        db_ops.flush_status_updates()
+        assert "resolve" not in database.studies.find_one({"study_key": "s1"}).get("checkpoints", {})
+
+    assert lookups == ["s1", "s1"] # The second run asked the RIS again
+    assert database.studies.find_one({"study_key": "s1"})["status"] == "error"
+
+
+def test_resolve_checkpoint_is_reused_without_a_flush(database, monkeypatch, tmp_path):
+    monkeypatch.setattr(prefetch, "resolve_path", lambda config, study_key, report_stat=None: str(tmp_path / "x.dcm"))
+    job = start("s1")
+    assert processing_worker.run_stage(processing_worker.resolve_stage, job)
+
+    writer = db_ops.get_status_writer(CONFIG)
+    flushes = []
+    real = writer.collection.bulk_write
+    monkeypatch.setattr(writer.collection, "bulk_write", lambda *args, **kwargs: flushes.append(1) or real(*args, **kwargs))
+    assert start("s1").checkpoints["resolve"]["dicom_path"] == str(tmp_path / "x.dcm")
+    assert flushes == []
+
+
+def test_writeback_checkpoint_is_written_at_once(database, monkeypatch):
+    class StoreTranscribedReport:
+        def __init__(self, config):
+            pass
+
+        def store_transcribed_report(self, study_key, transcriptions):
+            pass
+    monkeypatch.setattr(processing_worker, "StoreTranscribedReport", StoreTranscribedReport)
+    config = dict(CONFIG, STORE_TRANSCRIBED_REPORT="ON")
+    job = processing_worker.StudyJob(config, "s1")
+    processing_worker.start_study(job)
+    job.transcription = {"Reading": "r", "Conclusion": "c"}
+
+    assert processing_worker.deliver_stage(job)
+    study = database.studies.find_one({"study_key": "s1"}) # Not flushed by the test
+    assert study["checkpoints"]["writeback"]["status"] == "done"
@@ -0,0 +1,53 @@
+"""Profiling sessions: stage runs of the staged pipeline, profiled on different threads and merged."""
+import os
+import threading
+
+import pytest
+
+from modules import profiling
+
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    monkeypatch.setitem(profiling._settings, "dir", str(tmp_path))
+    monkeypatch.setattr(profiling, "_start_memory_snapshots", lambda: None)
+    yield tmp_path
+    profiling.shutdown()
+    profiling._stop.clear()
+
+
+def busy_stage(study_key, first):
+    with profiling.profile_stage(study_key, first=first):
+        sum(number * number for number in range(10_000))
+
+
+def run_on_thread(target, *args):
+    thread = threading.Thread(target=target, args=args)
+    thread.start()
+    thread.join()
+
+
+def test_stage_runs_are_merged_into_one_profile(session):
+    profiling.request(studies=2)
+    for study_key in ("s1", "s2", "s3"):
+        run_on_thread(busy_stage, study_key, True)
+    run_on_thread(busy_stage, "s1", False)
+    run_on_thread(busy_stage, "s2", False)
+    assert os.listdir(session) == []
+
+    profiling.study_left("s3") # Not in the capture: the session only had room for two studies
+    profiling.study_left("s1")
+    profiling.study_left("s2")
+
+    summaries = [name for name in os.listdir(session) if name.endswith(".txt")]
+    assert len(summaries) == 1
+    summary = (session / summaries[0]).read_text(encoding="utf-8")
+    assert summary.startswith("2 studies profiled")
+    assert "s3" not in summary
+    assert "builtins.sum" in summary
+
+
+def test_stages_are_not_profiled_outside_a_session(session):
+    busy_stage("s1", True)
+    profiling.study_left("s1")
+    assert os.listdir(session) == []
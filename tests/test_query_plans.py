@@ -0,0 +1,95 @@
+"""
+Index bootstrap and hot-query plans (database_operations.ensure_indexes / check_query_plans).
+
+The plan-shape tests run anywhere. The explain tests need a MongoDB server: set
+TEST_MONGODB_URI (default mongodb://localhost:27017/); they are skipped when none answers.
+"""
+import os
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("pymongo")
+
+from modules import database_operations as db_ops
+
+CLASSIC_PLAN = {"stage": "LIMIT", "inputStage": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "last_updated_id"}}}
+
+
+def test_plan_stages_of_a_classic_plan():
+    assert db_ops._plan_stages(CLASSIC_PLAN) == ["LIMIT", "FETCH", "IXSCAN"]
+
+
+def test_plan_stages_of_a_slot_based_engine_plan():
+    plan = {"queryPlan": CLASSIC_PLAN, "slotBasedPlan": {"slots": "...", "stages": "..."}}
+    assert db_ops._plan_stages(plan) == ["LIMIT", "FETCH", "IXSCAN"]
+    assert db_ops.plan_uses_index(db_ops._plan_stages(plan))
+
+
+def test_plan_stages_of_a_sharded_plan():
+    plan = {"stage": "SHARD_MERGE", "shards": [
+        {"shardName": "rs0", "winningPlan": {"queryPlan": CLASSIC_PLAN}},
+        {"shardName": "rs1", "winningPlan": {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}}},
+    ]}
+    stages = db_ops._plan_stages(plan)
+    assert stages == ["SHARD_MERGE", "LIMIT", "FETCH", "IXSCAN", "SORT", "COLLSCAN"]
+    assert not db_ops.plan_uses_index(stages) # One shard scanning the collection fails the whole query
+
+
+def test_express_index_scan_counts_as_index_use():
+    assert db_ops.plan_uses_index(["EXPRESS_IXSCAN"])
+    assert not db_ops.plan_uses_index(["FETCH", "COLLSCAN"])
+    assert not db_ops.plan_uses_index(["SORT", "FETCH", "IXSCAN"])
+
+
+@pytest.fixture(scope="module")
+def mongo_config():
+    from pymongo import MongoClient
+    from pymongo.errors import PyMongoError
+
+    uri = os.environ.get("TEST_MONGODB_URI", "mongodb://localhost:27017/")
+    client = MongoClient(uri, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command("ismaster")
+    except PyMongoError as e:
+        pytest.skip(f"No MongoDB server at {uri}: {e}")
+    name = f"transcriber_test_{uuid.uuid4().hex[:8]}"
+    database = client[name]
+    saved = db_ops.client, db_ops.db
+    db_ops.client, db_ops.db = client, database
+    yield {"MONGODB_URI": uri, "MONGODB_DATABASE": name}
+    db_ops.client, db_ops.db = saved
+    client.drop_database(name)
+    client.close()
+
+
+@pytest.fixture(scope="module")
+def seeded(mongo_config):
+    database = db_ops.db
+    assert db_ops.ensure_indexes(mongo_config)
+    start = datetime(2024, 1, 1)
+    database.studies.insert_many([
+        {"study_key": str(number), "status": ("error", "processing_complete", "transcribing")[number % 3],
+         "last_updated_timestamp": start + timedelta(minutes=number), "received_timestamp": start}
+        for number in range(500)
+    ])
+    database.transcriptions.insert_many([
+        {"study_key": str(number % 250), "attempt": number // 250 + 1, "reading": "r", "conclusion": "c",
+         "transcription_timestamp": start + timedelta(minutes=number)}
+        for number in range(500)
+    ])
+    return mongo_config
+
+
+def test_ensure_indexes_is_idempotent(seeded):
+    assert db_ops.ensure_indexes(seeded)
+    names = set(db_ops.db.studies.index_information())
+    assert {"study_key_unique", "last_updated_id", "status_last_updated_id"} <= names
+
+
+def test_hot_queries_are_answered_from_an_index(seeded):
+    results = db_ops.check_query_plans(seeded)
+    assert results
+    failures = {name: stages for name, passed, stages in results if not passed}
+    assert not failures, f"Queries not covered by an index: {failures}"
@@ -0,0 +1,79 @@
+"""Storage backends: path helpers, the STORAGE_LOCAL_ROOT mapping of UNC paths, and backend selection."""
+import os
+
+import pytest
+
+from modules import smb_connect
+
+UNC_PATH = r"\\pacs01\Longterm\2024\x.dcm"
+
+non_windows = pytest.mark.skipif(os.name == "nt", reason="'auto' always picks win32 on Windows")
+
+
+@pytest.fixture
+def share_copy(tmp_path):
+    """A local copy of \\\\pacs01\\Longterm laid out as <root>/pacs01/Longterm/..."""
+    path = tmp_path / "pacs01" / "Longterm" / "2024" / "x.dcm"
+    path.parent.mkdir(parents=True)
+    path.write_bytes(b"dicom bytes")
+    return tmp_path
+
+
+@pytest.fixture
+def shared_backend():
+    smb_connect.close_backend()
+    yield
+    smb_connect.close_backend()
+
+
+def test_path_helpers():
+    assert smb_connect.is_unc_path(UNC_PATH)
+    assert not smb_connect.is_unc_path("/data/x.dcm")
+    assert not smb_connect.is_unc_path(None)
+    assert smb_connect.basename(UNC_PATH) == "x.dcm"
+    assert smb_connect.basename("/data/y.dcm") == "y.dcm"
+    assert smb_connect.share_root(UNC_PATH) == r"\\pacs01\Longterm"
+    assert smb_connect.share_root(r"\\pacs01") is None
+
+
+def test_local_root_maps_unc_paths(share_copy):
+    backend = smb_connect.LocalBackend(str(share_copy))
+    expected = str(share_copy / "pacs01" / "Longterm" / "2024" / "x.dcm")
+
+    assert backend.local_path(UNC_PATH) == expected
+    assert backend.readable(UNC_PATH) == expected
+    assert backend.exists(UNC_PATH)
+    assert backend.getsize(UNC_PATH) == len(b"dicom bytes")
+    with backend.open(UNC_PATH) as file:
+        assert file.read() == b"dicom bytes"
+    assert not backend.exists(r"\\pacs01\Longterm\2024\missing.dcm")
+    assert backend.connect(UNC_PATH, "user", "password")
+
+
+def test_local_paths_are_read_as_they_are(share_copy):
+    backend = smb_connect.LocalBackend(str(share_copy))
+    path = str(share_copy / "pacs01" / "Longterm" / "2024" / "x.dcm")
+    assert backend.local_path(path) == path
+    assert smb_connect.LocalBackend().local_path(UNC_PATH) == UNC_PATH
+
+
+def test_configured_local_backend_uses_the_local_root(share_copy, shared_backend):
+    backend = smb_connect.get_backend({"STORAGE_BACKEND": "local", "STORAGE_LOCAL_ROOT": str(share_copy)})
+    assert isinstance(backend, smb_connect.LocalBackend)
+    assert backend.exists(UNC_PATH)
+    assert smb_connect.get_backend({"STORAGE_BACKEND": "smb"}) is backend # Shared: created once
+
+
+@non_windows
+def test_auto_picks_smb_when_share_credentials_are_set():
+    assert smb_connect._auto_backend({}) == "local"
+    assert smb_connect._auto_backend({"SHARE_USERNAME": "svc", "SHARE_PASSWORD": "secret"}) == "smb"
+    # A local copy of the share takes precedence over the credentials
+    assert smb_connect._auto_backend({"SHARE_USERNAME": "svc", "STORAGE_LOCAL_ROOT": "/copy"}) == "local"
+
+
+@non_windows
+def test_auto_with_credentials_creates_the_smb_backend(shared_backend):
+    pytest.importorskip("smbclient")
+    backend = smb_connect.get_backend({"STORAGE_BACKEND": "auto", "SHARE_USERNAME": "svc"})
+    assert isinstance(backend, smb_connect.SMBBackend)